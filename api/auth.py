@@ -1,16 +1,12 @@
 """API key authentication middleware."""
 
-import hashlib
 from typing import Optional
 
 from fastapi import Header, HTTPException, Depends
 
 from db import queries
 from db.models import ApiKey, Workspace
-
-
-def _hash_key(key: str) -> str:
-    return hashlib.sha256(key.encode()).hexdigest()
+from services.api_key_service import API_KEY_PREFIX, verify_api_key
 
 
 async def get_api_key(authorization: str = Header(None)) -> ApiKey:
@@ -24,26 +20,14 @@ async def get_api_key(authorization: str = Header(None)) -> ApiKey:
         raise HTTPException(status_code=401, detail="Invalid Authorization format. Use: Bearer <api_key>")
 
     raw_key = parts[1]
-    if not raw_key.startswith("ip_"):
+    if not raw_key.startswith(API_KEY_PREFIX):
         raise HTTPException(status_code=401, detail="Invalid API key format")
 
-    prefix = raw_key[:11]  # "ip_" + first 8 chars
-    api_key = queries.get_api_key_by_prefix(prefix)
-
+    # Prefix lookup, hash check and last-used stamp; revoked keys never match
+    api_key = verify_api_key(raw_key)
     if not api_key:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
-    if api_key.revoked_at:
-        raise HTTPException(status_code=401, detail="API key has been revoked")
-
-    # Verify full key hash
-    key_hash = _hash_key(raw_key)
-    if key_hash != api_key.key_hash:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-
-    # Update last used
-    queries.update_api_key_last_used(api_key.id)
-
     return api_key
 
 
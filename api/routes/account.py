@@ -16,14 +16,13 @@ async def get_workspace_info(
     api_key: ApiKey = Depends(get_api_key),
     ws: Workspace = Depends(get_workspace_from_key),
 ):
-    balance = credit_service.get_balance(ws.id)
-    member_count = queries.count_workspace_members(ws.id)
+    overview = queries.get_workspace_overview(ws.id)
     return WorkspaceInfoResponse(
         id=ws.id,
         name=ws.name,
         tier=ws.tier,
-        credit_balance=balance,
-        member_count=member_count,
+        credit_balance=overview["credits"],
+        member_count=overview["members"],
     )
 
 
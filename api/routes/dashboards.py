@@ -33,13 +33,12 @@ async def create_dashboard(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    did = queries.create_dashboard(
+    dashboard = queries.create_dashboard_returning(
         project_id=project_id,
         created_by=api_key.created_by,
         name=body.name,
         description=body.description,
     )
-    dashboard = queries.get_dashboard_by_id(did)
     return DashboardResponse(
         id=dashboard.id, project_id=dashboard.project_id, name=dashboard.name,
         description=dashboard.description, created_at=dashboard.created_at,
@@ -51,15 +50,11 @@ async def get_dashboard(dashboard_id: str, ws: Workspace = Depends(get_workspace
     dashboard = queries.get_dashboard_by_id(dashboard_id)
     if not dashboard:
         raise HTTPException(status_code=404, detail="Dashboard not found")
-    charts = queries.get_charts_for_dashboard(dashboard_id)
+    charts = queries.get_chart_summaries_for_dashboard(dashboard_id)
     return DashboardDetailResponse(
         id=dashboard.id, project_id=dashboard.project_id, name=dashboard.name,
         description=dashboard.description, created_at=dashboard.created_at,
-        charts=[ChartResponse(
-            id=c.id, title=c.title, chart_type=c.chart_type,
-            user_prompt=c.user_prompt, position_index=c.position_index,
-            created_at=c.created_at,
-        ) for c in charts],
+        charts=[ChartResponse(**c) for c in charts],
     )
 
 
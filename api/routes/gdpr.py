@@ -1,6 +1,8 @@
 """
 GDPR/CCPA endpoints for user data export and deletion.
 """
+import dataclasses
+
 from fastapi import APIRouter, Depends, HTTPException
 from api.auth import get_api_key
 from db import queries
@@ -16,8 +18,8 @@ def export_user_data(api_key = Depends(get_api_key)):
     projects = queries.get_projects_for_workspace(user_id)
     # Add more as needed
     return {
-        "user": user.__dict__ if user else {},
-        "projects": [p.__dict__ for p in projects],
+        "user": dataclasses.asdict(user) if user else {},
+        "projects": [dataclasses.asdict(p) for p in projects],
     }
 
 @router.delete("/gdpr/delete")
@@ -33,14 +33,13 @@ async def create_project(
     api_key: ApiKey = Depends(require_permission("write")),
     ws: Workspace = Depends(get_workspace_from_key),
 ):
-    pid = queries.create_project(
+    project = queries.create_project_returning(
         workspace_id=ws.id,
         created_by=api_key.created_by,
         name=body.name,
         description=body.description,
         instructions=body.instructions,
     )
-    project = queries.get_project_by_id(pid, ws.id)
     return _project_response(project)
 
 
@@ -113,14 +112,13 @@ async def create_template(
     project = queries.get_project_by_id(project_id, ws.id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    tid = queries.create_prompt_template(
+    t = queries.create_prompt_template_returning(
         project_id=project_id,
         created_by=api_key.created_by,
         name=body.name,
         prompt_text=body.prompt_text,
         category=body.category,
     )
-    t = queries.get_prompt_template_by_id(tid)
     return PromptTemplateResponse(
         id=t.id, project_id=t.project_id, name=t.name,
         prompt_text=t.prompt_text, category=t.category,
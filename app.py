@@ -8,6 +8,7 @@ import streamlit as st
 from config.settings import APP_TITLE, STORAGE_DIR, UPLOADS_DIR, LOGOS_DIR, EXPORTS_DIR
 from db.database import init_db
 from auth.session import get_current_user, logout, get_current_workspace
+from db import queries
 
 
 def _ensure_directories() -> None:
@@ -48,7 +49,8 @@ def _check_trial_expiry() -> None:
 
 
 def _maybe_process_scheduled_reports() -> None:
-    """Process due schedules at most once every 10 minutes per session."""
+    """Process due schedules and refresh the daily analytics rollups at most
+    once every 10 minutes per session."""
     if "_last_scheduled_report_tick" not in st.session_state:
         st.session_state["_last_scheduled_report_tick"] = 0.0
     now = time.time()
@@ -60,6 +62,11 @@ def _maybe_process_scheduled_reports() -> None:
         run_due_reports(limit=5)
     except Exception:
         pass
+    try:
+        from db.database import refresh_daily_rollups
+        refresh_daily_rollups()
+    except Exception:
+        pass
 
 
 def main():
@@ -133,7 +140,7 @@ def main():
         }
 
         # Admin pages — only visible to superadmins
-        if getattr(user, "is_superadmin", False):
+        if queries.is_superadmin(user.id):
             nav_groups["Admin"] = [
                 st.Page("pages/admin/dashboard.py", title="Overview", icon=":material/admin_panel_settings:"),
                 st.Page("pages/admin/users.py", title="Users", icon=":material/people:"),
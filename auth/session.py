@@ -10,20 +10,50 @@ in both:
 """
 
 import secrets
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 import streamlit as st
 
-from config.settings import SESSION_EXPIRY_DAYS, ROLE_PERMISSIONS
+from config.settings import SESSION_EXPIRY_DAYS, has_perm
 from db import queries
 from db.models import User, Workspace
 
+# Negative cache of tokens that failed validation (unknown, expired or
+# revoked). Tokens are random and never reissued, so a miss stays a miss;
+# the TTL only bounds memory. Stale cookies and bot traffic then skip the
+# user_sessions lookup on every rerun.
+_INVALID_TOKEN_TTL = 600
+_INVALID_TOKEN_MAX = 10_000
+_invalid_tokens: dict[str, float] = {}
+_invalid_lock = threading.Lock()
+
 
 def _generate_session_token() -> str:
     return secrets.token_urlsafe(48)
 
 
+def _lookup_session_user(token: str) -> Optional[str]:
+    """Validate a session token and return its user_id, short-circuiting
+    tokens already known bad."""
+    now = time.monotonic()
+    expires = _invalid_tokens.get(token)
+    if expires is not None and expires > now:
+        return None
+    user_id = queries.get_session_user_id(token)
+    if user_id is None:
+        with _invalid_lock:
+            if len(_invalid_tokens) >= _INVALID_TOKEN_MAX:
+                for t in [t for t, exp in _invalid_tokens.items() if exp <= now]:
+                    del _invalid_tokens[t]
+                if len(_invalid_tokens) >= _INVALID_TOKEN_MAX:
+                    _invalid_tokens.clear()
+            _invalid_tokens[token] = now + _INVALID_TOKEN_TTL
+    return user_id
+
+
 def create_user_session(user: User) -> str:
     """Create a new session for the authenticated user. Returns the session token."""
     token = _generate_session_token()
@@ -78,10 +108,10 @@ def get_current_user() -> Optional[User]:
     # 2. Have a session token in memory
     token = st.session_state.get("session_token")
     if token:
-        session = queries.get_session_by_token(token)
-        if session:
-            st.session_state["user_id"] = session.user_id
-            return queries.get_user_by_id(session.user_id)
+        session_user_id = _lookup_session_user(token)
+        if session_user_id:
+            st.session_state["user_id"] = session_user_id
+            return queries.get_user_by_id(session_user_id)
         # token was invalid/expired — clear
         st.session_state.pop("session_token", None)
 
@@ -89,11 +119,11 @@ def get_current_user() -> Optional[User]:
     from auth.cookies import restore_session_from_cookie
     token = restore_session_from_cookie()
     if token:
-        session = queries.get_session_by_token(token)
-        if session:
+        session_user_id = _lookup_session_user(token)
+        if session_user_id:
             st.session_state["session_token"] = token
-            st.session_state["user_id"] = session.user_id
-            return queries.get_user_by_id(session.user_id)
+            st.session_state["user_id"] = session_user_id
+            return queries.get_user_by_id(session_user_id)
 
     return None
 
@@ -112,6 +142,8 @@ def logout() -> None:
     token = st.session_state.get("session_token")
     if token:
         queries.delete_session_by_token(token)
+        with _invalid_lock:
+            _invalid_tokens[token] = time.monotonic() + _INVALID_TOKEN_TTL
 
     for key in ["session_token", "user_id", "current_workspace_id", "current_project_id"]:
         st.session_state.pop(key, None)
@@ -161,7 +193,7 @@ def user_has_permission(user_id: str, workspace_id: str, permission: str) -> boo
     role = get_user_role_in_workspace(user_id, workspace_id)
     if not role:
         return False
-    return permission in ROLE_PERMISSIONS.get(role, set())
+    return has_perm(role, permission)
 
 
 def require_permission(permission: str) -> tuple[User, Workspace]:
@@ -180,7 +212,7 @@ def require_permission(permission: str) -> tuple[User, Workspace]:
 def require_superadmin() -> User:
     """Require superadmin access. Stops the page if not a superadmin."""
     user = require_auth()
-    if not getattr(user, "is_superadmin", False):
+    if not queries.is_superadmin(user.id):
         st.error("Access denied. This section is restricted to system administrators.")
         st.stop()
     return user
@@ -164,6 +164,16 @@ ROLE_PERMISSIONS = {
     },
 }
 
+# Flattened (role, permission) pairs so a check is a single set lookup.
+_ROLE_PERM_LOOKUP = frozenset(
+    (role, perm) for role, perms in ROLE_PERMISSIONS.items() for perm in perms
+)
+
+
+def has_perm(role: str, permission: str) -> bool:
+    """Return True if the role grants the permission."""
+    return (role, permission) in _ROLE_PERM_LOOKUP
+
 # ---------------------------------------------------------------------------
 # Credit pricing
 # ---------------------------------------------------------------------------
@@ -234,3 +244,10 @@ CHART_PALETTES = {
     "earth": ["#606c38", "#283618", "#fefae0", "#dda15e", "#bc6c25", "#3a5a40"],
     "mono": ["#212529", "#495057", "#6c757d", "#adb5bd", "#dee2e6", "#f8f9fa"],
 }
+
+# Palettes as (R, G, B) 0-255 tuples, parsed once at import for code that
+# needs numeric colors (e.g. translucent rgba() fills).
+CHART_PALETTES_RGB = {
+    name: tuple((int(c[1:3], 16), int(c[3:5], 16), int(c[5:7], 16)) for c in colors)
+    for name, colors in CHART_PALETTES.items()
+}
@@ -1,17 +1,28 @@
 from db.database import get_db
-from auth.authenticator import hash_password
-import uuid
+from auth.authenticator import hash_password, hash_password_batch
+import secrets
+
+INSERT_USER_SQL = "INSERT INTO users (id, email, password_hash, display_name) VALUES (?, ?, ?, ?)"
 
 def create_user(email, password, display_name):
-    user_id = uuid.uuid4().hex
+    user_id = secrets.token_hex(16)
     pw_hash = hash_password(password)
     with get_db() as conn:
-        conn.execute(
-            "INSERT INTO users (id, email, password_hash, display_name) VALUES (?, ?, ?, ?)",
-            (user_id, email, pw_hash, display_name),
-        )
-        conn.commit()
+        conn.execute(INSERT_USER_SQL, (user_id, email, pw_hash, display_name))
     print(f"User created: {email} (id: {user_id})")
 
+def create_users(users):
+    """Bulk-provision (email, password, display_name) triples in one transaction."""
+    users = list(users)
+    hashes = hash_password_batch([password for _, password, _ in users])
+    rows = [
+        (secrets.token_hex(16), email, pw_hash, display_name)
+        for (email, _, display_name), pw_hash in zip(users, hashes)
+    ]
+    with get_db() as conn:
+        conn.executemany(INSERT_USER_SQL, rows)
+    print(f"Users created: {len(rows)}")
+    return [row[0] for row in rows]
+
 if __name__ == "__main__":
     create_user("rsaffold@lebertech.com", "Flowdoe00@@", "R Saffold")
@@ -1,15 +1,28 @@
 """SQLite database connection manager and schema initialization."""
 
+import atexit
+import logging
+import queue
 import sqlite3
-from contextlib import contextmanager
+import threading
+import time
+from datetime import date, timedelta
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, Iterator, Optional
 
 from config.settings import DB_PATH
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
 # Schema DDL — executed once on first run via init_db()
 # ---------------------------------------------------------------------------
 
+# Bump whenever _SCHEMA or the init_db() migrations change so existing
+# databases re-run them once.
+SCHEMA_VERSION = 15
+
 _SCHEMA = """
 -- =========================================================================
 -- Core User & Auth
@@ -30,6 +43,8 @@ CREATE TABLE IF NOT EXISTS users (
     created_at      TEXT NOT NULL DEFAULT (datetime('now')),
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
+-- (created_at, id) indexes serve the admin lists' keyset pagination
+CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at, id);
 
 CREATE TABLE IF NOT EXISTS email_verification_codes (
     id              TEXT PRIMARY KEY,
@@ -40,7 +55,7 @@ CREATE TABLE IF NOT EXISTS email_verification_codes (
     used_at         TEXT DEFAULT NULL,
     created_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_evc_user_id ON email_verification_codes(user_id);
+CREATE INDEX IF NOT EXISTS idx_evc_user_purpose ON email_verification_codes(user_id, purpose, created_at);
 
 CREATE TABLE IF NOT EXISTS user_sessions (
     id              TEXT PRIMARY KEY,
@@ -52,7 +67,6 @@ CREATE TABLE IF NOT EXISTS user_sessions (
     expires_at      TEXT NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON user_sessions(user_id);
-CREATE INDEX IF NOT EXISTS idx_sessions_token ON user_sessions(session_token);
 
 CREATE TABLE IF NOT EXISTS backup_codes (
     id              TEXT PRIMARY KEY,
@@ -80,6 +94,7 @@ CREATE TABLE IF NOT EXISTS workspaces (
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
 CREATE INDEX IF NOT EXISTS idx_workspaces_owner ON workspaces(owner_id);
+CREATE INDEX IF NOT EXISTS idx_workspaces_created ON workspaces(created_at, id);
 
 CREATE TABLE IF NOT EXISTS workspace_members (
     id              TEXT PRIMARY KEY,
@@ -90,7 +105,6 @@ CREATE TABLE IF NOT EXISTS workspace_members (
     joined_at       TEXT NOT NULL DEFAULT (datetime('now')),
     UNIQUE(workspace_id, user_id)
 );
-CREATE INDEX IF NOT EXISTS idx_wm_workspace ON workspace_members(workspace_id);
 CREATE INDEX IF NOT EXISTS idx_wm_user ON workspace_members(user_id);
 
 CREATE TABLE IF NOT EXISTS workspace_invitations (
@@ -104,7 +118,7 @@ CREATE TABLE IF NOT EXISTS workspace_invitations (
     created_at      TEXT NOT NULL DEFAULT (datetime('now')),
     expires_at      TEXT NOT NULL
 );
-CREATE INDEX IF NOT EXISTS idx_wi_workspace ON workspace_invitations(workspace_id);
+CREATE INDEX IF NOT EXISTS idx_wi_workspace_status ON workspace_invitations(workspace_id, status, created_at);
 CREATE INDEX IF NOT EXISTS idx_wi_token ON workspace_invitations(token);
 CREATE INDEX IF NOT EXISTS idx_wi_email ON workspace_invitations(email);
 
@@ -119,10 +133,18 @@ CREATE TABLE IF NOT EXISTS projects (
     name            TEXT NOT NULL,
     description     TEXT NOT NULL DEFAULT '',
     instructions    TEXT NOT NULL DEFAULT '',
+    -- Activity counters, kept current by the trg_*_project triggers below
+    files_total     INTEGER NOT NULL DEFAULT 0,
+    files_success   INTEGER NOT NULL DEFAULT 0,
+    files_error     INTEGER NOT NULL DEFAULT 0,
+    files_pending   INTEGER NOT NULL DEFAULT 0,
+    dashboards_count INTEGER NOT NULL DEFAULT 0,
+    analyses_count  INTEGER NOT NULL DEFAULT 0,
+    last_activity   TEXT DEFAULT NULL,
     created_at      TEXT NOT NULL DEFAULT (datetime('now')),
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_projects_workspace ON projects(workspace_id);
+CREATE INDEX IF NOT EXISTS idx_projects_workspace_created ON projects(workspace_id, created_at);
 
 CREATE TABLE IF NOT EXISTS uploaded_files (
     id              TEXT PRIMARY KEY,
@@ -139,7 +161,15 @@ CREATE TABLE IF NOT EXISTS uploaded_files (
     data_profile    TEXT DEFAULT NULL,
     uploaded_at     TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_files_project ON uploaded_files(project_id);
+CREATE INDEX IF NOT EXISTS idx_files_project_uploaded ON uploaded_files(project_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_files_uploader_uploaded ON uploaded_files(uploaded_by, uploaded_at);
+
+-- Data profiles are large JSON blobs; keeping them out of uploaded_files
+-- means file listings never walk their overflow pages.
+CREATE TABLE IF NOT EXISTS file_profiles (
+    file_id         TEXT PRIMARY KEY REFERENCES uploaded_files(id) ON DELETE CASCADE,
+    data_profile    TEXT NOT NULL
+);
 
 CREATE TABLE IF NOT EXISTS dashboards (
     id              TEXT PRIMARY KEY,
@@ -152,7 +182,7 @@ CREATE TABLE IF NOT EXISTS dashboards (
     created_at      TEXT NOT NULL DEFAULT (datetime('now')),
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_dashboards_project ON dashboards(project_id);
+CREATE INDEX IF NOT EXISTS idx_dashboards_project_created ON dashboards(project_id, created_at);
 
 CREATE TABLE IF NOT EXISTS charts (
     id              TEXT PRIMARY KEY,
@@ -169,7 +199,8 @@ CREATE TABLE IF NOT EXISTS charts (
     created_at      TEXT NOT NULL DEFAULT (datetime('now')),
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_charts_dashboard ON charts(dashboard_id);
+CREATE INDEX IF NOT EXISTS idx_charts_dashboard_pos ON charts(dashboard_id, position_index);
+CREATE INDEX IF NOT EXISTS idx_charts_file ON charts(file_id);
 
 -- =========================================================================
 -- Billing & Credits
@@ -185,8 +216,17 @@ CREATE TABLE IF NOT EXISTS credit_ledger (
     reference_id    TEXT DEFAULT NULL,
     created_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_cl_workspace ON credit_ledger(workspace_id);
 CREATE INDEX IF NOT EXISTS idx_cl_user ON credit_ledger(user_id);
+CREATE INDEX IF NOT EXISTS idx_cl_created ON credit_ledger(created_at, id);
+-- Covers the usage analytics range scans without touching the table
+CREATE INDEX IF NOT EXISTS idx_cl_workspace_created ON credit_ledger(workspace_id, created_at, change_amount, user_id);
+
+-- Current balance per workspace, kept in step with the newest ledger row
+-- by add_credit_entry() so balance reads are a primary-key lookup.
+CREATE TABLE IF NOT EXISTS workspace_balances (
+    workspace_id    TEXT PRIMARY KEY REFERENCES workspaces(id) ON DELETE CASCADE,
+    balance         INTEGER NOT NULL
+);
 
 CREATE TABLE IF NOT EXISTS subscriptions (
     id              TEXT PRIMARY KEY,
@@ -201,6 +241,9 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
 CREATE INDEX IF NOT EXISTS idx_subs_workspace ON subscriptions(workspace_id);
+-- Only active rows are ever looked up by workspace; the partial index
+-- stays small as cancelled subscriptions pile up.
+CREATE INDEX IF NOT EXISTS idx_subs_active ON subscriptions(workspace_id, created_at) WHERE status = 'active';
 
 CREATE TABLE IF NOT EXISTS credit_purchases (
     id              TEXT PRIMARY KEY,
@@ -223,6 +266,7 @@ CREATE TABLE IF NOT EXISTS add_ons (
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
 CREATE INDEX IF NOT EXISTS idx_addons_workspace ON add_ons(workspace_id);
+CREATE INDEX IF NOT EXISTS idx_addons_active ON add_ons(workspace_id, add_on_type) WHERE status = 'active';
 
 -- =========================================================================
 -- Branding
@@ -289,7 +333,7 @@ CREATE TABLE IF NOT EXISTS api_keys (
     revoked_at      TEXT DEFAULT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_ak_workspace ON api_keys(workspace_id);
-CREATE INDEX IF NOT EXISTS idx_ak_prefix ON api_keys(key_prefix);
+CREATE INDEX IF NOT EXISTS idx_ak_prefix_active ON api_keys(key_prefix, revoked_at, workspace_id);
 
 -- =========================================================================
 -- Prompt Tracking
@@ -309,7 +353,10 @@ CREATE TABLE IF NOT EXISTS prompt_history (
     created_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
 CREATE INDEX IF NOT EXISTS idx_ph_user ON prompt_history(user_id);
-CREATE INDEX IF NOT EXISTS idx_ph_workspace ON prompt_history(workspace_id);
+CREATE INDEX IF NOT EXISTS idx_ph_workspace_created ON prompt_history(workspace_id, created_at, project_id, user_id, tokens_used);
+CREATE INDEX IF NOT EXISTS idx_ph_project_created_id ON prompt_history(project_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_ph_file ON prompt_history(file_id);
+CREATE INDEX IF NOT EXISTS idx_ph_created ON prompt_history(created_at, id);
 
 -- =========================================================================
 -- Prompt Templates
@@ -343,7 +390,7 @@ CREATE TABLE IF NOT EXISTS audit_log (
     ip_address      TEXT,
     created_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
-CREATE INDEX IF NOT EXISTS idx_audit_created ON audit_log(created_at);
+CREATE INDEX IF NOT EXISTS idx_audit_created_id ON audit_log(created_at, id);
 CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log(user_id);
 CREATE INDEX IF NOT EXISTS idx_audit_entity ON audit_log(entity_type, entity_id);
 
@@ -373,6 +420,183 @@ CREATE TABLE IF NOT EXISTS user_preferences (
     updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
 );
 CREATE INDEX IF NOT EXISTS idx_up_user ON user_preferences(user_id);
+
+-- =========================================================================
+-- Global Counters (admin totals maintained by triggers)
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS global_counters (
+    name            TEXT PRIMARY KEY,
+    value           INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS trg_users_insert_counter AFTER INSERT ON users
+BEGIN UPDATE global_counters SET value = value + 1 WHERE name = 'users'; END;
+CREATE TRIGGER IF NOT EXISTS trg_users_delete_counter AFTER DELETE ON users
+BEGIN UPDATE global_counters SET value = value - 1 WHERE name = 'users'; END;
+CREATE TRIGGER IF NOT EXISTS trg_workspaces_insert_counter AFTER INSERT ON workspaces
+BEGIN UPDATE global_counters SET value = value + 1 WHERE name = 'workspaces'; END;
+CREATE TRIGGER IF NOT EXISTS trg_workspaces_delete_counter AFTER DELETE ON workspaces
+BEGIN UPDATE global_counters SET value = value - 1 WHERE name = 'workspaces'; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_insert_counter AFTER INSERT ON prompt_history
+BEGIN UPDATE global_counters SET value = value + 1 WHERE name = 'api_calls'; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_delete_counter AFTER DELETE ON prompt_history
+BEGIN UPDATE global_counters SET value = value - 1 WHERE name = 'api_calls'; END;
+CREATE TRIGGER IF NOT EXISTS trg_credit_ledger_insert_counter AFTER INSERT ON credit_ledger WHEN NEW.change_amount < 0
+BEGIN UPDATE global_counters SET value = value - NEW.change_amount WHERE name = 'credits_consumed'; END;
+CREATE TRIGGER IF NOT EXISTS trg_credit_ledger_delete_counter AFTER DELETE ON credit_ledger WHEN OLD.change_amount < 0
+BEGIN UPDATE global_counters SET value = value + OLD.change_amount WHERE name = 'credits_consumed'; END;
+CREATE TRIGGER IF NOT EXISTS trg_credit_purchases_insert_counter AFTER INSERT ON credit_purchases
+BEGIN UPDATE global_counters SET value = value + NEW.amount_paid_cents WHERE name = 'revenue_cents'; END;
+CREATE TRIGGER IF NOT EXISTS trg_credit_purchases_delete_counter AFTER DELETE ON credit_purchases
+BEGIN UPDATE global_counters SET value = value - OLD.amount_paid_cents WHERE name = 'revenue_cents'; END;
+
+-- =========================================================================
+-- Project Activity Counters (deltas only; rebuild_counters() recomputes them.
+-- last_activity moves forward on insert; deleting the newest child or moving
+-- its timestamp back recomputes it from the remaining children.)
+-- =========================================================================
+
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_insert_project AFTER INSERT ON uploaded_files
+BEGIN UPDATE projects SET
+    files_total = files_total + 1,
+    files_success = files_success + (NEW.status = 'success'),
+    files_error = files_error + (NEW.status = 'error'),
+    files_pending = files_pending + (NEW.status = 'pending'),
+    last_activity = max(COALESCE(last_activity, NEW.uploaded_at), NEW.uploaded_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_delete_project AFTER DELETE ON uploaded_files
+BEGIN UPDATE projects SET
+    files_total = files_total - 1,
+    files_success = files_success - (OLD.status = 'success'),
+    files_error = files_error - (OLD.status = 'error'),
+    files_pending = files_pending - (OLD.status = 'pending')
+WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_status_project AFTER UPDATE OF status ON uploaded_files
+WHEN OLD.status IS NOT NEW.status
+BEGIN UPDATE projects SET
+    files_success = files_success + (NEW.status = 'success') - (OLD.status = 'success'),
+    files_error = files_error + (NEW.status = 'error') - (OLD.status = 'error'),
+    files_pending = files_pending + (NEW.status = 'pending') - (OLD.status = 'pending')
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_time_project AFTER UPDATE OF uploaded_at ON uploaded_files
+BEGIN UPDATE projects SET last_activity = max(COALESCE(last_activity, NEW.uploaded_at), NEW.uploaded_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_dashboards_insert_project AFTER INSERT ON dashboards
+BEGIN UPDATE projects SET dashboards_count = dashboards_count + 1,
+    last_activity = max(COALESCE(last_activity, NEW.created_at), NEW.created_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_dashboards_delete_project AFTER DELETE ON dashboards
+BEGIN UPDATE projects SET dashboards_count = dashboards_count - 1 WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_dashboards_time_project AFTER UPDATE OF created_at ON dashboards
+BEGIN UPDATE projects SET last_activity = max(COALESCE(last_activity, NEW.created_at), NEW.created_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_insert_project AFTER INSERT ON prompt_history
+BEGIN UPDATE projects SET analyses_count = analyses_count + 1,
+    last_activity = max(COALESCE(last_activity, NEW.created_at), NEW.created_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_delete_project AFTER DELETE ON prompt_history
+BEGIN UPDATE projects SET analyses_count = analyses_count - 1 WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_time_project AFTER UPDATE OF created_at ON prompt_history
+BEGIN UPDATE projects SET last_activity = max(COALESCE(last_activity, NEW.created_at), NEW.created_at)
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_delete_activity AFTER DELETE ON uploaded_files
+WHEN OLD.uploaded_at >= (SELECT last_activity FROM projects WHERE id = OLD.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = OLD.project_id))
+WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_rewind_activity AFTER UPDATE OF uploaded_at ON uploaded_files
+WHEN NEW.uploaded_at < OLD.uploaded_at
+ AND OLD.uploaded_at >= (SELECT last_activity FROM projects WHERE id = NEW.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = NEW.project_id))
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_dashboards_delete_activity AFTER DELETE ON dashboards
+WHEN OLD.created_at >= (SELECT last_activity FROM projects WHERE id = OLD.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = OLD.project_id))
+WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_dashboards_rewind_activity AFTER UPDATE OF created_at ON dashboards
+WHEN NEW.created_at < OLD.created_at
+ AND OLD.created_at >= (SELECT last_activity FROM projects WHERE id = NEW.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = NEW.project_id))
+WHERE id = NEW.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_delete_activity AFTER DELETE ON prompt_history
+WHEN OLD.created_at >= (SELECT last_activity FROM projects WHERE id = OLD.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = OLD.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = OLD.project_id))
+WHERE id = OLD.project_id; END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_rewind_activity AFTER UPDATE OF created_at ON prompt_history
+WHEN NEW.created_at < OLD.created_at
+ AND OLD.created_at >= (SELECT last_activity FROM projects WHERE id = NEW.project_id)
+BEGIN UPDATE projects SET last_activity = (SELECT MAX(ts) FROM (
+    SELECT MAX(uploaded_at) AS ts FROM uploaded_files WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM dashboards WHERE project_id = NEW.project_id
+    UNION ALL SELECT MAX(created_at) FROM prompt_history WHERE project_id = NEW.project_id))
+WHERE id = NEW.project_id; END;
+
+-- =========================================================================
+-- Daily Rollups (complete days, filled in by refresh_daily_rollups())
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS daily_file_formats (
+    workspace_id    TEXT NOT NULL REFERENCES workspaces(id) ON DELETE CASCADE,
+    day             TEXT NOT NULL,
+    project_id      TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    file_format     TEXT NOT NULL,
+    count           INTEGER NOT NULL,
+    PRIMARY KEY (workspace_id, day, project_id, file_format)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_project_tokens (
+    workspace_id    TEXT NOT NULL REFERENCES workspaces(id) ON DELETE CASCADE,
+    day             TEXT NOT NULL,
+    project_id      TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    user_id         TEXT NOT NULL,
+    tokens          INTEGER NOT NULL,
+    count           INTEGER NOT NULL,
+    PRIMARY KEY (workspace_id, day, project_id, user_id)
+) WITHOUT ROWID;
+
+-- Last day folded into the rollups; later days are read from the live tables
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name            TEXT PRIMARY KEY,
+    through_day     TEXT NOT NULL
+);
+
+-- Deleting a row from a day already folded in takes it back out of the
+-- rollup. Later edits to uploaded_at / created_at are not tracked.
+CREATE TRIGGER IF NOT EXISTS trg_uploaded_files_delete_rollup AFTER DELETE ON uploaded_files
+WHEN date(OLD.uploaded_at) <= (SELECT through_day FROM rollup_state WHERE name = 'daily')
+BEGIN
+    UPDATE daily_file_formats SET count = count - 1
+    WHERE day = date(OLD.uploaded_at) AND project_id = OLD.project_id
+      AND file_format = OLD.file_format;
+    DELETE FROM daily_file_formats
+    WHERE day = date(OLD.uploaded_at) AND project_id = OLD.project_id
+      AND file_format = OLD.file_format AND count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_history_delete_rollup AFTER DELETE ON prompt_history
+WHEN date(OLD.created_at) <= (SELECT through_day FROM rollup_state WHERE name = 'daily')
+BEGIN
+    UPDATE daily_project_tokens
+    SET tokens = tokens - COALESCE(OLD.tokens_used, 0), count = count - 1
+    WHERE workspace_id = OLD.workspace_id AND day = date(OLD.created_at)
+      AND project_id = OLD.project_id AND user_id = OLD.user_id;
+    DELETE FROM daily_project_tokens
+    WHERE workspace_id = OLD.workspace_id AND day = date(OLD.created_at)
+      AND project_id = OLD.project_id AND user_id = OLD.user_id AND count <= 0;
+END;
 """
 
 
@@ -380,35 +604,638 @@ def _ensure_db_dir() -> None:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
-def get_connection() -> sqlite3.Connection:
-    """Return a new SQLite connection with WAL mode and foreign keys enabled."""
+# ---------------------------------------------------------------------------
+# Connection pool — one long-lived connection per thread
+# ---------------------------------------------------------------------------
+
+# Applied once when a connection is opened. synchronous=NORMAL is durable
+# under WAL except for the last commits before a power loss.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA analysis_limit=1000",
+)
+_PRAGMA_SCRIPT = ";\n".join(_PRAGMAS) + ";"
+
+
+def _unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+class _Connection(sqlite3.Connection):
+    """Connection that configures itself on open: Row results, the
+    _PRAGMAS settings, applied in one executescript call, and a
+    unicode_lower() SQL function (SQLite's lower() folds ASCII only)."""
+
+    _pragma_script = _PRAGMA_SCRIPT
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_factory = sqlite3.Row
+        self.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+        self.executescript(self._pragma_script)
+
+
+# Read-only connections inherit journal_mode from the database file and
+# never write, so they only take the cache and timeout settings.
+_READ_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class _ReadConnection(_Connection):
+    """Analytics connection opened with mode=ro and query_only set."""
+
+    _pragma_script = ";\n".join(_READ_PRAGMAS) + ";"
+
+
+_tls = threading.local()
+_pool_lock = threading.Lock()
+# Keyed by (thread, read_only): each thread may hold one connection of each kind
+_pooled: dict[tuple[threading.Thread, bool], sqlite3.Connection] = {}
+# Connections handed back by finished threads, keyed by (path, read_only).
+# Streamlit runs every rerun on a fresh thread, so without this each rerun
+# would open cold connections and close the last rerun's ones.
+_idle: dict[tuple[str, bool], list[sqlite3.Connection]] = {}
+_MAX_IDLE = 8
+
+
+def _close(conn: sqlite3.Connection) -> None:
+    """Refresh planner statistics SQLite considers stale, then close."""
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+
+def _reap_finished_threads() -> None:
+    """Move connections left behind by finished threads to the idle pool,
+    closing any beyond _MAX_IDLE. Caller holds _pool_lock."""
+    current = threading.current_thread()
+    for key in [k for k in _pooled if k[0] is not current and not k[0].is_alive()]:
+        conn = _pooled.pop(key)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            continue
+        idle = _idle.setdefault((conn.db_path, key[1]), [])
+        if len(idle) < _MAX_IDLE:
+            idle.append(conn)
+        else:
+            _close(conn)
+
+
+def _checkout(path: str, read_only: bool = False) -> Optional[sqlite3.Connection]:
+    """Return an idle connection to path left by a finished thread, if any."""
+    with _pool_lock:
+        _reap_finished_threads()
+        idle = _idle.get((path, read_only))
+        return idle.pop() if idle else None
+
+
+def _register_connection(conn: sqlite3.Connection, read_only: bool = False) -> None:
+    """Track a thread's connection so it can be reused once the thread
+    finishes and closed at exit."""
+    current = threading.current_thread()
+    with _pool_lock:
+        _reap_finished_threads()
+        previous = _pooled.get((current, read_only))
+        if previous is not None and previous is not conn:
+            _close(previous)
+        _pooled[(current, read_only)] = conn
+
+
+def _open(path: str) -> sqlite3.Connection:
     _ensure_db_dir()
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
+    conn = sqlite3.connect(
+        path, factory=_Connection, detect_types=0, isolation_level=None,
+        check_same_thread=False, cached_statements=512,
+    )
+    conn.db_path = path
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's SQLite connection, opening it on first use.
+
+    The connection is configured once (see _PRAGMAS) and reused for
+    every subsequent query on the thread; when the thread finishes it goes
+    back to the idle pool for the next thread. It is reopened if DB_PATH
+    changes.
+    """
+    path = str(DB_PATH)
+    conn = getattr(_tls, "conn", None)
+    if conn is not None and _tls.path == path:
+        return conn
+    conn = _checkout(path) or _open(path)
+    _register_connection(conn)
+    _tls.conn = conn
+    _tls.path = path
+    _tls.depth = 0
     return conn
 
 
-@contextmanager
-def get_db():
-    """Context manager that yields a connection and commits on success."""
+def get_read_connection() -> sqlite3.Connection:
+    """Return this thread's read-only connection, opening it on first use.
+
+    Under WAL its reads never wait on, or hold up, the writer connection.
+    The database must already exist (init_db() creates it).
+    """
+    path = str(DB_PATH)
+    conn = getattr(_tls, "read_conn", None)
+    if conn is not None and _tls.read_path == path:
+        return conn
+    conn = _checkout(path, read_only=True)
+    if conn is None:
+        conn = sqlite3.connect(
+            f"{Path(path).resolve().as_uri()}?mode=ro", uri=True,
+            factory=_ReadConnection, detect_types=0, isolation_level=None,
+            check_same_thread=False, cached_statements=512,
+        )
+        conn.db_path = path
+    _register_connection(conn, read_only=True)
+    _tls.read_conn = conn
+    _tls.read_path = path
+    _tls.read_depth = 0
+    return conn
+
+
+def close_thread_connection() -> None:
+    """Close this thread's pooled connections, if any. Call it when a
+    long-lived worker thread shuts down; the next query on the thread opens
+    a fresh connection."""
+    current = threading.current_thread()
+    for attr, read_only in (("conn", False), ("read_conn", True)):
+        conn = getattr(_tls, attr, None)
+        if conn is None:
+            continue
+        with _pool_lock:
+            if _pooled.get((current, read_only)) is conn:
+                del _pooled[(current, read_only)]
+        _close(conn)
+    _tls.__dict__.clear()
+
+
+def close_connections() -> None:
+    """Close every pooled connection. Registered to run at interpreter exit."""
+    with _pool_lock:
+        for conn in _pooled.values():
+            _close(conn)
+        _pooled.clear()
+        for idle in _idle.values():
+            for conn in idle:
+                _close(conn)
+        _idle.clear()
+    _tls.__dict__.clear()
+
+
+atexit.register(close_connections)
+
+
+class _Transaction:
+    """Context manager that yields the pooled connection inside a transaction.
+    The outermost block issues BEGIN and commits on success or rolls back on
+    error; nested blocks on the same thread join that transaction. The
+    connection itself stays open for reuse.
+
+    Wrap a multi-step flow in ``with get_db():`` to run every query helper
+    it calls on one connection and commit once at the end.
+
+    All state lives in the thread-local, so one shared instance per BEGIN
+    form serves every ``with get_db()`` without allocating a generator per
+    call.
+    """
+
+    __slots__ = ("_begin",)
+
+    def __init__(self, begin: str):
+        self._begin = begin
+
+    def __enter__(self) -> sqlite3.Connection:
+        conn = get_connection()
+        if _tls.depth:
+            _tls.depth += 1
+        else:
+            conn.execute(self._begin)
+            _tls.after_commit = []
+            _tls.depth = 1
+        return conn
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if _tls.depth > 1:
+            _tls.depth -= 1
+            return False
+        _tls.depth = 0
+        conn = _tls.conn
+        callbacks, _tls.after_commit = _tls.after_commit, []
+        if exc_type is None:
+            try:
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            for callback in callbacks:
+                callback()
+        else:
+            conn.rollback()
+        return False
+
+
+def in_transaction() -> bool:
+    """True while this thread is inside a get_db() or get_read_db() block,
+    i.e. its reads may see uncommitted writes or an older snapshot."""
+    return bool(getattr(_tls, "depth", 0) or getattr(_tls, "read_depth", 0))
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """Run callback once this thread's open get_db() transaction commits,
+    or right away outside one. It is dropped if the transaction rolls back."""
+    if getattr(_tls, "depth", 0):
+        _tls.after_commit.append(callback)
+    else:
+        callback()
+
+
+_TRANSACTION = _Transaction("BEGIN")
+_IMMEDIATE_TRANSACTION = _Transaction("BEGIN IMMEDIATE")
+
+
+def get_db(immediate: bool = False) -> _Transaction:
+    """Return the transaction context manager; use as ``with get_db() as conn``.
+
+    Pass immediate=True for read-then-write flows: the write lock is taken
+    at BEGIN, so the reads cannot be invalidated by another writer and the
+    block never fails midway on a lock upgrade. A nested block joins the
+    outer transaction as it is, so a wrapper around a read-then-write
+    helper must pass immediate=True itself.
+    """
+    return _IMMEDIATE_TRANSACTION if immediate else _TRANSACTION
+
+
+class _ReadTransaction:
+    """Context manager for SELECT-only code: yields the read-only connection
+    inside one read transaction, so every statement in the block sees the
+    same snapshot. Inside an open ``get_db()`` block it yields that
+    connection instead, so the caller's uncommitted writes stay visible.
+
+    The outermost block first waits for the writes this process queued
+    before it (flush_writes), so a snapshot never misses a row saved just
+    before it, e.g. the prompt history of the analysis that was just run.
+    Rows queued after it starts are not waited for.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> sqlite3.Connection:
+        if getattr(_tls, "read_depth", 0):
+            _tls.read_depth += 1
+            return _tls.read_conn
+        if getattr(_tls, "depth", 0):
+            return _tls.conn
+        flush_writes()
+        conn = get_read_connection()
+        conn.execute("BEGIN")
+        _tls.read_depth = 1
+        return conn
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if not getattr(_tls, "read_depth", 0):
+            return False  # joined the get_db() block
+        _tls.read_depth -= 1
+        if not _tls.read_depth:
+            _tls.read_conn.rollback()  # ends the read; nothing to commit
+        return False
+
+
+_READ_TRANSACTION = _ReadTransaction()
+
+
+def get_read_db() -> _ReadTransaction:
+    """Return the read-only context manager; use as ``with get_read_db() as conn``."""
+    return _READ_TRANSACTION
+
+
+# ---------------------------------------------------------------------------
+# Deferred writes — fire-and-forget rows committed in batches
+# ---------------------------------------------------------------------------
+
+_WRITE_BATCH = 500
+_WRITE_INTERVAL = 0.005  # seconds a batch waits for more rows
+_write_queue: "queue.Queue[tuple[str, str, tuple]]" = queue.Queue(maxsize=10_000)
+_writer_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+# Items are numbered as they are queued; the writer publishes how many it
+# has finished with, so flush_writes() waits only for rows queued before it.
+_queued_seq = 0
+_queued_lock = threading.Lock()
+_written_seq = 0
+_written = threading.Condition()
+# Extra attempts for a batch that found the database locked by another
+# process even after busy_timeout, with a growing pause before each
+_BUSY_RETRIES = 4
+_BUSY_BACKOFF = 0.1  # seconds
+
+
+def _is_busy(exc: sqlite3.Error) -> bool:
+    code = getattr(exc, "sqlite_errorcode", 0) & 0xFF  # primary code
+    return code in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def _log_dropped(sql: str, params: tuple, exc: BaseException) -> None:
+    logger.error("Dropped queued write %s with %r: %s", sql, params, exc)
+
+
+def _apply_writes(conn: sqlite3.Connection, items: list[tuple[str, tuple]]) -> None:
+    """Run the queued statements as one transaction, one executemany per
+    distinct SQL string. A batch that finds the database locked is retried
+    whole. If it fails otherwise (e.g. a row whose parent was deleted
+    meanwhile), retry row by row so only the bad rows are dropped. Every
+    dropped row is logged."""
+    grouped: dict[str, list[tuple]] = {}
+    for sql, params in items:
+        grouped.setdefault(sql, []).append(params)
+    for attempt in range(_BUSY_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, rows in grouped.items():
+                conn.executemany(sql, rows)
+            conn.commit()
+            return
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            if not _is_busy(exc):
+                break
+            if attempt == _BUSY_RETRIES:
+                for sql, params in items:
+                    _log_dropped(sql, params, exc)
+                return
+            time.sleep(_BUSY_BACKOFF * 2 ** attempt)
+    for sql, rows in grouped.items():
+        for params in rows:
+            try:
+                conn.execute(sql, params)
+            except sqlite3.Error as exc:
+                _log_dropped(sql, params, exc)
+
+
+def _writer_loop() -> None:
+    global _written_seq
+    conn = None
+    conn_path = None
+    while True:
+        batch = [_write_queue.get()]
+        deadline = time.monotonic() + _WRITE_INTERVAL
+        while len(batch) < _WRITE_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_write_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        start = 0
+        try:
+            # Items carry the DB path they were queued for; keep it in order
+            # across a path change.
+            for i in range(1, len(batch) + 1):
+                if i < len(batch) and batch[i][0] == batch[start][0]:
+                    continue
+                path = batch[start][0]
+                if path != conn_path:
+                    if conn is not None:
+                        _close(conn)
+                    conn, conn_path = _open(path), path
+                _apply_writes(conn, [item[1:] for item in batch[start:i]])
+                start = i
+        except Exception as exc:
+            # Never let the writer thread die; the rows not yet applied are lost
+            for _, sql, params in batch[start:]:
+                _log_dropped(sql, params, exc)
+        finally:
+            with _written:
+                _written_seq += len(batch)
+                _written.notify_all()
+
+
+def enqueue_write(sql: str, params: tuple = ()) -> None:
+    """Queue an INSERT / UPDATE whose result the caller does not read back
+    (history rows, last-used stamps). A background thread commits queued
+    rows every few milliseconds in one transaction.
+
+    Inside a ``with get_db()`` block the statement runs immediately instead,
+    so it commits or rolls back with the caller's transaction.
+    """
+    sql = _prepare(sql)
+    if getattr(_tls, "depth", 0):
+        _tls.conn.execute(sql, params)
+        return
+    _queue_write(str(DB_PATH), sql, params)
+
+
+def _queue_write(path: str, sql: str, params: tuple) -> None:
+    global _writer, _queued_seq
+    if _writer is None or not _writer.is_alive():
+        with _writer_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+                _writer.start()
+    with _queued_lock:
+        _queued_seq += 1
+        _write_queue.put((path, sql, params))
+
+
+# Coalesced writes: per-row values merged in memory and handed to the writer
+# once per interval, so N calls for one row become a single UPDATE.
+_COALESCE_INTERVAL = 1.0  # seconds
+_coalesced: dict[tuple[str, str], dict] = {}
+_coalesce_lock = threading.Lock()
+_coalesce_timer: Optional[threading.Timer] = None
+
+
+def coalesce_write(sql: str, key, value, merge: Optional[Callable] = None) -> None:
+    """Buffer ``sql`` to run later with params ``(value, key)``. Calls for
+    the same statement and key before the next flush are combined with
+    ``merge(old, new)`` (default: keep the newest value). For counters and
+    timestamps that do not need to be durable the moment they change.
+    """
+    global _coalesce_timer
+    slot = (str(DB_PATH), _prepare(sql))
+    with _coalesce_lock:
+        pending = _coalesced.setdefault(slot, {})
+        if merge is not None and key in pending:
+            value = merge(pending[key], value)
+        pending[key] = value
+        if _coalesce_timer is None:
+            _coalesce_timer = threading.Timer(_COALESCE_INTERVAL, _flush_coalesced)
+            _coalesce_timer.daemon = True
+            _coalesce_timer.start()
+
+
+def _flush_coalesced() -> None:
+    """Hand every buffered coalesced value to the writer queue."""
+    global _coalesce_timer
+    with _coalesce_lock:
+        if _coalesce_timer is not None:
+            _coalesce_timer.cancel()
+            _coalesce_timer = None
+        batches = list(_coalesced.items())
+        _coalesced.clear()
+    for (path, sql), pending in batches:
+        for key, value in pending.items():
+            _queue_write(path, sql, (value, key))
+
+
+def flush_writes() -> None:
+    """Block until every write queued or coalesced before the call has been
+    committed; rows other threads queue meanwhile are not waited for. A
+    no-op inside a ``with get_db()`` block, where waiting on the writer
+    could deadlock against this thread's own open transaction."""
+    if getattr(_tls, "depth", 0):
+        return
+    _flush_coalesced()
+    with _queued_lock:
+        target = _queued_seq
+    with _written:
+        _written.wait_for(lambda: _written_seq >= target)
+
+
+# Registered after close_connections, so it runs first at exit
+atexit.register(flush_writes)
+
+
+_REBUILD_COUNTERS_SQL = (
+    """
+INSERT OR REPLACE INTO global_counters (name, value)
+SELECT 'users', COUNT(*) FROM users
+UNION ALL SELECT 'workspaces', COUNT(*) FROM workspaces
+UNION ALL SELECT 'api_calls', COUNT(*) FROM prompt_history
+UNION ALL SELECT 'credits_consumed', COALESCE(SUM(-change_amount), 0) FROM credit_ledger WHERE change_amount < 0
+UNION ALL SELECT 'revenue_cents', COALESCE(SUM(amount_paid_cents), 0) FROM credit_purchases
+""",
+    """
+UPDATE projects SET
+    files_total = (SELECT COUNT(*) FROM uploaded_files f WHERE f.project_id = projects.id),
+    files_success = (SELECT COUNT(*) FROM uploaded_files f
+                     WHERE f.project_id = projects.id AND f.status = 'success'),
+    files_error = (SELECT COUNT(*) FROM uploaded_files f
+                   WHERE f.project_id = projects.id AND f.status = 'error'),
+    files_pending = (SELECT COUNT(*) FROM uploaded_files f
+                     WHERE f.project_id = projects.id AND f.status = 'pending'),
+    dashboards_count = (SELECT COUNT(*) FROM dashboards d WHERE d.project_id = projects.id),
+    analyses_count = (SELECT COUNT(*) FROM prompt_history ph WHERE ph.project_id = projects.id),
+    last_activity = (SELECT MAX(ts) FROM (
+        SELECT MAX(uploaded_at) AS ts FROM uploaded_files f WHERE f.project_id = projects.id
+        UNION ALL
+        SELECT MAX(created_at) FROM dashboards d WHERE d.project_id = projects.id
+        UNION ALL
+        SELECT MAX(created_at) FROM prompt_history ph WHERE ph.project_id = projects.id))
+""",
+)
+
+
+def rebuild_counters() -> None:
+    """Recompute global_counters and the project activity counters from the
+    source tables. init_db() runs this on upgrade; call it by hand if the
+    counters are ever suspected to have drifted (e.g. after editing tables
+    outside the app)."""
+    with get_db() as conn:
+        for sql in _REBUILD_COUNTERS_SQL:
+            conn.execute(sql)
+
+
+_REFRESH_ROLLUPS_SQL = (
+    """INSERT OR REPLACE INTO daily_file_formats
+           (workspace_id, day, project_id, file_format, count)
+       SELECT p.workspace_id, date(f.uploaded_at), f.project_id, f.file_format, COUNT(*)
+       FROM uploaded_files f
+       JOIN projects p ON f.project_id = p.id
+       WHERE f.uploaded_at >= date(?, '+1 day') AND f.uploaded_at < date(?, '+1 day')
+       GROUP BY 1, 2, 3, 4""",
+    """INSERT OR REPLACE INTO daily_project_tokens
+           (workspace_id, day, project_id, user_id, tokens, count)
+       SELECT workspace_id, date(created_at), project_id, user_id, SUM(tokens_used), COUNT(*)
+       FROM prompt_history
+       WHERE created_at >= date(?, '+1 day') AND created_at < date(?, '+1 day')
+       GROUP BY 1, 2, 3, 4""",
+)
+
+
+# Days folded per write transaction, so a first run over a long history
+# never holds the write lock for more than one range at a time.
+_ROLLUP_BATCH_DAYS = 31
+
+
+def refresh_daily_rollups() -> None:
+    """Fold every complete day (up to yesterday, UTC) not yet rolled up into
+    daily_file_formats and daily_project_tokens, committing every
+    _ROLLUP_BATCH_DAYS days. Cheap once caught up, so it can be run from
+    cron or the app's periodic tick."""
+    with get_db(immediate=True) as conn:
+        row = conn.execute(
+            "SELECT through_day FROM rollup_state WHERE name = 'daily'"
+        ).fetchone()
+        through = conn.execute("SELECT date('now', '-1 day')").fetchone()[0]
+        if row:
+            since = row[0]
+        else:
+            # Start the day before the oldest row rather than at year 1.
+            since = conn.execute(
+                """SELECT date(MIN(ts), '-1 day') FROM (
+                       SELECT MIN(uploaded_at) AS ts FROM uploaded_files
+                       UNION ALL
+                       SELECT MIN(created_at) FROM prompt_history)"""
+            ).fetchone()[0] or through
+            conn.execute(
+                "INSERT INTO rollup_state (name, through_day) VALUES ('daily', ?)",
+                (since,),
+            )
+    while since < through:
+        upto = min(
+            (date.fromisoformat(since) + timedelta(days=_ROLLUP_BATCH_DAYS)).isoformat(),
+            through,
+        )
+        with get_db() as conn:
+            for sql in _REFRESH_ROLLUPS_SQL:
+                conn.execute(sql, (since, upto))
+            conn.execute(
+                "UPDATE rollup_state SET through_day = ? WHERE name = 'daily'", (upto,)
+            )
+        since = upto
+
+
+def init_db() -> None:
+    """Create all tables if they do not exist. Safe to call multiple times.
+
+    Databases already stamped with SCHEMA_VERSION return immediately without
+    re-running any DDL.
+    """
     conn = get_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+
+    # Run the whole script as one transaction (one commit) rather than
+    # letting each CREATE autocommit.
     try:
-        yield conn
-        conn.commit()
+        conn.executescript(f"BEGIN;\n{_SCHEMA}\nCOMMIT;")
     except Exception:
-        conn.rollback()
+        if conn.in_transaction:
+            conn.rollback()
         raise
-    finally:
-        conn.close()
 
-
-def init_db() -> None:
-    """Create all tables if they do not exist. Safe to call multiple times."""
     with get_db() as conn:
-        conn.executescript(_SCHEMA)
-
         # Migrations for existing databases — each wrapped in try/except
         # so they silently skip if the column already exists.
         migrations = [
@@ -422,6 +1249,42 @@ def init_db() -> None:
             "ALTER TABLE uploaded_files ADD COLUMN error_message TEXT DEFAULT NULL",
             # Phase: 7-day trial
             "ALTER TABLE workspaces ADD COLUMN trial_ends_at TEXT DEFAULT NULL",
+            # Phase: drop indexes duplicated by UNIQUE constraints or by
+            # idx_ak_prefix_active
+            "DROP INDEX IF EXISTS idx_sessions_token",
+            "DROP INDEX IF EXISTS idx_wm_workspace",
+            "DROP INDEX IF EXISTS idx_ak_prefix",
+            # Phase: FK indexes widened with the list queries' sort column
+            "DROP INDEX IF EXISTS idx_evc_user_id",
+            "DROP INDEX IF EXISTS idx_wi_workspace",
+            "DROP INDEX IF EXISTS idx_projects_workspace",
+            "DROP INDEX IF EXISTS idx_files_project",
+            "DROP INDEX IF EXISTS idx_dashboards_project",
+            "DROP INDEX IF EXISTS idx_charts_dashboard",
+            "DROP INDEX IF EXISTS idx_ph_workspace",
+            # Phase: move inline data profiles into file_profiles
+            "INSERT OR IGNORE INTO file_profiles (file_id, data_profile) "
+            "SELECT id, data_profile FROM uploaded_files WHERE data_profile IS NOT NULL",
+            "UPDATE uploaded_files SET data_profile = NULL WHERE data_profile IS NOT NULL",
+            # Phase: balances served from workspace_balances
+            "INSERT OR REPLACE INTO workspace_balances (workspace_id, balance) "
+            "SELECT workspace_id, balance_after FROM credit_ledger "
+            "WHERE rowid IN (SELECT MAX(rowid) FROM credit_ledger GROUP BY workspace_id)",
+            "DROP INDEX IF EXISTS idx_cl_workspace",
+            # Phase: keyset pagination on (created_at, id)
+            "DROP INDEX IF EXISTS idx_audit_created",
+            # Phase: project activity counters
+            "ALTER TABLE projects ADD COLUMN files_total INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN files_success INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN files_error INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN files_pending INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN dashboards_count INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN analyses_count INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE projects ADD COLUMN last_activity TEXT DEFAULT NULL",
+            # Phase: project_id index widened with its sort column
+            "DROP INDEX IF EXISTS idx_ph_project",
+            # Phase: keyset pagination of a project's prompt history
+            "DROP INDEX IF EXISTS idx_ph_project_created",
         ]
         for sql in migrations:
             try:
@@ -433,20 +1296,58 @@ def init_db() -> None:
         try:
             conn.execute(
                 "UPDATE uploaded_files SET status='error' "
-                "WHERE row_count IS NULL AND data_profile IS NULL AND status='success'"
+                "WHERE row_count IS NULL AND status='success' "
+                "AND id NOT IN (SELECT file_id FROM file_profiles)"
             )
         except Exception:
             pass
 
+        # Seed the counters (their triggers only apply deltas)
+        for sql in _REBUILD_COUNTERS_SQL:
+            conn.execute(sql)
+
+        # Give the planner index statistics before the first real queries
+        conn.execute("ANALYZE")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+@lru_cache(maxsize=256)
+def _prepare(sql: str) -> str:
+    """Normalize SQL indentation so every call site with the same query shape
+    hits the same entry in the connection's statement cache."""
+    return "\n".join(line.strip() for line in sql.strip().splitlines())
+
 
 def execute_query(sql: str, params: tuple = ()) -> list[sqlite3.Row]:
-    """Run a SELECT and return all rows."""
-    with get_db() as conn:
-        return conn.execute(sql, params).fetchall()
+    """Run a SELECT and return all rows.
+
+    Pass module-level SQL constants rather than f-strings so the statement
+    is parsed once per connection and reused from the cache.
+    """
+    # A lone statement needs no explicit transaction: it autocommits, or
+    # joins the caller's get_db() block if one is open on this thread.
+    return get_connection().execute(_prepare(sql), params).fetchall()
+
+
+def iter_query(sql: str, params: tuple = (), batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+    """Run a SELECT and yield rows lazily, fetching batch_size at a time.
+    Use this instead of execute_query for large result sets (exports,
+    prompt history, ledgers) so the rows are never all materialized at once.
+    It reads outside get_db(), so an abandoned iterator cannot leave a
+    transaction open on the thread's connection.
+    """
+    cursor = get_connection().execute(_prepare(sql), params)
+    cursor.arraysize = batch_size
+    try:
+        while batch := cursor.fetchmany():
+            yield from batch
+    finally:
+        cursor.close()
 
 
 def execute_write(sql: str, params: tuple = ()) -> int:
-    """Run an INSERT / UPDATE / DELETE. Returns lastrowid for inserts."""
-    with get_db() as conn:
-        cursor = conn.execute(sql, params)
-        return cursor.lastrowid
+    """Run an INSERT / UPDATE / DELETE. Returns lastrowid for inserts.
+
+    Same caching advice as execute_query applies.
+    """
+    return get_connection().execute(_prepare(sql), params).lastrowid
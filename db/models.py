@@ -1,11 +1,93 @@
 """Data models representing database rows as typed dataclasses."""
 
+import dataclasses
 from dataclasses import dataclass, field
 from typing import Optional
 import json
 
-
-@dataclass
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+
+if orjson is not None:
+    def json_loads(text):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # stdlib json also accepts NaN/Infinity, which older rows may hold
+            return json.loads(text)
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(
+            obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+
+_MISSING = object()
+
+
+class LazyJSON:
+    """Dataclass field descriptor for JSON columns. Assigning a string keeps
+    the raw text; it is decoded on first read and the result memoized, so
+    rows whose JSON is never touched are never parsed. Non-string values
+    are stored as-is.
+
+    ``empty`` is returned for NULL/empty text (called if it is a factory
+    such as ``list``). With ``keep_raw_on_error`` undecodable text is
+    returned unchanged instead of raising.
+    """
+
+    def __init__(self, empty=None, default=_MISSING, keep_raw_on_error=False):
+        self.empty = empty
+        self.default = default
+        self.keep_raw_on_error = keep_raw_on_error
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.raw_name = f"_raw_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            # dataclass reads the class attribute to find the field default
+            if self.default is _MISSING:
+                raise AttributeError(self.name)
+            return self.default
+        d = instance.__dict__
+        try:
+            return d[self.name]
+        except KeyError:
+            pass
+        value = d[self.name] = self._decode(d.pop(self.raw_name, None))
+        return value
+
+    def __set__(self, instance, value):
+        d = instance.__dict__
+        if isinstance(value, str):
+            d[self.raw_name] = value
+            d.pop(self.name, None)
+        else:
+            d[self.name] = value
+            d.pop(self.raw_name, None)
+
+    def _decode(self, raw):
+        if not raw:
+            if self.keep_raw_on_error and raw is not None:
+                return raw
+            return self.empty() if callable(self.empty) else self.empty
+        try:
+            return json_loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            if self.keep_raw_on_error:
+                return raw
+            raise
+
+
+@dataclass(slots=True)
 class User:
     id: str
     email: str
@@ -23,20 +105,12 @@ class User:
     created_at: str = ""
     updated_at: str = ""
 
-    def __post_init__(self):
-        if isinstance(self.is_superadmin, int):
-            self.is_superadmin = bool(self.is_superadmin)
-        if isinstance(self.totp_enabled, int):
-            self.totp_enabled = bool(self.totp_enabled)
-        if isinstance(self.email_2fa_enabled, int):
-            self.email_2fa_enabled = bool(self.email_2fa_enabled)
-
     @property
     def has_2fa(self) -> bool:
         return self.totp_enabled or self.email_2fa_enabled
 
 
-@dataclass
+@dataclass(slots=True)
 class UserSession:
     id: str
     user_id: str
@@ -56,19 +130,13 @@ class Workspace:
     tier: str
     stripe_customer_id: Optional[str]
     sso_enabled: bool
-    sso_config: Optional[dict]
+    sso_config: Optional[dict] = LazyJSON()
     trial_ends_at: Optional[str] = None
     created_at: str = ""
     updated_at: str = ""
 
-    def __post_init__(self):
-        if isinstance(self.sso_config, str):
-            self.sso_config = json.loads(self.sso_config) if self.sso_config else None
-        if isinstance(self.sso_enabled, int):
-            self.sso_enabled = bool(self.sso_enabled)
 
-
-@dataclass
+@dataclass(slots=True)
 class WorkspaceMember:
     id: str
     workspace_id: str
@@ -78,7 +146,7 @@ class WorkspaceMember:
     joined_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class WorkspaceInvitation:
     id: str
     workspace_id: str
@@ -91,7 +159,7 @@ class WorkspaceInvitation:
     expires_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Project:
     id: str
     workspace_id: str
@@ -116,16 +184,14 @@ class UploadedFile:
     row_count: Optional[int]
     column_count: Optional[int]
     column_names: Optional[list[str]]
-    data_profile: Optional[dict]
+    data_profile: Optional[dict] = LazyJSON()
     status: str = "success"
     error_message: Optional[str] = None
     uploaded_at: str = ""
 
     def __post_init__(self):
         if isinstance(self.column_names, str):
-            self.column_names = json.loads(self.column_names) if self.column_names else None
-        if isinstance(self.data_profile, str):
-            self.data_profile = json.loads(self.data_profile) if self.data_profile else None
+            self.column_names = json_loads(self.column_names) if self.column_names else None
 
 
 @dataclass
@@ -135,17 +201,11 @@ class Dashboard:
     created_by: str
     name: str
     description: str
-    layout: list
-    style_config: Optional[dict]
+    layout: list = LazyJSON(empty=list)
+    style_config: Optional[dict] = LazyJSON()
     created_at: str
     updated_at: str
 
-    def __post_init__(self):
-        if isinstance(self.layout, str):
-            self.layout = json.loads(self.layout) if self.layout else []
-        if isinstance(self.style_config, str):
-            self.style_config = json.loads(self.style_config) if self.style_config else None
-
 
 @dataclass
 class Chart:
@@ -157,18 +217,14 @@ class Chart:
     user_prompt: str
     generated_code: str
     plotly_json: Optional[str]
-    style_overrides: Optional[dict]
+    style_overrides: Optional[dict] = LazyJSON()
     position_index: int
     created_by: str
     created_at: str
     updated_at: str
 
-    def __post_init__(self):
-        if isinstance(self.style_overrides, str):
-            self.style_overrides = json.loads(self.style_overrides) if self.style_overrides else None
-
 
-@dataclass
+@dataclass(slots=True)
 class CreditLedgerEntry:
     id: str
     workspace_id: str
@@ -180,7 +236,7 @@ class CreditLedgerEntry:
     created_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Subscription:
     id: str
     workspace_id: str
@@ -194,7 +250,7 @@ class Subscription:
     updated_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class CreditPurchase:
     id: str
     workspace_id: str
@@ -205,7 +261,7 @@ class CreditPurchase:
     created_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class AddOn:
     id: str
     workspace_id: str
@@ -226,18 +282,12 @@ class WorkspaceBranding:
     accent_color: str
     font_family: str
     font_size_base: int
-    chart_color_palette: list[str]
+    chart_color_palette: list[str] = LazyJSON()
     header_text: str
     footer_text: str
     hide_insightpilot_branding: bool
     updated_at: str
 
-    def __post_init__(self):
-        if isinstance(self.chart_color_palette, str):
-            self.chart_color_palette = json.loads(self.chart_color_palette)
-        if isinstance(self.hide_insightpilot_branding, int):
-            self.hide_insightpilot_branding = bool(self.hide_insightpilot_branding)
-
 
 @dataclass
 class ApiKey:
@@ -247,17 +297,13 @@ class ApiKey:
     key_hash: str
     key_prefix: str
     name: str
-    permissions: dict
+    permissions: dict = LazyJSON()
     last_used_at: Optional[str]
     created_at: str
     revoked_at: Optional[str]
 
-    def __post_init__(self):
-        if isinstance(self.permissions, str):
-            self.permissions = json.loads(self.permissions)
 
-
-@dataclass
+@dataclass(slots=True)
 class PromptHistoryEntry:
     id: str
     user_id: str
@@ -272,7 +318,7 @@ class PromptHistoryEntry:
     created_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class PromptTemplate:
     id: str
     project_id: str
@@ -285,10 +331,6 @@ class PromptTemplate:
     created_at: str = ""
     updated_at: str = ""
 
-    def __post_init__(self):
-        if isinstance(self.is_default, int):
-            self.is_default = bool(self.is_default)
-
 
 @dataclass
 class AuditLogEntry:
@@ -297,19 +339,12 @@ class AuditLogEntry:
     action: str
     entity_type: str
     entity_id: Optional[str] = None
-    details: Optional[str] = None
+    details: Optional[str] = LazyJSON(default=None, keep_raw_on_error=True)
     ip_address: Optional[str] = None
     created_at: str = ""
 
-    def __post_init__(self):
-        if isinstance(self.details, str) and self.details:
-            try:
-                self.details = json.loads(self.details)
-            except (json.JSONDecodeError, TypeError):
-                pass
-
 
-@dataclass
+@dataclass(slots=True)
 class SystemSetting:
     key: str
     value: str
@@ -317,7 +352,7 @@ class SystemSetting:
     updated_at: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class UserPreferences:
     id: str
     user_id: str
@@ -328,15 +363,8 @@ class UserPreferences:
     notification_product: bool = True
     updated_at: str = ""
 
-    def __post_init__(self):
-        for attr in ("notification_email", "notification_in_app",
-                      "notification_billing", "notification_product"):
-            val = getattr(self, attr)
-            if isinstance(val, int):
-                setattr(self, attr, bool(val))
-
 
-@dataclass
+@dataclass(slots=True)
 class ScheduledReport:
     id: str
     workspace_id: str
@@ -359,31 +387,110 @@ class ScheduledReport:
 
     def __post_init__(self):
         if isinstance(self.recipient_emails, str):
-            self.recipient_emails = json.loads(self.recipient_emails) if self.recipient_emails else []
-        for attr in ("include_pdf", "include_excel", "active"):
-            val = getattr(self, attr)
-            if isinstance(val, int):
-                setattr(self, attr, bool(val))
+            self.recipient_emails = json_loads(self.recipient_emails) if self.recipient_emails else []
+
+
+@dataclass(slots=True)
+class UsageSummary:
+    """Usage analytics aggregates for one workspace and date range."""
+    credits_used: int = 0
+    analyses_run: int = 0
+    dashboards_created: int = 0
+    files_uploaded: int = 0
+    credit_usage_by_day: list[dict] = field(default_factory=list)
+    analyses_by_day: list[dict] = field(default_factory=list)
+    token_usage_by_project: list[dict] = field(default_factory=list)
+
+    def __post_init__(self):
+        for name in ("credit_usage_by_day", "analyses_by_day", "token_usage_by_project"):
+            value = getattr(self, name)
+            if isinstance(value, str):
+                setattr(self, name, json_loads(value))
 
 
 # ---------------------------------------------------------------------------
 # Helper to convert sqlite3.Row to a model dataclass
 # ---------------------------------------------------------------------------
 
+# Generated row -> model constructors keyed by (model class, row columns)
+_BUILDER_CACHE: dict[tuple[type, tuple[str, ...]], object] = {}
+
+
+def _make_row_builder(model_class, row_columns: tuple[str, ...]):
+    """Compile ``build(row)`` for one (model, column layout) pair.
+
+    The field -> row index layout is resolved here, once, so the generated
+    code is a single positional call, e.g. ``Model(row[0], row[2], _d5)``
+    where ``_d5`` is field 5's default. ``bool`` fields (stored as 0/1
+    INTEGER) are wrapped in ``bool()`` here rather than coerced per
+    instance in __post_init__. If a field without a default is
+    missing from the row, the builder passes the recognized columns as
+    keywords instead and the constructor reports the missing argument.
+    """
+    index = {col: i for i, col in enumerate(row_columns)}
+    namespace = {"Model": model_class}
+
+    def column(f):
+        return f"bool(row[{index[f.name]}])" if f.type is bool else f"row[{index[f.name]}]"
+
+    args = []
+    for n, f in enumerate(dataclasses.fields(model_class)):
+        if f.name in index:
+            args.append(column(f))
+        elif f.default is not dataclasses.MISSING:
+            namespace[f"_d{n}"] = f.default
+            args.append(f"_d{n}")
+        elif f.default_factory is not dataclasses.MISSING:
+            namespace[f"_f{n}"] = f.default_factory
+            args.append(f"_f{n}()")
+        else:
+            args = [f"{f.name}={column(f)}"
+                    for f in dataclasses.fields(model_class) if f.name in index]
+            break
+    exec(f"def build(row):\n    return Model({', '.join(args)})\n", namespace)
+    return namespace["build"]
+
+
+def _row_builder(model_class, row):
+    key = (model_class, tuple(row.keys()))
+    build = _BUILDER_CACHE.get(key)
+    if build is None:
+        build = _BUILDER_CACHE[key] = _make_row_builder(model_class, key[1])
+    return build
+
+
 def row_to_model(row, model_class):
     """Convert a sqlite3.Row to a dataclass instance.
     Handles the case where row has more columns than the dataclass expects
     by only passing recognized fields."""
     if row is None:
         return None
-    d = dict(row)
-    # Only pass keys that the dataclass accepts
-    import dataclasses
-    field_names = {f.name for f in dataclasses.fields(model_class)}
-    filtered = {k: v for k, v in d.items() if k in field_names}
-    return model_class(**filtered)
+    return _row_builder(model_class, row)(row)
+
+
+def iter_models(rows, model_class):
+    """Lazily convert an iterable of sqlite3.Row (e.g. iter_query) to
+    dataclass instances, one at a time."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    build = _row_builder(model_class, first)
+    yield build(first)
+    for r in rows:
+        yield build(r)
 
 
 def rows_to_models(rows, model_class):
-    """Convert a list of sqlite3.Row to a list of dataclass instances."""
-    return [row_to_model(r, model_class) for r in rows]
+    """Convert sqlite3.Row objects to a list of dataclass instances. rows may
+    be a list or a live cursor; a cursor is consumed directly, without an
+    intermediate fetchall() list."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return []
+    # Every row of a result set has the same columns, so build once
+    build = _row_builder(model_class, first)
+    models = [build(first)]
+    models.extend(map(build, rows))
+    return models
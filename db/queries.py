@@ -1,23 +1,239 @@
 """All database query functions. Every function that accesses user/workspace
 data requires workspace_id or user_id to enforce multi-tenancy."""
 
-import json
-import uuid
-from typing import Optional
-
-from db.database import get_db
+import copy
+import dataclasses
+import operator
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from db import database
+from db.database import (
+    coalesce_write, enqueue_write, flush_writes, get_db, get_read_db, iter_query,
+)
 from db.models import (
     User, UserSession, Workspace, WorkspaceMember, WorkspaceInvitation,
     Project, UploadedFile, Dashboard, Chart, CreditLedgerEntry,
     Subscription, CreditPurchase, AddOn, WorkspaceBranding, ApiKey,
     PromptHistoryEntry, PromptTemplate, AuditLogEntry, SystemSetting,
-    UserPreferences, ScheduledReport,
-    row_to_model, rows_to_models,
+    UserPreferences, ScheduledReport, UsageSummary,
+    iter_models, json_dumps, row_to_model, rows_to_models,
 )
 
 
+def _group_by(ids: list[str], models: list, attr: str) -> dict[str, list]:
+    """Bucket models by a parent-id attribute, keeping query order. Every
+    requested id gets a list, empty if it has no children."""
+    grouped = {i: [] for i in ids}
+    for m in models:
+        grouped[getattr(m, attr)].append(m)
+    return grouped
+
+
+def _placeholders(values) -> str:
+    return ",".join("?" * len(values))
+
+
+def _rows_to_dicts(cursor: sqlite3.Cursor) -> list[dict]:
+    """Drain a cursor into plain dicts, resolving column names once."""
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, r)) for r in cursor]
+
+
+class _TTLCache:
+    """Process-local cache for hot by-key lookups. Entries are keyed by
+    database path as well as key and expire after ``ttl`` seconds; writers
+    in this process call invalidate(), other processes are seen within the
+    TTL. A read that raced a write does not store what it read.
+
+    Inside a transaction the cache is bypassed both ways: reads go to the
+    database (they may see uncommitted writes) and invalidate() waits for
+    the commit, so no other thread can re-cache the old row in between.
+    """
+
+    __slots__ = ("ttl", "maxsize", "_data", "_generation", "_lock")
+
+    def __init__(self, ttl: float, maxsize: int = 4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: dict[tuple, tuple[object, float]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """Return the cached value for key, calling load() on a miss."""
+        if database.in_transaction():
+            return load()
+        full_key = (str(database.DB_PATH), key)
+        hit = self._data.get(full_key)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+        generation = self._generation
+        value = load()
+        with self._lock:
+            if generation == self._generation:
+                if len(self._data) >= self.maxsize:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    self._data.pop(next(iter(self._data)))
+                self._data[full_key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def invalidate(self, key=None) -> None:
+        """Drop one key, or every entry when key is None, once the current
+        transaction (if any) commits."""
+        database.after_commit(lambda: self._drop(key))
+
+    def _drop(self, key) -> None:
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop((str(database.DB_PATH), key), None)
+
+
+# The current user and workspace are looked up on every rerun and API
+# request. The TTL is kept short because the UI and API run as separate
+# processes (e.g. a Stripe webhook changes the tier in the API process).
+# Authorization state (member roles, superadmin) is never cached.
+_user_cache = _TTLCache(ttl=5.0)
+_workspace_cache = _TTLCache(ttl=5.0)
+
+
+# Ids are cut from one token_hex() call per _ID_BATCH ids rather than
+# reading the OS entropy source once per row.
+_ID_BATCH = 1024
+_id_pool: list[str] = []
+_id_lock = threading.Lock()
+# A forked child must not hand out ids its parent also holds
+os.register_at_fork(after_in_child=_id_pool.clear)
+
+
 def _new_id() -> str:
-    return uuid.uuid4().hex
+    # Same 32-char hex format as uuid4().hex, without building a UUID object
+    with _id_lock:
+        if not _id_pool:
+            raw = secrets.token_hex(16 * _ID_BATCH)
+            _id_pool.extend(raw[i:i + 32] for i in range(0, len(raw), 32))
+        return _id_pool.pop()
+
+
+def _new_ordered_id() -> str:
+    """Time-ordered id for append-heavy tables (ledger, prompt history,
+    audit log): a 48-bit millisecond timestamp followed by 80 random bits,
+    in the same 32-char hex form as _new_id(). New rows then land at the
+    right edge of the primary-key B-tree instead of on random leaf pages."""
+    return f"{time.time_ns() // 1_000_000:012x}{_new_id()[:20]}"
+
+
+def _columns(model_class) -> str:
+    """Explicit SELECT list in the model's field order. Rows then map onto
+    the constructor positionally, and columns added to a table later are
+    not fetched until the model grows a field for them."""
+    return ", ".join(f.name for f in dataclasses.fields(model_class))
+
+
+_USER_COLUMNS = _columns(User)
+_SESSION_COLUMNS = _columns(UserSession)
+_WORKSPACE_COLUMNS = _columns(Workspace)
+_MEMBER_COLUMNS = _columns(WorkspaceMember)
+_INVITATION_COLUMNS = _columns(WorkspaceInvitation)
+_PROJECT_COLUMNS = _columns(Project)
+_DASHBOARD_COLUMNS = _columns(Dashboard)
+_CHART_COLUMNS = _columns(Chart)
+_LEDGER_COLUMNS = _columns(CreditLedgerEntry)
+_SUBSCRIPTION_COLUMNS = _columns(Subscription)
+_PURCHASE_COLUMNS = _columns(CreditPurchase)
+_ADD_ON_COLUMNS = _columns(AddOn)
+_BRANDING_COLUMNS = _columns(WorkspaceBranding)
+_API_KEY_COLUMNS = _columns(ApiKey)
+_PROMPT_HISTORY_COLUMNS = _columns(PromptHistoryEntry)
+_TEMPLATE_COLUMNS = _columns(PromptTemplate)
+_AUDIT_COLUMNS = _columns(AuditLogEntry)
+_PREFERENCES_COLUMNS = _columns(UserPreferences)
+_REPORT_COLUMNS = _columns(ScheduledReport)
+
+
+class _SqlNow:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "SQL_NOW"
+
+
+# Pass as an update_* value to set the column to datetime('now') in SQL,
+# e.g. update_scheduled_report(rid, last_sent_at=SQL_NOW)
+SQL_NOW = _SqlNow()
+
+
+@lru_cache(maxsize=256)
+def _update_sql(table: str, columns: tuple[str, ...], now_columns: tuple[str, ...],
+                where: str) -> str:
+    """Build the UPDATE statement once per (table, column set, where) shape."""
+    sets = [f"{k} = datetime('now')" if k in now_columns else f"{k} = ?" for k in columns]
+    sets.append("updated_at = datetime('now')")
+    return f"UPDATE {table} SET {', '.join(sets)} WHERE {where}"
+
+
+@lru_cache(maxsize=256)
+def _insert_sql(table: str, columns: tuple[str, ...]) -> str:
+    """Build the INSERT statement once per (table, column set) shape."""
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({_placeholders(columns)})"
+
+
+@lru_cache(maxsize=64)
+def _upsert_sql(table: str, key: str, columns: tuple[str, ...]) -> str:
+    """Build an (id, key, columns...) UPSERT on the table's unique key column
+    once per column set; it returns the row's id whether inserted or not."""
+    cols = ", ".join(("id", key) + columns)
+    marks = ", ".join("?" * (len(columns) + 2))
+    if columns:
+        sets = ", ".join(f"{k} = excluded.{k}" for k in columns) + ", updated_at = datetime('now')"
+    else:
+        sets = f"id = {table}.id"  # no-op; still RETURNs the existing id
+    return (
+        f"INSERT INTO {table} ({cols}) VALUES ({marks}) "
+        f"ON CONFLICT({key}) DO UPDATE SET {sets} RETURNING id"
+    )
+
+
+@lru_cache(maxsize=64)
+def _updatable_columns(table: str) -> frozenset[str]:
+    """Columns update_* may set on a table: everything but the key and the
+    timestamps the database maintains."""
+    with get_db() as conn:
+        rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return frozenset(r["name"] for r in rows) - {"id", "created_at", "updated_at"}
+
+
+def _update_row(table: str, kwargs: dict, where: str, *where_params) -> bool:
+    """UPDATE the given columns and stamp updated_at in the same statement.
+    dict/list values are stored as JSON; SQL_NOW values become datetime('now').
+    Raises ValueError for a column the table does not have."""
+    if not kwargs:
+        return False
+    kwargs.pop("updated_at", None)
+    unknown = kwargs.keys() - _updatable_columns(table)
+    if unknown:
+        raise ValueError(f"Cannot update {table}: unknown column(s) {', '.join(sorted(unknown))}")
+    # Sorted so the same column set maps to one cached statement whatever
+    # the keyword order at the call site
+    columns = tuple(sorted(kwargs))
+    now_columns = tuple(k for k in columns if kwargs[k] is SQL_NOW)
+    vals = [
+        json_dumps(v) if isinstance(v, (dict, list)) else v
+        for v in (kwargs[k] for k in columns) if v is not SQL_NOW
+    ]
+    sql = _update_sql(table, columns, now_columns, where)
+    with get_db() as conn:
+        conn.execute(sql, (*vals, *where_params))
+    return True
 
 
 # =========================================================================
@@ -34,40 +250,47 @@ def create_user(email: str, password_hash: str, display_name: str) -> str:
     return uid
 
 
-def get_user_by_id(user_id: str) -> Optional[User]:
+def _load_user(user_id: str) -> Optional[User]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
     return row_to_model(row, User)
 
 
+def get_user_by_id(user_id: str) -> Optional[User]:
+    # A copy, so callers cannot mutate the cached instance
+    return copy.copy(_user_cache.get(user_id, lambda: _load_user(user_id)))
+
+
+def get_users_by_ids(user_ids) -> dict[str, User]:
+    """Bulk user lookup in one query, keyed by id. Ids with no user are
+    absent from the result."""
+    user_ids = tuple(set(user_ids))
+    if not user_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT {_USER_COLUMNS} FROM users WHERE id IN ({_placeholders(user_ids)})",
+            user_ids,
+        ).fetchall()
+    return {u.id: u for u in rows_to_models(rows, User)}
+
+
 def get_user_by_email(email: str) -> Optional[User]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE email = ?", (email,)).fetchone()
     return row_to_model(row, User)
 
 
 def update_user(user_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v)
-    vals.append(user_id)
-    sql = f"UPDATE users SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    updated = _update_row("users", kwargs, "id = ?", user_id)
+    _user_cache.invalidate(user_id)
+    return updated
 
 
 def delete_user(user_id: str) -> bool:
     with get_db() as conn:
         conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    _user_cache.invalidate(user_id)
     return True
 
 
@@ -85,16 +308,35 @@ def create_verification_code(user_id: str, code: str, purpose: str, expires_at:
     return vid
 
 
-def get_valid_verification_code(user_id: str, code: str, purpose: str) -> Optional[dict]:
-    with get_db() as conn:
+def create_verification_code_limited(user_id: str, code: str, purpose: str, expires_at: str,
+                                    max_recent: int, minutes: int = 15) -> Optional[str]:
+    """create_verification_code, unless the user already has max_recent codes
+    for this purpose from the last `minutes`; then nothing is stored and
+    None is returned. Check and insert are one statement."""
+    with get_db(immediate=True) as conn:
         row = conn.execute(
+            """INSERT INTO email_verification_codes (id, user_id, code, purpose, expires_at)
+               SELECT ?, ?, ?, ?, ?
+               WHERE (SELECT COUNT(*) FROM email_verification_codes
+                      WHERE user_id = ? AND purpose = ?
+                      AND created_at > datetime('now', ? || ' minutes')) < ?
+               RETURNING id""",
+            (_new_id(), user_id, code, purpose, expires_at,
+             user_id, purpose, f"-{minutes}", max_recent),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def get_valid_verification_code(user_id: str, code: str, purpose: str) -> Optional[sqlite3.Row]:
+    """Return the matching unused code row (supports row["id"]), or None."""
+    with get_db() as conn:
+        return conn.execute(
             """SELECT * FROM email_verification_codes
                WHERE user_id = ? AND code = ? AND purpose = ?
                AND used_at IS NULL AND expires_at > datetime('now')
                ORDER BY created_at DESC LIMIT 1""",
             (user_id, code, purpose),
         ).fetchone()
-    return dict(row) if row else None
 
 
 def mark_verification_code_used(code_id: str) -> None:
@@ -108,12 +350,12 @@ def mark_verification_code_used(code_id: str) -> None:
 def count_recent_verification_codes(user_id: str, purpose: str, minutes: int = 15) -> int:
     with get_db() as conn:
         row = conn.execute(
-            """SELECT COUNT(*) as cnt FROM email_verification_codes
+            """SELECT COUNT(*) FROM email_verification_codes
                WHERE user_id = ? AND purpose = ?
                AND created_at > datetime('now', ? || ' minutes')""",
             (user_id, purpose, f"-{minutes}"),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 # =========================================================================
@@ -135,16 +377,27 @@ def create_session(user_id: str, session_token: str, expires_at: str,
 def get_session_by_token(token: str) -> Optional[UserSession]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM user_sessions WHERE session_token = ? AND expires_at > datetime('now')",
+            f"SELECT {_SESSION_COLUMNS} FROM user_sessions WHERE session_token = ? AND expires_at > datetime('now')",
             (token,),
         ).fetchone()
     return row_to_model(row, UserSession)
 
 
+def get_session_user_id(token: str) -> Optional[str]:
+    """user_id for a live session token, or None. Scalar fast path for
+    request authentication; use get_session_by_token for the full row."""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT user_id FROM user_sessions WHERE session_token = ? AND expires_at > datetime('now')",
+            (token,),
+        ).fetchone()
+    return row[0] if row else None
+
+
 def get_user_sessions(user_id: str) -> list[UserSession]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM user_sessions WHERE user_id = ? ORDER BY created_at DESC",
+            f"SELECT {_SESSION_COLUMNS} FROM user_sessions WHERE user_id = ? ORDER BY created_at DESC",
             (user_id,),
         ).fetchall()
     return rows_to_models(rows, UserSession)
@@ -173,20 +426,19 @@ def create_backup_codes(user_id: str, code_hashes: list[str]) -> None:
     with get_db() as conn:
         # Remove old codes first
         conn.execute("DELETE FROM backup_codes WHERE user_id = ?", (user_id,))
-        for h in code_hashes:
-            conn.execute(
-                "INSERT INTO backup_codes (id, user_id, code_hash) VALUES (?, ?, ?)",
-                (_new_id(), user_id, h),
-            )
+        conn.executemany(
+            "INSERT INTO backup_codes (id, user_id, code_hash) VALUES (?, ?, ?)",
+            [(_new_id(), user_id, h) for h in code_hashes],
+        )
 
 
-def get_unused_backup_code(user_id: str, code_hash: str) -> Optional[dict]:
+def get_unused_backup_code(user_id: str, code_hash: str) -> Optional[sqlite3.Row]:
+    """Return the matching unused backup code row (supports row["id"]), or None."""
     with get_db() as conn:
-        row = conn.execute(
+        return conn.execute(
             "SELECT * FROM backup_codes WHERE user_id = ? AND code_hash = ? AND used_at IS NULL",
             (user_id, code_hash),
         ).fetchone()
-    return dict(row) if row else None
 
 
 def mark_backup_code_used(code_id: str) -> None:
@@ -203,7 +455,7 @@ def mark_backup_code_used(code_id: str) -> None:
 
 def create_workspace(name: str, owner_id: str, tier: str = "free", description: str = "") -> str:
     wid = _new_id()
-    with get_db() as conn:
+    with get_db(immediate=True) as conn:
         conn.execute(
             "INSERT INTO workspaces (id, name, description, owner_id, tier) VALUES (?, ?, ?, ?, ?)",
             (wid, name, description, owner_id, tier),
@@ -216,12 +468,38 @@ def create_workspace(name: str, owner_id: str, tier: str = "free", description:
     return wid
 
 
-def get_workspace_by_id(workspace_id: str) -> Optional[Workspace]:
+def _load_workspace(workspace_id: str) -> Optional[Workspace]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
+        row = conn.execute(f"SELECT {_WORKSPACE_COLUMNS} FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
     return row_to_model(row, Workspace)
 
 
+def get_workspace_by_id(workspace_id: str) -> Optional[Workspace]:
+    # A copy, so callers cannot mutate the cached instance
+    return copy.copy(_workspace_cache.get(workspace_id, lambda: _load_workspace(workspace_id)))
+
+
+def get_workspaces_by_ids(workspace_ids) -> dict[str, Workspace]:
+    """Bulk workspace lookup in one query, keyed by id. Ids with no
+    workspace are absent from the result."""
+    workspace_ids = tuple(set(workspace_ids))
+    if not workspace_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT {_WORKSPACE_COLUMNS} FROM workspaces WHERE id IN ({_placeholders(workspace_ids)})",
+            workspace_ids,
+        ).fetchall()
+    return {w.id: w for w in rows_to_models(rows, Workspace)}
+
+
+def get_workspace_tier(workspace_id: str) -> Optional[str]:
+    """Tier of a workspace, or None if it does not exist."""
+    with get_db() as conn:
+        row = conn.execute("SELECT tier FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
+    return row[0] if row else None
+
+
 def get_workspaces_for_user(user_id: str) -> list[Workspace]:
     with get_db() as conn:
         rows = conn.execute(
@@ -234,30 +512,44 @@ def get_workspaces_for_user(user_id: str) -> list[Workspace]:
 
 
 def update_workspace(workspace_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v if not isinstance(v, dict) else json.dumps(v))
-    vals.append(workspace_id)
-    sql = f"UPDATE workspaces SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    updated = _update_row("workspaces", kwargs, "id = ?", workspace_id)
+    _workspace_cache.invalidate(workspace_id)
+    return updated
 
 
 def delete_workspace(workspace_id: str) -> bool:
     with get_db() as conn:
         conn.execute("DELETE FROM workspaces WHERE id = ?", (workspace_id,))
+    _workspace_cache.invalidate(workspace_id)
     return True
 
 
+# Dashboard totals come from the per-project counters; a NULL :user_id
+# yields 0 uploads_today.
+_WORKSPACE_OVERVIEW_SQL = """
+SELECT w.tier AS tier,
+       (SELECT COUNT(*) FROM workspace_members WHERE workspace_id = w.id) AS members,
+       (SELECT COUNT(*) FROM projects WHERE workspace_id = w.id) AS projects,
+       (SELECT COALESCE(SUM(dashboards_count), 0) FROM projects WHERE workspace_id = w.id) AS dashboards,
+       (SELECT COALESCE(SUM(files_total), 0) FROM projects WHERE workspace_id = w.id) AS files,
+       COALESCE((SELECT balance FROM workspace_balances WHERE workspace_id = w.id), 0) AS credits,
+       (SELECT COUNT(*) FROM uploaded_files
+        WHERE uploaded_by = :user_id
+          AND uploaded_at >= date('now') AND uploaded_at < date('now', '+1 day')) AS uploads_today
+FROM workspaces w WHERE w.id = :workspace_id
+"""
+
+
+def get_workspace_overview(workspace_id: str, user_id: str = None) -> Optional[dict]:
+    """Tier, member/project/dashboard/file counts, credit balance and (for
+    user_id) today's uploads in one query; None if the workspace is missing."""
+    with get_db() as conn:
+        row = conn.execute(
+            _WORKSPACE_OVERVIEW_SQL, {"workspace_id": workspace_id, "user_id": user_id},
+        ).fetchone()
+    return dict(row) if row else None
+
+
 # =========================================================================
 # Workspace Members
 # =========================================================================
@@ -275,7 +567,7 @@ def add_workspace_member(workspace_id: str, user_id: str, role: str, invited_by:
 def get_workspace_members(workspace_id: str) -> list[WorkspaceMember]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM workspace_members WHERE workspace_id = ? ORDER BY joined_at",
+            f"SELECT {_MEMBER_COLUMNS} FROM workspace_members WHERE workspace_id = ? ORDER BY joined_at",
             (workspace_id,),
         ).fetchall()
     return rows_to_models(rows, WorkspaceMember)
@@ -311,10 +603,10 @@ def remove_workspace_member(workspace_id: str, user_id: str) -> bool:
 def count_workspace_members(workspace_id: str) -> int:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT COUNT(*) as cnt FROM workspace_members WHERE workspace_id = ?",
+            "SELECT COUNT(*) FROM workspace_members WHERE workspace_id = ?",
             (workspace_id,),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 # =========================================================================
@@ -335,7 +627,7 @@ def create_invitation(workspace_id: str, email: str, role: str, invited_by: str,
 def get_invitation_by_token(token: str) -> Optional[WorkspaceInvitation]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM workspace_invitations WHERE token = ? AND status = 'pending' AND expires_at > datetime('now')",
+            f"SELECT {_INVITATION_COLUMNS} FROM workspace_invitations WHERE token = ? AND status = 'pending' AND expires_at > datetime('now')",
             (token,),
         ).fetchone()
     return row_to_model(row, WorkspaceInvitation)
@@ -344,7 +636,7 @@ def get_invitation_by_token(token: str) -> Optional[WorkspaceInvitation]:
 def get_pending_invitations(workspace_id: str) -> list[WorkspaceInvitation]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM workspace_invitations WHERE workspace_id = ? AND status = 'pending' ORDER BY created_at DESC",
+            f"SELECT {_INVITATION_COLUMNS} FROM workspace_invitations WHERE workspace_id = ? AND status = 'pending' ORDER BY created_at DESC",
             (workspace_id,),
         ).fetchall()
     return rows_to_models(rows, WorkspaceInvitation)
@@ -372,19 +664,26 @@ def revoke_invitation(invitation_id: str) -> None:
 
 def create_project(workspace_id: str, created_by: str, name: str,
                    description: str = "", instructions: str = "") -> str:
-    pid = _new_id()
+    return create_project_returning(workspace_id, created_by, name, description, instructions).id
+
+
+def create_project_returning(workspace_id: str, created_by: str, name: str,
+                             description: str = "", instructions: str = "") -> Project:
+    """create_project, returning the stored row (with its defaults) from the
+    INSERT itself instead of a follow-up SELECT."""
     with get_db() as conn:
-        conn.execute(
-            "INSERT INTO projects (id, workspace_id, created_by, name, description, instructions) VALUES (?, ?, ?, ?, ?, ?)",
-            (pid, workspace_id, created_by, name, description, instructions),
-        )
-    return pid
+        row = conn.execute(
+            f"""INSERT INTO projects (id, workspace_id, created_by, name, description, instructions)
+                VALUES (?, ?, ?, ?, ?, ?) RETURNING {_PROJECT_COLUMNS}""",
+            (_new_id(), workspace_id, created_by, name, description, instructions),
+        ).fetchone()
+    return row_to_model(row, Project)
 
 
 def get_projects_for_workspace(workspace_id: str) -> list[Project]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM projects WHERE workspace_id = ? ORDER BY created_at DESC",
+            f"SELECT {_PROJECT_COLUMNS} FROM projects WHERE workspace_id = ? ORDER BY created_at DESC",
             (workspace_id,),
         ).fetchall()
     return rows_to_models(rows, Project)
@@ -393,29 +692,14 @@ def get_projects_for_workspace(workspace_id: str) -> list[Project]:
 def get_project_by_id(project_id: str, workspace_id: str) -> Optional[Project]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM projects WHERE id = ? AND workspace_id = ?",
+            f"SELECT {_PROJECT_COLUMNS} FROM projects WHERE id = ? AND workspace_id = ?",
             (project_id, workspace_id),
         ).fetchone()
     return row_to_model(row, Project)
 
 
 def update_project(project_id: str, workspace_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v)
-    vals.extend([project_id, workspace_id])
-    sql = f"UPDATE projects SET {', '.join(sets)} WHERE id = ? AND workspace_id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("projects", kwargs, "id = ? AND workspace_id = ?", project_id, workspace_id)
 
 
 def delete_project(project_id: str, workspace_id: str) -> bool:
@@ -430,40 +714,78 @@ def delete_project(project_id: str, workspace_id: str) -> bool:
 
 def create_uploaded_file(project_id: str, uploaded_by: str, original_filename: str,
                          stored_filename: str, file_path: str, file_format: str,
-                         file_size_bytes: int) -> str:
+                         file_size_bytes: int, status: str = "success") -> str:
     fid = _new_id()
     with get_db() as conn:
         conn.execute(
             """INSERT INTO uploaded_files
-               (id, project_id, uploaded_by, original_filename, stored_filename, file_path, file_format, file_size_bytes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (fid, project_id, uploaded_by, original_filename, stored_filename, file_path, file_format, file_size_bytes),
+               (id, project_id, uploaded_by, original_filename, stored_filename, file_path, file_format,
+                file_size_bytes, status)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (fid, project_id, uploaded_by, original_filename, stored_filename, file_path, file_format,
+             file_size_bytes, status),
         )
     return fid
 
 
+_FILE_COLUMNS = """f.id, f.project_id, f.uploaded_by, f.original_filename, f.stored_filename,
+       f.file_path, f.file_format, f.file_size_bytes, f.row_count, f.column_count,
+       f.column_names, f.status, f.error_message, f.uploaded_at"""
+
+
 def get_files_for_project(project_id: str) -> list[UploadedFile]:
+    """List a project's files. data_profile is not loaded (always None);
+    use get_file_by_id when the profile is needed."""
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM uploaded_files WHERE project_id = ? ORDER BY uploaded_at DESC",
+            f"""SELECT {_FILE_COLUMNS}, NULL AS data_profile FROM uploaded_files f
+                WHERE f.project_id = ? ORDER BY f.uploaded_at DESC""",
             (project_id,),
         ).fetchall()
     return rows_to_models(rows, UploadedFile)
 
 
+def get_files_for_projects(project_ids: list[str]) -> dict[str, list[UploadedFile]]:
+    """Bulk get_files_for_project: one query for many projects, keyed by
+    project id."""
+    if not project_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT {_FILE_COLUMNS}, NULL AS data_profile FROM uploaded_files f
+                WHERE f.project_id IN ({_placeholders(project_ids)})
+                ORDER BY f.uploaded_at DESC""",
+            tuple(project_ids),
+        ).fetchall()
+    return _group_by(project_ids, rows_to_models(rows, UploadedFile), "project_id")
+
+
 def get_file_by_id(file_id: str) -> Optional[UploadedFile]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM uploaded_files WHERE id = ?", (file_id,)).fetchone()
+        row = conn.execute(
+            f"""SELECT {_FILE_COLUMNS}, fp.data_profile FROM uploaded_files f
+                LEFT JOIN file_profiles fp ON fp.file_id = f.id
+                WHERE f.id = ?""",
+            (file_id,),
+        ).fetchone()
     return row_to_model(row, UploadedFile)
 
 
 def update_file_profile(file_id: str, row_count: int, column_count: int,
-                         column_names: list[str], data_profile: dict) -> bool:
+                         column_names: list[str], data_profile: dict,
+                         status: str = None) -> bool:
+    """Store a file's profile; pass status to set it in the same transaction."""
     with get_db() as conn:
         conn.execute(
-            """UPDATE uploaded_files SET row_count = ?, column_count = ?,
-               column_names = ?, data_profile = ? WHERE id = ?""",
-            (row_count, column_count, json.dumps(column_names), json.dumps(data_profile), file_id),
+            """UPDATE uploaded_files SET row_count = ?, column_count = ?, column_names = ?,
+                      status = COALESCE(?, status)
+               WHERE id = ?""",
+            (row_count, column_count, json_dumps(column_names), status, file_id),
+        )
+        conn.execute(
+            """INSERT INTO file_profiles (file_id, data_profile) VALUES (?, ?)
+               ON CONFLICT(file_id) DO UPDATE SET data_profile = excluded.data_profile""",
+            (file_id, json_dumps(data_profile)),
         )
     return True
 
@@ -477,10 +799,11 @@ def delete_file(file_id: str) -> bool:
 def count_uploads_today(user_id: str) -> int:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT COUNT(*) as cnt FROM uploaded_files WHERE uploaded_by = ? AND date(uploaded_at) = date('now')",
+            """SELECT COUNT(*) FROM uploaded_files
+               WHERE uploaded_by = ? AND uploaded_at >= date('now') AND uploaded_at < date('now', '+1 day')""",
             (user_id,),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 # =========================================================================
@@ -488,47 +811,52 @@ def count_uploads_today(user_id: str) -> int:
 # =========================================================================
 
 def create_dashboard(project_id: str, created_by: str, name: str, description: str = "") -> str:
-    did = _new_id()
+    return create_dashboard_returning(project_id, created_by, name, description).id
+
+
+def create_dashboard_returning(project_id: str, created_by: str, name: str,
+                               description: str = "") -> Dashboard:
+    """create_dashboard, returning the stored row via RETURNING."""
     with get_db() as conn:
-        conn.execute(
-            "INSERT INTO dashboards (id, project_id, created_by, name, description) VALUES (?, ?, ?, ?, ?)",
-            (did, project_id, created_by, name, description),
-        )
-    return did
+        row = conn.execute(
+            f"""INSERT INTO dashboards (id, project_id, created_by, name, description)
+                VALUES (?, ?, ?, ?, ?) RETURNING {_DASHBOARD_COLUMNS}""",
+            (_new_id(), project_id, created_by, name, description),
+        ).fetchone()
+    return row_to_model(row, Dashboard)
 
 
 def get_dashboards_for_project(project_id: str) -> list[Dashboard]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM dashboards WHERE project_id = ? ORDER BY created_at DESC",
+            f"SELECT {_DASHBOARD_COLUMNS} FROM dashboards WHERE project_id = ? ORDER BY created_at DESC",
             (project_id,),
         ).fetchall()
     return rows_to_models(rows, Dashboard)
 
 
+def get_dashboards_for_projects(project_ids: list[str]) -> dict[str, list[Dashboard]]:
+    """Bulk get_dashboards_for_project: one query for many projects, keyed
+    by project id."""
+    if not project_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT {_DASHBOARD_COLUMNS} FROM dashboards WHERE project_id IN ({_placeholders(project_ids)}) "
+            "ORDER BY created_at DESC",
+            tuple(project_ids),
+        ).fetchall()
+    return _group_by(project_ids, rows_to_models(rows, Dashboard), "project_id")
+
+
 def get_dashboard_by_id(dashboard_id: str) -> Optional[Dashboard]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM dashboards WHERE id = ?", (dashboard_id,)).fetchone()
+        row = conn.execute(f"SELECT {_DASHBOARD_COLUMNS} FROM dashboards WHERE id = ?", (dashboard_id,)).fetchone()
     return row_to_model(row, Dashboard)
 
 
 def update_dashboard(dashboard_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v if not isinstance(v, (dict, list)) else json.dumps(v))
-    vals.append(dashboard_id)
-    sql = f"UPDATE dashboards SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("dashboards", kwargs, "id = ?", dashboard_id)
 
 
 def delete_dashboard(dashboard_id: str) -> bool:
@@ -538,14 +866,14 @@ def delete_dashboard(dashboard_id: str) -> bool:
 
 
 def count_dashboards_in_workspace(workspace_id: str) -> int:
+    # Sums the trigger-maintained per-project counters: one index range over
+    # the workspace's projects, no join to dashboards
     with get_db() as conn:
         row = conn.execute(
-            """SELECT COUNT(*) as cnt FROM dashboards d
-               JOIN projects p ON d.project_id = p.id
-               WHERE p.workspace_id = ?""",
+            "SELECT COALESCE(SUM(dashboards_count), 0) FROM projects WHERE workspace_id = ?",
             (workspace_id,),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 # =========================================================================
@@ -569,35 +897,83 @@ def create_chart(dashboard_id: str, file_id: str, title: str, user_prompt: str,
 def get_charts_for_dashboard(dashboard_id: str) -> list[Chart]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM charts WHERE dashboard_id = ? ORDER BY position_index",
+            f"SELECT {_CHART_COLUMNS} FROM charts WHERE dashboard_id = ? ORDER BY position_index",
             (dashboard_id,),
         ).fetchall()
     return rows_to_models(rows, Chart)
 
 
+def iter_charts_for_dashboard(dashboard_id: str) -> Iterator[Chart]:
+    """Like get_charts_for_dashboard, but streams rows and builds each Chart
+    only as it is consumed. Suited to single-pass exports, where holding
+    every chart's plotly_json at once is the main memory cost."""
+    return iter_models(
+        iter_query(f"SELECT {_CHART_COLUMNS} FROM charts WHERE dashboard_id = ? ORDER BY position_index",
+                   (dashboard_id,)),
+        Chart,
+    )
+
+
+def get_chart_summaries_for_dashboard(dashboard_id: str) -> list[sqlite3.Row]:
+    """Lightweight chart listing for API responses: only the summary columns,
+    as raw rows. Skips generated_code/plotly_json and model hydration."""
+    with get_db() as conn:
+        return conn.execute(
+            """SELECT id, title, chart_type, user_prompt, position_index, created_at
+               FROM charts WHERE dashboard_id = ? ORDER BY position_index""",
+            (dashboard_id,),
+        ).fetchall()
+
+
+def get_charts_for_dashboards(dashboard_ids: list[str]) -> dict[str, list[Chart]]:
+    """Bulk get_charts_for_dashboard: one query for many dashboards, keyed
+    by dashboard id."""
+    if not dashboard_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT {_CHART_COLUMNS} FROM charts WHERE dashboard_id IN ({_placeholders(dashboard_ids)}) "
+            "ORDER BY position_index",
+            tuple(dashboard_ids),
+        ).fetchall()
+    return _group_by(dashboard_ids, rows_to_models(rows, Chart), "dashboard_id")
+
+
+def count_charts_for_dashboards(dashboard_ids: list[str]) -> dict[str, int]:
+    """Chart count per dashboard id, without loading the charts."""
+    if not dashboard_ids:
+        return {}
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT dashboard_id, COUNT(*) FROM charts "
+            f"WHERE dashboard_id IN ({_placeholders(dashboard_ids)}) GROUP BY dashboard_id",
+            tuple(dashboard_ids),
+        ).fetchall()
+    counts = dict.fromkeys(dashboard_ids, 0)
+    counts.update({did: cnt for did, cnt in rows})
+    return counts
+
+
 def get_chart_by_id(chart_id: str) -> Optional[Chart]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM charts WHERE id = ?", (chart_id,)).fetchone()
+        row = conn.execute(f"SELECT {_CHART_COLUMNS} FROM charts WHERE id = ?", (chart_id,)).fetchone()
     return row_to_model(row, Chart)
 
 
-def update_chart(chart_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v if not isinstance(v, (dict, list)) else json.dumps(v))
-    vals.append(chart_id)
-    sql = f"UPDATE charts SET {', '.join(sets)} WHERE id = ?"
+_CHART_META_COLUMNS = _CHART_COLUMNS.replace(
+    "generated_code", "'' AS generated_code").replace("plotly_json", "NULL AS plotly_json")
+
+
+def get_chart_meta(chart_id: str) -> Optional[Chart]:
+    """get_chart_by_id without the large columns: generated_code is always
+    "" and plotly_json always None. Use get_chart_by_id to edit or render."""
     with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+        row = conn.execute(f"SELECT {_CHART_META_COLUMNS} FROM charts WHERE id = ?", (chart_id,)).fetchone()
+    return row_to_model(row, Chart)
+
+
+def update_chart(chart_id: str, **kwargs) -> bool:
+    return _update_row("charts", kwargs, "id = ?", chart_id)
 
 
 def delete_chart(chart_id: str) -> bool:
@@ -606,13 +982,25 @@ def delete_chart(chart_id: str) -> bool:
     return True
 
 
+@lru_cache(maxsize=64)
+def _reorder_charts_sql(n: int) -> str:
+    """One UPDATE that sets every chart's position from an (id, index)
+    VALUES table, built once per chart count."""
+    values = ", ".join(["(?, ?)"] * n)
+    return (
+        f"WITH ord(cid, idx) AS (VALUES {values}) "
+        "UPDATE charts SET position_index = (SELECT idx FROM ord WHERE cid = charts.id), "
+        "updated_at = datetime('now') "
+        "WHERE dashboard_id = ? AND id IN (SELECT cid FROM ord)"
+    )
+
+
 def reorder_charts(dashboard_id: str, chart_id_order: list[str]) -> bool:
+    if not chart_id_order:
+        return True
+    params = [v for idx, cid in enumerate(chart_id_order) for v in (cid, idx)]
     with get_db() as conn:
-        for idx, cid in enumerate(chart_id_order):
-            conn.execute(
-                "UPDATE charts SET position_index = ?, updated_at = datetime('now') WHERE id = ? AND dashboard_id = ?",
-                (idx, cid, dashboard_id),
-            )
+        conn.execute(_reorder_charts_sql(len(chart_id_order)), (*params, dashboard_id))
     return True
 
 
@@ -645,7 +1033,7 @@ def create_scheduled_report(
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (
                 rid, workspace_id, dashboard_id, created_by, name,
-                json.dumps(recipient_emails), frequency, send_time_utc,
+                json_dumps(recipient_emails), frequency, send_time_utc,
                 day_of_week, day_of_month,
                 1 if include_pdf else 0,
                 1 if include_excel else 0,
@@ -658,14 +1046,14 @@ def create_scheduled_report(
 
 def get_scheduled_report_by_id(report_id: str) -> Optional[ScheduledReport]:
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM scheduled_reports WHERE id = ?", (report_id,)).fetchone()
+        row = conn.execute(f"SELECT {_REPORT_COLUMNS} FROM scheduled_reports WHERE id = ?", (report_id,)).fetchone()
     return row_to_model(row, ScheduledReport)
 
 
 def get_scheduled_reports_for_workspace(workspace_id: str) -> list[ScheduledReport]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM scheduled_reports WHERE workspace_id = ? ORDER BY created_at DESC",
+            f"SELECT {_REPORT_COLUMNS} FROM scheduled_reports WHERE workspace_id = ? ORDER BY created_at DESC",
             (workspace_id,),
         ).fetchall()
     return rows_to_models(rows, ScheduledReport)
@@ -674,7 +1062,7 @@ def get_scheduled_reports_for_workspace(workspace_id: str) -> list[ScheduledRepo
 def get_due_scheduled_reports(now_utc: str, limit: int = 20) -> list[ScheduledReport]:
     with get_db() as conn:
         rows = conn.execute(
-            """SELECT * FROM scheduled_reports
+            f"""SELECT {_REPORT_COLUMNS} FROM scheduled_reports
                WHERE active = 1 AND next_run_at <= ?
                ORDER BY next_run_at ASC LIMIT ?""",
             (now_utc, limit),
@@ -683,27 +1071,7 @@ def get_due_scheduled_reports(now_utc: str, limit: int = 20) -> list[ScheduledRe
 
 
 def update_scheduled_report(report_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            if k == "recipient_emails" and isinstance(v, list):
-                vals.append(json.dumps(v))
-            elif isinstance(v, bool):
-                vals.append(1 if v else 0)
-            else:
-                vals.append(v if not isinstance(v, (dict, list)) else json.dumps(v))
-    vals.append(report_id)
-    sql = f"UPDATE scheduled_reports SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("scheduled_reports", kwargs, "id = ?", report_id)
 
 
 def mark_scheduled_report_sent(report_id: str, next_run_at: str) -> bool:
@@ -743,32 +1111,49 @@ def delete_scheduled_report(report_id: str) -> bool:
 
 def add_credit_entry(workspace_id: str, user_id: str, change_amount: int,
                      balance_after: int, reason: str, reference_id: str = None) -> str:
-    eid = _new_id()
+    eid = _new_ordered_id()
     with get_db() as conn:
         conn.execute(
             """INSERT INTO credit_ledger (id, workspace_id, user_id, change_amount, balance_after, reason, reference_id)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (eid, workspace_id, user_id, change_amount, balance_after, reason, reference_id),
         )
+        conn.execute(
+            """INSERT INTO workspace_balances (workspace_id, balance) VALUES (?, ?)
+               ON CONFLICT(workspace_id) DO UPDATE SET balance = excluded.balance""",
+            (workspace_id, balance_after),
+        )
     return eid
 
 
 def get_credit_balance(workspace_id: str) -> int:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT balance_after FROM credit_ledger WHERE workspace_id = ? ORDER BY rowid DESC LIMIT 1",
+            "SELECT balance FROM workspace_balances WHERE workspace_id = ?",
             (workspace_id,),
         ).fetchone()
-    return row["balance_after"] if row else 0
+    return row[0] if row else 0
 
 
 def get_credit_history(workspace_id: str, limit: int = 50) -> list[CreditLedgerEntry]:
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM credit_ledger WHERE workspace_id = ? ORDER BY created_at DESC LIMIT ?",
+        cursor = conn.execute(
+            f"SELECT {_LEDGER_COLUMNS} FROM credit_ledger WHERE workspace_id = ? ORDER BY created_at DESC LIMIT ?",
             (workspace_id, limit),
-        ).fetchall()
-    return rows_to_models(rows, CreditLedgerEntry)
+        )
+        return rows_to_models(cursor, CreditLedgerEntry)
+
+
+def iter_credit_history(workspace_id: str, batch_size: int = 256) -> Iterator[CreditLedgerEntry]:
+    """A workspace's whole ledger, newest first, streamed batch_size rows at
+    a time. For exports and other single passes over long histories."""
+    return iter_models(
+        iter_query(
+            f"SELECT {_LEDGER_COLUMNS} FROM credit_ledger WHERE workspace_id = ? ORDER BY created_at DESC",
+            (workspace_id,), batch_size,
+        ),
+        CreditLedgerEntry,
+    )
 
 
 # =========================================================================
@@ -790,29 +1175,14 @@ def create_subscription(workspace_id: str, tier: str, monthly_credit_allowance:
 def get_subscription(workspace_id: str) -> Optional[Subscription]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM subscriptions WHERE workspace_id = ? AND status = 'active' ORDER BY created_at DESC LIMIT 1",
+            f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE workspace_id = ? AND status = 'active' ORDER BY created_at DESC LIMIT 1",
             (workspace_id,),
         ).fetchone()
     return row_to_model(row, Subscription)
 
 
 def update_subscription(subscription_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v)
-    vals.append(subscription_id)
-    sql = f"UPDATE subscriptions SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("subscriptions", kwargs, "id = ?", subscription_id)
 
 
 # =========================================================================
@@ -848,29 +1218,14 @@ def create_add_on(workspace_id: str, add_on_type: str, stripe_subscription_id: s
 def get_add_on(workspace_id: str, add_on_type: str) -> Optional[AddOn]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM add_ons WHERE workspace_id = ? AND add_on_type = ? AND status = 'active'",
+            f"SELECT {_ADD_ON_COLUMNS} FROM add_ons WHERE workspace_id = ? AND add_on_type = ? AND status = 'active'",
             (workspace_id, add_on_type),
         ).fetchone()
     return row_to_model(row, AddOn)
 
 
 def update_add_on(add_on_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v)
-    vals.append(add_on_id)
-    sql = f"UPDATE add_ons SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("add_ons", kwargs, "id = ?", add_on_id)
 
 
 # =========================================================================
@@ -880,41 +1235,23 @@ def update_add_on(add_on_id: str, **kwargs) -> bool:
 def get_branding(workspace_id: str) -> Optional[WorkspaceBranding]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM workspace_branding WHERE workspace_id = ?",
+            f"SELECT {_BRANDING_COLUMNS} FROM workspace_branding WHERE workspace_id = ?",
             (workspace_id,),
         ).fetchone()
     return row_to_model(row, WorkspaceBranding)
 
 
 def upsert_branding(workspace_id: str, **kwargs) -> str:
-    existing = get_branding(workspace_id)
-    if existing:
-        if not kwargs:
-            return existing.id
-        kwargs["updated_at"] = "datetime('now')"
-        sets = []
-        vals = []
-        for k, v in kwargs.items():
-            if v == "datetime('now')":
-                sets.append(f"{k} = datetime('now')")
-            else:
-                sets.append(f"{k} = ?")
-                vals.append(v if not isinstance(v, (dict, list)) else json.dumps(v))
-        vals.append(workspace_id)
-        sql = f"UPDATE workspace_branding SET {', '.join(sets)} WHERE workspace_id = ?"
-        with get_db() as conn:
-            conn.execute(sql, tuple(vals))
-        return existing.id
-    else:
-        bid = _new_id()
-        with get_db() as conn:
-            conn.execute(
-                "INSERT INTO workspace_branding (id, workspace_id) VALUES (?, ?)",
-                (bid, workspace_id),
-            )
-        if kwargs:
-            return upsert_branding(workspace_id, **kwargs)
-        return bid
+    """Create or update a workspace's branding in one statement; returns its id.
+    dict/list values are stored as JSON."""
+    kwargs.pop("updated_at", None)
+    columns = tuple(sorted(kwargs))
+    vals = [json_dumps(v) if isinstance(v, (dict, list)) else v for v in (kwargs[k] for k in columns)]
+    with get_db() as conn:
+        row = conn.execute(
+            _upsert_sql("workspace_branding", "workspace_id", columns), (_new_id(), workspace_id, *vals),
+        ).fetchone()
+    return row[0]
 
 
 # =========================================================================
@@ -928,24 +1265,42 @@ def create_api_key(workspace_id: str, created_by: str, key_hash: str,
         conn.execute(
             """INSERT INTO api_keys (id, workspace_id, created_by, key_hash, key_prefix, name, permissions)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (kid, workspace_id, created_by, key_hash, key_prefix, name, json.dumps(permissions)),
+            (kid, workspace_id, created_by, key_hash, key_prefix, name, json_dumps(permissions)),
         )
     return kid
 
 
 def get_api_keys_for_workspace(workspace_id: str) -> list[ApiKey]:
+    flush_writes()
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM api_keys WHERE workspace_id = ? AND revoked_at IS NULL ORDER BY created_at DESC",
+            f"SELECT {_API_KEY_COLUMNS} FROM api_keys WHERE workspace_id = ? AND revoked_at IS NULL ORDER BY created_at DESC",
             (workspace_id,),
         ).fetchall()
     return rows_to_models(rows, ApiKey)
 
 
+def get_api_key_hash_by_prefix(key_prefix: str) -> Optional[tuple[str, str]]:
+    """(id, key_hash) of the active key with this prefix, or None. Lets the
+    auth check compare hashes before hydrating the full ApiKey."""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT id, key_hash FROM api_keys WHERE key_prefix = ? AND revoked_at IS NULL",
+            (key_prefix,),
+        ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def get_api_key_by_id(key_id: str) -> Optional[ApiKey]:
+    with get_db() as conn:
+        row = conn.execute(f"SELECT {_API_KEY_COLUMNS} FROM api_keys WHERE id = ?", (key_id,)).fetchone()
+    return row_to_model(row, ApiKey)
+
+
 def get_api_key_by_prefix(key_prefix: str) -> Optional[ApiKey]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM api_keys WHERE key_prefix = ? AND revoked_at IS NULL",
+            f"SELECT {_API_KEY_COLUMNS} FROM api_keys WHERE key_prefix = ? AND revoked_at IS NULL",
             (key_prefix,),
         ).fetchone()
     return row_to_model(row, ApiKey)
@@ -961,11 +1316,9 @@ def revoke_api_key(key_id: str) -> bool:
 
 
 def update_api_key_last_used(key_id: str) -> None:
-    with get_db() as conn:
-        conn.execute(
-            "UPDATE api_keys SET last_used_at = datetime('now') WHERE id = ?",
-            (key_id,),
-        )
+    # Stamped on every API request; at most one UPDATE per key per second
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    coalesce_write("UPDATE api_keys SET last_used_at = ? WHERE id = ?", key_id, now, max)
 
 
 # =========================================================================
@@ -976,26 +1329,29 @@ def save_prompt_history(user_id: str, workspace_id: str, project_id: str,
                          prompt_text: str, file_id: str = None,
                          response_code: str = None, response_error: str = None,
                          tokens_used: int = 0, model_used: str = "") -> str:
-    pid = _new_id()
-    with get_db() as conn:
-        conn.execute(
-            """INSERT INTO prompt_history
-               (id, user_id, workspace_id, project_id, file_id, prompt_text, response_code, response_error, tokens_used, model_used)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (pid, user_id, workspace_id, project_id, file_id, prompt_text, response_code, response_error, tokens_used, model_used),
-        )
+    """Queue a prompt history row and return its id. The row is committed
+    in the background; every prompt_history reader flushes pending rows
+    first (explicitly, or through get_read_db())."""
+    pid = _new_ordered_id()
+    enqueue_write(
+        """INSERT INTO prompt_history
+           (id, user_id, workspace_id, project_id, file_id, prompt_text, response_code, response_error, tokens_used, model_used)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (pid, user_id, workspace_id, project_id, file_id, prompt_text, response_code, response_error, tokens_used, model_used),
+    )
     return pid
 
 
-def get_prompt_history(workspace_id: str, project_id: str, limit: int = 50) -> list[PromptHistoryEntry]:
+def get_prompt_history(workspace_id: str, project_id: str, limit: int = 50,
+                       after_created_at: str = None, after_id: str = None) -> list[PromptHistoryEntry]:
+    """A project's prompts, newest first. Pass the last entry's created_at
+    and id to get the page after it."""
+    flush_writes()
+    sql, page_params = _page_sql("prompt_history", _PROMPT_HISTORY_COLUMNS, after_created_at, after_id,
+                                 "workspace_id = ? AND project_id = ?")
     with get_db() as conn:
-        rows = conn.execute(
-            """SELECT * FROM prompt_history
-               WHERE workspace_id = ? AND project_id = ?
-               ORDER BY created_at DESC LIMIT ?""",
-            (workspace_id, project_id, limit),
-        ).fetchall()
-    return rows_to_models(rows, PromptHistoryEntry)
+        cursor = conn.execute(sql, (workspace_id, project_id, *page_params, limit, 0))
+        return rows_to_models(cursor, PromptHistoryEntry)
 
 
 # =========================================================================
@@ -1004,48 +1360,40 @@ def get_prompt_history(workspace_id: str, project_id: str, limit: int = 50) -> l
 
 def create_prompt_template(project_id: str, created_by: str, name: str,
                            prompt_text: str, category: str = "") -> str:
-    tid = _new_id()
+    return create_prompt_template_returning(project_id, created_by, name, prompt_text, category).id
+
+
+def create_prompt_template_returning(project_id: str, created_by: str, name: str,
+                                     prompt_text: str, category: str = "") -> PromptTemplate:
+    """create_prompt_template, returning the stored row via RETURNING."""
     with get_db() as conn:
-        conn.execute(
-            """INSERT INTO prompt_templates (id, project_id, created_by, name, prompt_text, category)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (tid, project_id, created_by, name, prompt_text, category),
-        )
-    return tid
+        row = conn.execute(
+            f"""INSERT INTO prompt_templates (id, project_id, created_by, name, prompt_text, category)
+                VALUES (?, ?, ?, ?, ?, ?) RETURNING {_TEMPLATE_COLUMNS}""",
+            (_new_id(), project_id, created_by, name, prompt_text, category),
+        ).fetchone()
+    return row_to_model(row, PromptTemplate)
 
 
 def get_prompt_templates_for_project(project_id: str) -> list[PromptTemplate]:
+    flush_writes()
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM prompt_templates WHERE project_id = ? ORDER BY usage_count DESC, name",
+            f"SELECT {_TEMPLATE_COLUMNS} FROM prompt_templates WHERE project_id = ? ORDER BY usage_count DESC, name",
             (project_id,),
         ).fetchall()
     return rows_to_models(rows, PromptTemplate)
 
 
 def get_prompt_template_by_id(template_id: str) -> Optional[PromptTemplate]:
+    flush_writes()
     with get_db() as conn:
-        row = conn.execute("SELECT * FROM prompt_templates WHERE id = ?", (template_id,)).fetchone()
+        row = conn.execute(f"SELECT {_TEMPLATE_COLUMNS} FROM prompt_templates WHERE id = ?", (template_id,)).fetchone()
     return row_to_model(row, PromptTemplate)
 
 
 def update_prompt_template(template_id: str, **kwargs) -> bool:
-    if not kwargs:
-        return False
-    kwargs["updated_at"] = "datetime('now')"
-    sets = []
-    vals = []
-    for k, v in kwargs.items():
-        if v == "datetime('now')":
-            sets.append(f"{k} = datetime('now')")
-        else:
-            sets.append(f"{k} = ?")
-            vals.append(v)
-    vals.append(template_id)
-    sql = f"UPDATE prompt_templates SET {', '.join(sets)} WHERE id = ?"
-    with get_db() as conn:
-        conn.execute(sql, tuple(vals))
-    return True
+    return _update_row("prompt_templates", kwargs, "id = ?", template_id)
 
 
 def delete_prompt_template(template_id: str) -> bool:
@@ -1055,11 +1403,11 @@ def delete_prompt_template(template_id: str) -> bool:
 
 
 def increment_template_usage(template_id: str) -> None:
-    with get_db() as conn:
-        conn.execute(
-            "UPDATE prompt_templates SET usage_count = usage_count + 1 WHERE id = ?",
-            (template_id,),
-        )
+    # Counted in memory and applied as one UPDATE per template per second
+    coalesce_write(
+        "UPDATE prompt_templates SET usage_count = usage_count + ? WHERE id = ?",
+        template_id, 1, operator.add,
+    )
 
 
 # =========================================================================
@@ -1074,12 +1422,12 @@ def get_credits_used_in_range(workspace_id: str, start_date: str, end_date: str,
     if user_id:
         user_filter = "AND user_id = ?"
         params.append(user_id)
-    with get_db() as conn:
+    with get_read_db() as conn:
         row = conn.execute(
             f"""SELECT COALESCE(SUM(ABS(change_amount)), 0) as total
                 FROM credit_ledger
                 WHERE workspace_id = ? AND change_amount < 0
-                  AND date(created_at) >= ? AND date(created_at) <= ?
+                  AND created_at >= ? AND created_at < date(?, '+1 day')
                   {user_filter}""",
             tuple(params),
         ).fetchone()
@@ -1097,15 +1445,15 @@ def get_analyses_count_in_range(workspace_id: str, start_date: str, end_date: st
     if user_id:
         filters += " AND user_id = ?"
         params.append(user_id)
-    with get_db() as conn:
+    with get_read_db() as conn:
         row = conn.execute(
-            f"""SELECT COUNT(*) as cnt FROM prompt_history
+            f"""SELECT COUNT(*) FROM prompt_history
                 WHERE workspace_id = ?
-                  AND date(created_at) >= ? AND date(created_at) <= ?
+                  AND created_at >= ? AND created_at < date(?, '+1 day')
                   {filters}""",
             tuple(params),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 def get_dashboards_created_in_range(workspace_id: str, start_date: str, end_date: str,
@@ -1119,16 +1467,16 @@ def get_dashboards_created_in_range(workspace_id: str, start_date: str, end_date
     if user_id:
         filters += " AND d.created_by = ?"
         params.append(user_id)
-    with get_db() as conn:
+    with get_read_db() as conn:
         row = conn.execute(
-            f"""SELECT COUNT(*) as cnt FROM dashboards d
+            f"""SELECT COUNT(*) FROM dashboards d
                 JOIN projects p ON d.project_id = p.id
                 WHERE p.workspace_id = ?
-                  AND date(d.created_at) >= ? AND date(d.created_at) <= ?
+                  AND d.created_at >= ? AND d.created_at < date(?, '+1 day')
                   {filters}""",
             tuple(params),
         ).fetchone()
-    return row["cnt"]
+    return row[0]
 
 
 def get_credit_usage_by_day(workspace_id: str, start_date: str, end_date: str,
@@ -1139,19 +1487,19 @@ def get_credit_usage_by_day(workspace_id: str, start_date: str, end_date: str,
     if user_id:
         user_filter = "AND user_id = ?"
         params.append(user_id)
-    with get_db() as conn:
-        rows = conn.execute(
+    with get_read_db() as conn:
+        cursor = conn.execute(
             f"""SELECT date(created_at) as date,
                        SUM(ABS(change_amount)) as credits_used
                 FROM credit_ledger
                 WHERE workspace_id = ? AND change_amount < 0
-                  AND date(created_at) >= ? AND date(created_at) <= ?
+                  AND created_at >= ? AND created_at < date(?, '+1 day')
                   {user_filter}
                 GROUP BY date(created_at)
                 ORDER BY date(created_at)""",
             tuple(params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+        )
+        return _rows_to_dicts(cursor)
 
 
 def get_analyses_by_day(workspace_id: str, start_date: str, end_date: str,
@@ -1165,44 +1513,62 @@ def get_analyses_by_day(workspace_id: str, start_date: str, end_date: str,
     if user_id:
         filters += " AND user_id = ?"
         params.append(user_id)
-    with get_db() as conn:
-        rows = conn.execute(
+    with get_read_db() as conn:
+        cursor = conn.execute(
             f"""SELECT date(created_at) as date,
                        COUNT(*) as analysis_count
                 FROM prompt_history
                 WHERE workspace_id = ?
-                  AND date(created_at) >= ? AND date(created_at) <= ?
+                  AND created_at >= ? AND created_at < date(?, '+1 day')
                   {filters}
                 GROUP BY date(created_at)
                 ORDER BY date(created_at)""",
             tuple(params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+        )
+        return _rows_to_dicts(cursor)
 
 
 def get_token_usage_by_project(workspace_id: str, start_date: str, end_date: str,
                                user_id: str = None) -> list[dict]:
-    """Token usage grouped by project within a date range."""
-    params: list = [workspace_id, start_date, end_date]
-    user_filter = ""
-    if user_id:
-        user_filter = "AND ph.user_id = ?"
-        params.append(user_id)
-    with get_db() as conn:
-        rows = conn.execute(
-            f"""SELECT p.name as project_name, p.id as project_id,
-                       SUM(ph.tokens_used) as total_tokens,
-                       COUNT(*) as analysis_count
-                FROM prompt_history ph
-                JOIN projects p ON ph.project_id = p.id
-                WHERE ph.workspace_id = ?
-                  AND date(ph.created_at) >= ? AND date(ph.created_at) <= ?
-                  {user_filter}
-                GROUP BY ph.project_id
+    """Token usage grouped by project within a date range.
+
+    Complete days come from daily_project_tokens; days after the last
+    refresh_daily_rollups() run are aggregated from prompt_history.
+    """
+    user_filter = "AND user_id = ?" if user_id else ""
+    user_params = (user_id,) if user_id else ()
+    params = (
+        (workspace_id, start_date, end_date) + user_params
+        + (workspace_id, start_date, end_date) + user_params
+    )
+    with get_read_db() as conn:
+        cursor = conn.execute(
+            f"""WITH w AS (
+                    SELECT COALESCE((SELECT through_day FROM rollup_state
+                                     WHERE name = 'daily'), '0001-01-01') AS through
+                ),
+                t AS (
+                    SELECT project_id, tokens, count
+                    FROM daily_project_tokens, w
+                    WHERE workspace_id = ? AND day >= date(?) AND day <= date(?)
+                      AND day <= w.through {user_filter}
+                    UNION ALL
+                    SELECT project_id, tokens_used, 1
+                    FROM prompt_history, w
+                    WHERE workspace_id = ?
+                      AND created_at >= max(?, date(w.through, '+1 day'))
+                      AND created_at < date(?, '+1 day') {user_filter}
+                )
+                SELECT p.name as project_name, p.id as project_id,
+                       SUM(t.tokens) as total_tokens,
+                       SUM(t.count) as analysis_count
+                FROM t
+                JOIN projects p ON t.project_id = p.id
+                GROUP BY t.project_id
                 ORDER BY total_tokens DESC""",
-            tuple(params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+            params,
+        )
+        return _rows_to_dicts(cursor)
 
 
 def get_uploads_in_range(workspace_id: str, start_date: str, end_date: str,
@@ -1216,42 +1582,60 @@ def get_uploads_in_range(workspace_id: str, start_date: str, end_date: str,
     if user_id:
         filters += " AND f.uploaded_by = ?"
         params.append(user_id)
-    with get_db() as conn:
-        rows = conn.execute(
+    with get_read_db() as conn:
+        cursor = conn.execute(
             f"""SELECT f.id, f.original_filename, f.file_format, f.file_size_bytes,
                        f.row_count, f.uploaded_at, p.name as project_name
                 FROM uploaded_files f
                 JOIN projects p ON f.project_id = p.id
                 WHERE p.workspace_id = ?
-                  AND date(f.uploaded_at) >= ? AND date(f.uploaded_at) <= ?
+                  AND f.uploaded_at >= ? AND f.uploaded_at < date(?, '+1 day')
                   {filters}
                 ORDER BY f.uploaded_at DESC""",
             tuple(params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+        )
+        return _rows_to_dicts(cursor)
 
 
 def get_file_format_distribution(workspace_id: str, start_date: str, end_date: str,
                                  project_id: str = None) -> list[dict]:
-    """File format distribution within a date range."""
-    params: list = [workspace_id, start_date, end_date]
-    filters = ""
-    if project_id:
-        filters += " AND f.project_id = ?"
-        params.append(project_id)
-    with get_db() as conn:
-        rows = conn.execute(
-            f"""SELECT f.file_format, COUNT(*) as count
-                FROM uploaded_files f
-                JOIN projects p ON f.project_id = p.id
-                WHERE p.workspace_id = ?
-                  AND date(f.uploaded_at) >= ? AND date(f.uploaded_at) <= ?
-                  {filters}
-                GROUP BY f.file_format
+    """File format distribution within a date range.
+
+    Complete days come from daily_file_formats; days after the last
+    refresh_daily_rollups() run are counted from uploaded_files.
+    """
+    rollup_filter = "AND project_id = ?" if project_id else ""
+    live_filter = "AND f.project_id = ?" if project_id else ""
+    project_params = (project_id,) if project_id else ()
+    params = (
+        (workspace_id, start_date, end_date) + project_params
+        + (workspace_id, start_date, end_date) + project_params
+    )
+    with get_read_db() as conn:
+        cursor = conn.execute(
+            f"""WITH w AS (
+                    SELECT COALESCE((SELECT through_day FROM rollup_state
+                                     WHERE name = 'daily'), '0001-01-01') AS through
+                )
+                SELECT file_format, SUM(count) as count
+                FROM (
+                    SELECT file_format, count
+                    FROM daily_file_formats, w
+                    WHERE workspace_id = ? AND day >= date(?) AND day <= date(?)
+                      AND day <= w.through {rollup_filter}
+                    UNION ALL
+                    SELECT f.file_format, 1
+                    FROM w, uploaded_files f
+                    JOIN projects p ON f.project_id = p.id
+                    WHERE p.workspace_id = ?
+                      AND f.uploaded_at >= max(?, date(w.through, '+1 day'))
+                      AND f.uploaded_at < date(?, '+1 day') {live_filter}
+                )
+                GROUP BY file_format
                 ORDER BY count DESC""",
-            tuple(params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+            params,
+        )
+        return _rows_to_dicts(cursor)
 
 
 def get_recent_activity(workspace_id: str, start_date: str, end_date: str,
@@ -1271,74 +1655,154 @@ def get_recent_activity(workspace_id: str, start_date: str, end_date: str,
         prompt_filter += " AND project_id = ?"
         prompt_params.append(project_id)
 
-    combined_params = credit_params + prompt_params + [limit]
-    with get_db() as conn:
-        rows = conn.execute(
-            f"""SELECT 'credit' as activity_type, reason as description,
-                       change_amount as detail_value, user_id, created_at
-                FROM credit_ledger
-                WHERE workspace_id = ?
-                  AND date(created_at) >= ? AND date(created_at) <= ?
-                  {credit_filter}
+    # Each branch stops after `limit` rows of a reverse scan on its
+    # (workspace_id, created_at) index; only those 2 * limit rows are merged.
+    combined_params = credit_params + [limit] + prompt_params + [limit, limit]
+    with get_read_db() as conn:
+        cursor = conn.execute(
+            f"""SELECT * FROM (
+                    SELECT 'credit' as activity_type, reason as description,
+                           change_amount as detail_value, user_id, created_at
+                    FROM credit_ledger
+                    WHERE workspace_id = ?
+                      AND created_at >= ? AND created_at < date(?, '+1 day')
+                      {credit_filter}
+                    ORDER BY created_at DESC LIMIT ?)
                 UNION ALL
-                SELECT 'analysis' as activity_type,
-                       SUBSTR(prompt_text, 1, 80) as description,
-                       tokens_used as detail_value, user_id, created_at
-                FROM prompt_history
-                WHERE workspace_id = ?
-                  AND date(created_at) >= ? AND date(created_at) <= ?
-                  {prompt_filter}
+                SELECT * FROM (
+                    SELECT 'analysis' as activity_type,
+                           SUBSTR(prompt_text, 1, 80) as description,
+                           tokens_used as detail_value, user_id, created_at
+                    FROM prompt_history
+                    WHERE workspace_id = ?
+                      AND created_at >= ? AND created_at < date(?, '+1 day')
+                      {prompt_filter}
+                    ORDER BY created_at DESC LIMIT ?)
                 ORDER BY created_at DESC
                 LIMIT ?""",
             tuple(combined_params),
-        ).fetchall()
-    return [dict(r) for r in rows]
+        )
+        return _rows_to_dicts(cursor)
+
+
+# A NULL :project_id / :user_id disables that filter, so every filter
+# combination shares one statement. The per-day and per-project series come
+# back as JSON arrays in the same row.
+_USAGE_SUMMARY_SQL = """
+WITH ledger AS (
+    SELECT date(created_at) AS day, -change_amount AS used
+    FROM credit_ledger
+    WHERE workspace_id = :workspace_id AND change_amount < 0
+      AND created_at >= :start AND created_at < date(:end, '+1 day')
+      AND (:user_id IS NULL OR user_id = :user_id)
+), prompts AS (
+    SELECT date(created_at) AS day, project_id, tokens_used
+    FROM prompt_history
+    WHERE workspace_id = :workspace_id
+      AND created_at >= :start AND created_at < date(:end, '+1 day')
+      AND (:user_id IS NULL OR user_id = :user_id)
+), project_prompts AS (
+    SELECT day FROM prompts WHERE :project_id IS NULL OR project_id = :project_id
+)
+SELECT
+    (SELECT COALESCE(SUM(used), 0) FROM ledger) AS credits_used,
+    (SELECT COUNT(*) FROM project_prompts) AS analyses_run,
+    (SELECT COUNT(*) FROM dashboards d JOIN projects p ON d.project_id = p.id
+     WHERE p.workspace_id = :workspace_id
+       AND d.created_at >= :start AND d.created_at < date(:end, '+1 day')
+       AND (:project_id IS NULL OR d.project_id = :project_id)
+       AND (:user_id IS NULL OR d.created_by = :user_id)) AS dashboards_created,
+    (SELECT COUNT(*) FROM uploaded_files f JOIN projects p ON f.project_id = p.id
+     WHERE p.workspace_id = :workspace_id
+       AND f.uploaded_at >= :start AND f.uploaded_at < date(:end, '+1 day')
+       AND (:project_id IS NULL OR f.project_id = :project_id)
+       AND (:user_id IS NULL OR f.uploaded_by = :user_id)) AS files_uploaded,
+    (SELECT json_group_array(json_object('date', day, 'credits_used', used))
+     FROM (SELECT day, SUM(used) AS used FROM ledger GROUP BY day ORDER BY day)
+    ) AS credit_usage_by_day,
+    (SELECT json_group_array(json_object('date', day, 'analysis_count', n))
+     FROM (SELECT day, COUNT(*) AS n FROM project_prompts GROUP BY day ORDER BY day)
+    ) AS analyses_by_day,
+    (SELECT json_group_array(json_object('project_name', name, 'project_id', id,
+                                         'total_tokens', total, 'analysis_count', n))
+     FROM (SELECT p.name, p.id, SUM(pr.tokens_used) AS total, COUNT(*) AS n
+           FROM prompts pr JOIN projects p ON pr.project_id = p.id
+           GROUP BY pr.project_id ORDER BY total DESC)
+    ) AS token_usage_by_project
+"""
+
+
+def get_usage_summary(workspace_id: str, start_date: str, end_date: str,
+                      project_id: str = None, user_id: str = None) -> UsageSummary:
+    """Every usage-page aggregate in one round-trip. Filters apply as in the
+    single-metric functions above: credits and token usage by project ignore
+    project_id, everything else honours both filters."""
+    params = {"workspace_id": workspace_id, "start": start_date, "end": end_date,
+              "project_id": project_id, "user_id": user_id}
+    with get_read_db() as conn:
+        row = conn.execute(_USAGE_SUMMARY_SQL, params).fetchone()
+    return row_to_model(row, UsageSummary)
 
 
 # =========================================================================
 # Admin Queries (global — no workspace scoping)
 # =========================================================================
 
-def get_all_users(limit: int = 100, offset: int = 0) -> list[User]:
+# The get_all_* lists page by keyset: pass the last row's (created_at, id)
+# as after_created_at / after_id to fetch the next page with one index seek.
+# offset still works, but costs a scan of every skipped row.
+def _page_sql(table: str, columns: str, after_created_at: Optional[str],
+              after_id: Optional[str], where: str = "1=1") -> tuple[str, tuple]:
+    params: tuple = ()
+    if after_created_at is not None:
+        where += " AND (created_at, id) < (?, ?)"
+        params = (after_created_at, after_id)
+    sql = (f"SELECT {columns} FROM {table} WHERE {where} "
+           "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?")
+    return sql, params
+
+
+def get_all_users(limit: int = 100, offset: int = 0, after_created_at: str = None,
+                  after_id: str = None) -> list[User]:
+    sql, params = _page_sql("users", _USER_COLUMNS, after_created_at, after_id)
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (limit, offset),
-        ).fetchall()
-    return rows_to_models(rows, User)
+        cursor = conn.execute(sql, (*params, limit, offset))
+        return rows_to_models(cursor, User)
 
 
-def count_all_users() -> int:
+def _get_counter(name: str) -> int:
+    """Read a trigger-maintained total from global_counters."""
     with get_db() as conn:
-        row = conn.execute("SELECT COUNT(*) as cnt FROM users").fetchone()
-    return row["cnt"]
+        row = conn.execute("SELECT value FROM global_counters WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
 
 
-def get_all_workspaces(limit: int = 100, offset: int = 0) -> list[Workspace]:
+def count_all_users() -> int:
+    return _get_counter("users")
+
+
+def get_all_workspaces(limit: int = 100, offset: int = 0, after_created_at: str = None,
+                       after_id: str = None) -> list[Workspace]:
+    sql, params = _page_sql("workspaces", _WORKSPACE_COLUMNS, after_created_at, after_id)
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM workspaces ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (limit, offset),
-        ).fetchall()
-    return rows_to_models(rows, Workspace)
+        cursor = conn.execute(sql, (*params, limit, offset))
+        return rows_to_models(cursor, Workspace)
 
 
 def count_all_workspaces() -> int:
-    with get_db() as conn:
-        row = conn.execute("SELECT COUNT(*) as cnt FROM workspaces").fetchone()
-    return row["cnt"]
+    return _get_counter("workspaces")
 
 
 def get_all_subscriptions(status: str = None) -> list[Subscription]:
     with get_db() as conn:
         if status:
             rows = conn.execute(
-                "SELECT * FROM subscriptions WHERE status = ? ORDER BY created_at DESC",
+                f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE status = ? ORDER BY created_at DESC",
                 (status,),
             ).fetchall()
         else:
             rows = conn.execute(
-                "SELECT * FROM subscriptions ORDER BY created_at DESC"
+                f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions ORDER BY created_at DESC"
             ).fetchall()
     return rows_to_models(rows, Subscription)
 
@@ -1346,58 +1810,69 @@ def get_all_subscriptions(status: str = None) -> list[Subscription]:
 def count_subscriptions_by_tier() -> dict:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT tier, COUNT(*) as cnt FROM subscriptions WHERE status = 'active' GROUP BY tier"
+            "SELECT tier, COUNT(*) FROM subscriptions WHERE status = 'active' GROUP BY tier"
         ).fetchall()
-    return {row["tier"]: row["cnt"] for row in rows}
+    return {tier: cnt for tier, cnt in rows}
 
 
 def get_total_credits_consumed() -> int:
-    with get_db() as conn:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(ABS(change_amount)), 0) as total FROM credit_ledger WHERE change_amount < 0"
-        ).fetchone()
-    return row["total"]
+    return _get_counter("credits_consumed")
 
 
 def get_total_api_calls() -> int:
-    with get_db() as conn:
-        row = conn.execute("SELECT COUNT(*) as cnt FROM prompt_history").fetchone()
-    return row["cnt"]
+    flush_writes()
+    return _get_counter("api_calls")
 
 
 def get_total_revenue_cents() -> int:
+    return _get_counter("revenue_cents")
+
+
+def get_global_counters() -> dict[str, int]:
+    """Every trigger-maintained total in one query, keyed by counter name
+    (users, workspaces, api_calls, credits_consumed, revenue_cents)."""
+    flush_writes()
     with get_db() as conn:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(amount_paid_cents), 0) as total FROM credit_purchases"
-        ).fetchone()
-    return row["total"]
+        return dict(conn.execute("SELECT name, value FROM global_counters").fetchall())
 
 
 def get_all_credit_purchases(limit: int = 100) -> list[CreditPurchase]:
     with get_db() as conn:
         rows = conn.execute(
-            "SELECT * FROM credit_purchases ORDER BY created_at DESC LIMIT ?",
+            f"SELECT {_PURCHASE_COLUMNS} FROM credit_purchases ORDER BY created_at DESC LIMIT ?",
             (limit,),
         ).fetchall()
     return rows_to_models(rows, CreditPurchase)
 
 
-def get_all_prompt_history(limit: int = 100, offset: int = 0) -> list[PromptHistoryEntry]:
+def get_all_prompt_history(limit: int = 100, offset: int = 0, after_created_at: str = None,
+                           after_id: str = None, search: str = None,
+                           errors_only: bool = False) -> list[PromptHistoryEntry]:
+    """Prompt history across all workspaces, newest first. search keeps
+    prompts containing it (case-insensitive); errors_only keeps prompts
+    with a response error. Filters apply before limit, so a page is full
+    whenever enough rows match."""
+    flush_writes()
+    conditions = []
+    params: list = []
+    if search:
+        conditions.append("instr(unicode_lower(prompt_text), ?) > 0")
+        params.append(search.lower())
+    if errors_only:
+        conditions.append("response_error <> ''")
+    where = " AND ".join(conditions) if conditions else "1=1"
+    sql, page_params = _page_sql("prompt_history", _PROMPT_HISTORY_COLUMNS, after_created_at, after_id, where)
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM prompt_history ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (limit, offset),
-        ).fetchall()
-    return rows_to_models(rows, PromptHistoryEntry)
+        cursor = conn.execute(sql, (*params, *page_params, limit, offset))
+        return rows_to_models(cursor, PromptHistoryEntry)
 
 
-def get_all_credit_ledger(limit: int = 100, offset: int = 0) -> list[CreditLedgerEntry]:
+def get_all_credit_ledger(limit: int = 100, offset: int = 0, after_created_at: str = None,
+                          after_id: str = None) -> list[CreditLedgerEntry]:
+    sql, params = _page_sql("credit_ledger", _LEDGER_COLUMNS, after_created_at, after_id)
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM credit_ledger ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (limit, offset),
-        ).fetchall()
-    return rows_to_models(rows, CreditLedgerEntry)
+        cursor = conn.execute(sql, (*params, limit, offset))
+        return rows_to_models(cursor, CreditLedgerEntry)
 
 
 # =========================================================================
@@ -1407,8 +1882,8 @@ def get_all_credit_ledger(limit: int = 100, offset: int = 0) -> list[CreditLedge
 def create_audit_log(user_id: str, action: str, entity_type: str,
                      entity_id: str = None, details: str = None,
                      ip_address: str = None) -> str:
-    aid = _new_id()
-    detail_str = json.dumps(details) if isinstance(details, dict) else details
+    aid = _new_ordered_id()
+    detail_str = json_dumps(details) if isinstance(details, (dict, list)) else details
     with get_db() as conn:
         conn.execute(
             """INSERT INTO audit_log (id, user_id, action, entity_type, entity_id, details, ip_address)
@@ -1419,7 +1894,8 @@ def create_audit_log(user_id: str, action: str, entity_type: str,
 
 
 def get_audit_log(limit: int = 100, offset: int = 0,
-                  entity_type: str = None, user_id: str = None) -> list[AuditLogEntry]:
+                  entity_type: str = None, user_id: str = None,
+                  after_created_at: str = None, after_id: str = None) -> list[AuditLogEntry]:
     conditions = []
     params: list = []
     if entity_type:
@@ -1429,25 +1905,38 @@ def get_audit_log(limit: int = 100, offset: int = 0,
         conditions.append("user_id = ?")
         params.append(user_id)
     where = " AND ".join(conditions) if conditions else "1=1"
-    params.extend([limit, offset])
+    sql, page_params = _page_sql("audit_log", _AUDIT_COLUMNS, after_created_at, after_id, where)
     with get_db() as conn:
-        rows = conn.execute(
-            f"SELECT * FROM audit_log WHERE {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            tuple(params),
-        ).fetchall()
-    return rows_to_models(rows, AuditLogEntry)
+        cursor = conn.execute(sql, (*params, *page_params, limit, offset))
+        return rows_to_models(cursor, AuditLogEntry)
 
 
 # =========================================================================
 # System Settings
 # =========================================================================
 
-def get_system_setting(key: str) -> Optional[str]:
+# Settings are read on most requests and written only from the admin page,
+# so reads are served from a short-lived process-local cache (see
+# _TTLCache). The full listing is cached under a single key.
+_settings_cache = _TTLCache(ttl=30.0)
+_all_settings_cache = _TTLCache(ttl=30.0)
+
+
+def _invalidate_settings(key: str) -> None:
+    _settings_cache.invalidate(key)
+    _all_settings_cache.invalidate()
+
+
+def _load_setting(key: str) -> Optional[str]:
     with get_db() as conn:
         row = conn.execute("SELECT value FROM system_settings WHERE key = ?", (key,)).fetchone()
     return row["value"] if row else None
 
 
+def get_system_setting(key: str) -> Optional[str]:
+    return _settings_cache.get(key, lambda: _load_setting(key))
+
+
 def set_system_setting(key: str, value: str, updated_by: str) -> None:
     with get_db() as conn:
         conn.execute(
@@ -1456,24 +1945,54 @@ def set_system_setting(key: str, value: str, updated_by: str) -> None:
                ON CONFLICT(key) DO UPDATE SET value = ?, updated_by = ?, updated_at = datetime('now')""",
             (key, value, updated_by, value, updated_by),
         )
+    _invalidate_settings(key)
 
 
-def get_all_system_settings() -> dict:
+def set_system_settings(values: dict[str, str], updated_by: str) -> None:
+    """set_system_setting for several keys in one executemany."""
+    with get_db() as conn:
+        conn.executemany(
+            """INSERT INTO system_settings (key, value, updated_by, updated_at)
+               VALUES (?, ?, ?, datetime('now'))
+               ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_by = excluded.updated_by,
+                                              updated_at = datetime('now')""",
+            [(key, value, updated_by) for key, value in values.items()],
+        )
+    for key in values:
+        _invalidate_settings(key)
+
+
+def _load_all_settings() -> dict:
     with get_db() as conn:
         rows = conn.execute("SELECT key, value FROM system_settings ORDER BY key").fetchall()
     return {row["key"]: row["value"] for row in rows}
 
 
+def get_all_system_settings() -> dict:
+    # A copy, so callers cannot mutate the cached dict
+    return dict(_all_settings_cache.get("*", _load_all_settings))
+
+
 # =========================================================================
 # Admin User Management
 # =========================================================================
 
+def is_superadmin(user_id: str) -> bool:
+    """Read the superadmin flag from the database. Use this for access
+    checks; User.is_superadmin from get_user_by_id may be up to the user
+    cache TTL old."""
+    with get_db() as conn:
+        row = conn.execute("SELECT is_superadmin FROM users WHERE id = ?", (user_id,)).fetchone()
+    return bool(row and row[0])
+
+
 def set_user_superadmin(user_id: str, is_superadmin: bool) -> bool:
     with get_db() as conn:
         conn.execute(
             "UPDATE users SET is_superadmin = ?, updated_at = datetime('now') WHERE id = ?",
             (1 if is_superadmin else 0, user_id),
         )
+    _user_cache.invalidate(user_id)
     return True
 
 
@@ -1484,6 +2003,7 @@ def set_superadmin_by_email(email: str) -> bool:
             "UPDATE users SET is_superadmin = 1, updated_at = datetime('now') WHERE email = ?",
             (email.strip().lower(),),
         )
+    _user_cache.invalidate()
     return True
 
 
@@ -1506,43 +2026,20 @@ def update_file_status(file_id: str, status: str, error_message: str = None) ->
 # =========================================================================
 
 def get_project_activity_summary(project_id: str) -> dict:
-    """Aggregate activity stats for a project."""
-    with get_db() as conn:
-        files_row = conn.execute(
-            """SELECT COUNT(*) as total,
-                      SUM(CASE WHEN status='success' THEN 1 ELSE 0 END) as success,
-                      SUM(CASE WHEN status='error' THEN 1 ELSE 0 END) as errors,
-                      SUM(CASE WHEN status='pending' THEN 1 ELSE 0 END) as pending
-               FROM uploaded_files WHERE project_id = ?""",
-            (project_id,),
-        ).fetchone()
-        dash_row = conn.execute(
-            "SELECT COUNT(*) as cnt FROM dashboards WHERE project_id = ?",
-            (project_id,),
-        ).fetchone()
-        analysis_row = conn.execute(
-            "SELECT COUNT(*) as cnt FROM prompt_history WHERE project_id = ?",
+    """Aggregate activity stats for a project, read from the counters the
+    schema's triggers keep on its projects row."""
+    flush_writes()
+    with get_db() as conn:
+        row = conn.execute(
+            """SELECT files_total, files_success, files_error, files_pending,
+                      dashboards_count, analyses_count, last_activity
+               FROM projects WHERE id = ?""",
             (project_id,),
         ).fetchone()
-        last_row = conn.execute(
-            """SELECT MAX(ts) as last_at FROM (
-                SELECT uploaded_at as ts FROM uploaded_files WHERE project_id = ?
-                UNION ALL
-                SELECT created_at as ts FROM prompt_history WHERE project_id = ?
-                UNION ALL
-                SELECT created_at as ts FROM dashboards WHERE project_id = ?
-            )""",
-            (project_id, project_id, project_id),
-        ).fetchone()
-    return {
-        "files_total": files_row["total"] or 0,
-        "files_success": files_row["success"] or 0,
-        "files_error": files_row["errors"] or 0,
-        "files_pending": files_row["pending"] or 0,
-        "dashboards_count": dash_row["cnt"] or 0,
-        "analyses_count": analysis_row["cnt"] or 0,
-        "last_activity": last_row["last_at"],
-    }
+    if row is None:
+        return {"files_total": 0, "files_success": 0, "files_error": 0, "files_pending": 0,
+                "dashboards_count": 0, "analyses_count": 0, "last_activity": None}
+    return dict(row)
 
 
 # =========================================================================
@@ -1552,46 +2049,25 @@ def get_project_activity_summary(project_id: str) -> dict:
 def get_user_preferences(user_id: str) -> Optional[UserPreferences]:
     with get_db() as conn:
         row = conn.execute(
-            "SELECT * FROM user_preferences WHERE user_id = ?",
+            f"SELECT {_PREFERENCES_COLUMNS} FROM user_preferences WHERE user_id = ?",
             (user_id,),
         ).fetchone()
     return row_to_model(row, UserPreferences)
 
 
 def upsert_user_preferences(user_id: str, **kwargs) -> str:
-    existing = get_user_preferences(user_id)
-    if existing:
-        if not kwargs:
-            return existing.id
-        kwargs["updated_at"] = "datetime('now')"
-        sets = []
-        vals = []
-        for k, v in kwargs.items():
-            if v == "datetime('now')":
-                sets.append(f"{k} = datetime('now')")
-            else:
-                sets.append(f"{k} = ?")
-                vals.append(v)
-        vals.append(user_id)
-        sql = f"UPDATE user_preferences SET {', '.join(sets)} WHERE user_id = ?"
-        with get_db() as conn:
-            conn.execute(sql, tuple(vals))
-        return existing.id
-    else:
-        pid = _new_id()
-        cols = ["id", "user_id"]
-        placeholders = ["?", "?"]
-        vals = [pid, user_id]
-        for k, v in kwargs.items():
-            if k == "updated_at":
-                continue
-            cols.append(k)
-            placeholders.append("?")
-            vals.append(v)
-        sql = f"INSERT INTO user_preferences ({', '.join(cols)}) VALUES ({', '.join(placeholders)})"
-        with get_db() as conn:
-            conn.execute(sql, tuple(vals))
-        return pid
+    """Create or update a user's preferences in one statement; returns their id."""
+    kwargs.pop("updated_at", None)
+    unknown = kwargs.keys() - _updatable_columns("user_preferences")
+    if unknown:
+        raise ValueError(f"Cannot update user_preferences: unknown column(s) {', '.join(sorted(unknown))}")
+    columns = tuple(sorted(kwargs))
+    with get_db() as conn:
+        row = conn.execute(
+            _upsert_sql("user_preferences", "user_id", columns),
+            (_new_id(), user_id, *(kwargs[k] for k in columns)),
+        ).fetchone()
+    return row[0]
 
 
 # =========================================================================
@@ -11,9 +11,10 @@ Commands:
   import-users <input_file>
   export-audit-log <output_file>
   review-audit-log
+  refresh-rollups
 """
 import sys
-from db.database import init_db, get_db
+from db.database import init_db, get_db, refresh_daily_rollups
 from auth.authenticator import hash_password
 from db import queries
 import csv
@@ -49,34 +50,45 @@ def reset_password(email, new_password):
         conn.commit()
     print(f"Password reset for: {email}")
 
-def export_users(output_file):
+def _dump_query_to_csv(sql, output_file, batch_size=1000):
+    """Write a query's result to CSV, headed by its column names, in
+    batches of batch_size rows."""
     with get_db() as conn, open(output_file, 'w', newline='') as f:
+        cursor = conn.execute(sql)
+        cursor.arraysize = batch_size
         writer = csv.writer(f)
-        writer.writerow(['id', 'email', 'display_name', 'created_at'])
-        for row in conn.execute('SELECT id, email, display_name, created_at FROM users'):
-            writer.writerow([row['id'], row['email'], row['display_name'], row['created_at']])
+        writer.writerow([d[0] for d in cursor.description])
+        while batch := cursor.fetchmany():
+            writer.writerows(batch)
+
+def export_users(output_file):
+    _dump_query_to_csv('SELECT id, email, display_name, created_at FROM users', output_file)
     print(f"Exported users to {output_file}")
 
 def import_users(input_file):
     with get_db() as conn, open(input_file, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if not queries.get_user_by_email(row['email']):
-                conn.execute(
-                    "INSERT INTO users (id, email, password_hash, display_name, created_at) VALUES (?, ?, ?, ?, ?)",
-                    (row['id'], row['email'], '', row['display_name'], row['created_at'])
-                )
-        conn.commit()
+        # One email lookup for the whole file; the set also skips repeats
+        # within the CSV, as the per-row lookup did
+        seen = {r[0] for r in conn.execute('SELECT email FROM users')}
+
+        def new_rows():
+            for row in csv.DictReader(f):
+                if row['email'] not in seen:
+                    seen.add(row['email'])
+                    yield (row['id'], row['email'], '', row['display_name'], row['created_at'])
+
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, display_name, created_at) VALUES (?, ?, ?, ?, ?)",
+            new_rows(),
+        )
     print(f"Imported users from {input_file}")
 
 def export_audit_log(output_file):
     """Export audit log to CSV file."""
-    import csv
-    with get_db() as conn, open(output_file, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['id', 'user_id', 'workspace_id', 'action', 'entity_type', 'entity_id', 'details', 'ip_address', 'created_at'])
-        for row in conn.execute('SELECT id, user_id, workspace_id, action, entity_type, entity_id, details, ip_address, created_at FROM audit_log'):
-            writer.writerow([row['id'], row['user_id'], row['workspace_id'], row['action'], row['entity_type'], row['entity_id'], row['details'], row['ip_address'], row['created_at']])
+    _dump_query_to_csv(
+        'SELECT id, user_id, action, entity_type, entity_id, details, ip_address, created_at FROM audit_log',
+        output_file,
+    )
     print(f"Exported audit log to {output_file}")
 
 def review_audit_log(limit=20):
@@ -107,6 +119,9 @@ def main():
     elif cmd == 'review-audit-log':
         limit = int(sys.argv[2]) if len(sys.argv) == 3 else 20
         review_audit_log(limit)
+    elif cmd == 'refresh-rollups':
+        refresh_daily_rollups()
+        print("Daily rollups refreshed")
     else:
         print(__doc__)
 
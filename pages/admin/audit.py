@@ -23,11 +23,14 @@ def show():
     with col2:
         user_filter = st.text_input("Filter by User ID", key="audit_user_filter", placeholder="Leave empty for all")
 
-    # Pagination
-    page = st.session_state.get("audit_page", 0)
+    # Pagination — one (created_at, id) cursor per page after the first
+    cursors = st.session_state.get("audit_cursors", [])
+    page = len(cursors)
     per_page = 30
 
-    kwargs = {"limit": per_page, "offset": page * per_page}
+    kwargs = {"limit": per_page}
+    if cursors:
+        kwargs["after_created_at"], kwargs["after_id"] = cursors[-1]
     if entity_filter != "All":
         kwargs["entity_type"] = entity_filter
     if user_filter:
@@ -39,6 +42,8 @@ def show():
         st.info("No audit log entries found matching the filters.")
         return
 
+    users = queries.get_users_by_ids(e.user_id for e in entries if e.user_id)
+
     for entry in entries:
         with st.container(border=True):
             col1, col2, col3, col4 = st.columns([2, 2, 3, 1])
@@ -47,7 +52,7 @@ def show():
                 st.caption(f"{entry.entity_type}")
             with col2:
                 if entry.user_id:
-                    user = queries.get_user_by_id(entry.user_id)
+                    user = users.get(entry.user_id)
                     st.caption(user.email if user else entry.user_id)
                 else:
                     st.caption("System")
@@ -67,13 +72,13 @@ def show():
     col_prev, col_info, col_next = st.columns([1, 2, 1])
     with col_prev:
         if st.button("Previous", disabled=page <= 0, key="audit_prev"):
-            st.session_state["audit_page"] = page - 1
+            st.session_state["audit_cursors"] = cursors[:-1]
             st.rerun()
     with col_info:
         st.caption(f"Page {page + 1}")
     with col_next:
         if st.button("Next", disabled=len(entries) < per_page, key="audit_next"):
-            st.session_state["audit_page"] = page + 1
+            st.session_state["audit_cursors"] = cursors + [(entries[-1].created_at, entries[-1].id)]
             st.rerun()
 
 
@@ -19,17 +19,15 @@ def show():
     with col2:
         errors_only = st.checkbox("Show errors only", key="mod_errors_only")
 
-    # Pagination
-    page = st.session_state.get("mod_page", 0)
+    # Pagination — one (created_at, id) cursor per page after the first
+    cursors = st.session_state.get("mod_cursors", [])
+    page = len(cursors)
     per_page = 25
 
-    entries = queries.get_all_prompt_history(limit=per_page, offset=page * per_page)
-
-    if search_query:
-        entries = [e for e in entries if search_query.lower() in (e.prompt_text or "").lower()]
-
-    if errors_only:
-        entries = [e for e in entries if e.response_error]
+    after_created_at, after_id = cursors[-1] if cursors else (None, None)
+    entries = queries.get_all_prompt_history(limit=per_page, after_created_at=after_created_at,
+                                             after_id=after_id, search=search_query,
+                                             errors_only=errors_only)
 
     if not entries:
         st.info("No prompt history entries found.")
@@ -37,9 +35,12 @@ def show():
 
     st.caption(f"Showing page {page + 1}")
 
+    users = queries.get_users_by_ids(e.user_id for e in entries)
+    workspaces = queries.get_workspaces_by_ids(e.workspace_id for e in entries)
+
     for entry in entries:
-        user = queries.get_user_by_id(entry.user_id)
-        ws = queries.get_workspace_by_id(entry.workspace_id)
+        user = users.get(entry.user_id)
+        ws = workspaces.get(entry.workspace_id)
 
         has_error = bool(entry.response_error)
         border_color = "red" if has_error else None
@@ -82,13 +83,13 @@ def show():
     col_prev, col_info, col_next = st.columns([1, 2, 1])
     with col_prev:
         if st.button("Previous", disabled=page <= 0, key="mod_prev"):
-            st.session_state["mod_page"] = page - 1
+            st.session_state["mod_cursors"] = cursors[:-1]
             st.rerun()
     with col_info:
         st.caption(f"Page {page + 1}")
     with col_next:
         if st.button("Next", disabled=len(entries) < per_page, key="mod_next"):
-            st.session_state["mod_page"] = page + 1
+            st.session_state["mod_cursors"] = cursors + [(entries[-1].created_at, entries[-1].id)]
             st.rerun()
 
 
@@ -5,6 +5,7 @@ import streamlit as st
 
 from auth.session import require_superadmin
 from db import queries
+from db.database import get_db
 
 
 def show():
@@ -38,14 +39,14 @@ def show():
                 values[key] = st.text_input(label, value=current, help=help_text)
 
             if st.form_submit_button("Save Settings", use_container_width=True, type="primary"):
-                for key, value in values.items():
-                    queries.set_system_setting(key, value, admin.id)
-                queries.create_audit_log(
-                    user_id=admin.id,
-                    action="update_settings",
-                    entity_type="system",
-                    details={"updated_keys": list(values.keys())},
-                )
+                with get_db():
+                    queries.set_system_settings(values, admin.id)
+                    queries.create_audit_log(
+                        user_id=admin.id,
+                        action="update_settings",
+                        entity_type="system",
+                        details={"updated_keys": list(values.keys())},
+                    )
                 st.success("Settings saved!")
                 st.rerun()
 
@@ -13,12 +13,14 @@ def show():
     st.title("User Management")
     st.caption("View and manage all users across the platform")
 
-    # Pagination
-    page = st.session_state.get("admin_users_page", 0)
+    # Pagination — one (created_at, id) cursor per page after the first
+    cursors = st.session_state.get("admin_users_cursors", [])
+    page = len(cursors)
     per_page = 25
     total = queries.count_all_users()
 
-    users = queries.get_all_users(limit=per_page, offset=page * per_page)
+    after_created_at, after_id = cursors[-1] if cursors else (None, None)
+    users = queries.get_all_users(limit=per_page, after_created_at=after_created_at, after_id=after_id)
 
     if not users:
         st.info("No users found.")
@@ -71,13 +73,13 @@ def show():
     max_page = max(0, (total - 1) // per_page)
     with col_prev:
         if st.button("Previous", disabled=page <= 0):
-            st.session_state["admin_users_page"] = page - 1
+            st.session_state["admin_users_cursors"] = cursors[:-1]
             st.rerun()
     with col_info:
         st.caption(f"Page {page + 1} of {max_page + 1}")
     with col_next:
         if st.button("Next", disabled=page >= max_page):
-            st.session_state["admin_users_page"] = page + 1
+            st.session_state["admin_users_cursors"] = cursors + [(users[-1].created_at, users[-1].id)]
             st.rerun()
 
 
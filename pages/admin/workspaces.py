@@ -14,12 +14,14 @@ def show():
     st.title("Workspace Management")
     st.caption("View and manage all workspaces across the platform")
 
-    # Pagination
-    page = st.session_state.get("admin_ws_page", 0)
+    # Pagination — one (created_at, id) cursor per page after the first
+    cursors = st.session_state.get("admin_ws_cursors", [])
+    page = len(cursors)
     per_page = 20
     total = queries.count_all_workspaces()
 
-    workspaces = queries.get_all_workspaces(limit=per_page, offset=page * per_page)
+    after_created_at, after_id = cursors[-1] if cursors else (None, None)
+    workspaces = queries.get_all_workspaces(limit=per_page, after_created_at=after_created_at, after_id=after_id)
 
     if not workspaces:
         st.info("No workspaces found.")
@@ -29,8 +31,8 @@ def show():
 
     for ws in workspaces:
         owner = queries.get_user_by_id(ws.owner_id)
-        member_count = queries.count_workspace_members(ws.id)
-        balance = queries.get_credit_balance(ws.id)
+        overview = queries.get_workspace_overview(ws.id)
+        member_count, balance = overview["members"], overview["credits"]
 
         with st.container(border=True):
             col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
@@ -95,13 +97,13 @@ def show():
     max_page = max(0, (total - 1) // per_page)
     with col_prev:
         if st.button("Previous", disabled=page <= 0, key="ws_prev"):
-            st.session_state["admin_ws_page"] = page - 1
+            st.session_state["admin_ws_cursors"] = cursors[:-1]
             st.rerun()
     with col_info:
         st.caption(f"Page {page + 1} of {max_page + 1}")
     with col_next:
         if st.button("Next", disabled=page >= max_page, key="ws_next"):
-            st.session_state["admin_ws_page"] = page + 1
+            st.session_state["admin_ws_cursors"] = cursors + [(workspaces[-1].created_at, workspaces[-1].id)]
             st.rerun()
 
 
@@ -108,14 +108,19 @@ def _show_dashboard_list(ws):
         st.info("No projects yet. Create a project and generate charts to see dashboards here.")
         return
 
+    by_project = queries.get_dashboards_for_projects([p.id for p in projects])
+    chart_counts = queries.count_charts_for_dashboards(
+        [d.id for dashboards in by_project.values() for d in dashboards]
+    )
+
     any_dashboards = False
     for project in projects:
-        dashboards = queries.get_dashboards_for_project(project.id)
+        dashboards = by_project[project.id]
         if dashboards:
             any_dashboards = True
             st.subheader(project.name)
             for dash in dashboards:
-                chart_count = len(queries.get_charts_for_dashboard(dash.id))
+                chart_count = chart_counts[dash.id]
                 col1, col2 = st.columns([4, 1])
                 with col1:
                     if st.button(f"**{dash.name}** — {chart_count} charts", key=f"dash_{dash.id}", use_container_width=True):
@@ -132,7 +137,7 @@ def _export_dashboard(dashboard):
     """Export dashboard as PDF."""
     try:
         from services.export_service import export_dashboard_as_pdf
-        charts = queries.get_charts_for_dashboard(dashboard.id)
+        charts = queries.iter_charts_for_dashboard(dashboard.id)
         pdf_bytes = export_dashboard_as_pdf(dashboard, charts)
         st.download_button(
             "Download PDF",
@@ -162,7 +167,7 @@ def _export_dashboard_excel(dashboard):
 def _export_dashboard_png_zip(dashboard):
     try:
         from services.export_service import export_dashboard_as_images
-        charts = queries.get_charts_for_dashboard(dashboard.id)
+        charts = queries.iter_charts_for_dashboard(dashboard.id)
         images = export_dashboard_as_images(dashboard, charts)
         if not images:
             st.warning("No chart images available for export.")
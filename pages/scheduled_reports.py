@@ -11,9 +11,10 @@ from services import report_scheduler_service
 
 def _workspace_dashboards(workspace_id: str):
     choices = {}
-    for project in queries.get_projects_for_workspace(workspace_id):
-        dashboards = queries.get_dashboards_for_project(project.id)
-        for dash in dashboards:
+    projects = queries.get_projects_for_workspace(workspace_id)
+    by_project = queries.get_dashboards_for_projects([p.id for p in projects])
+    for project in projects:
+        for dash in by_project[project.id]:
             choices[dash.id] = f"{project.name} / {dash.name}"
     return choices
 
@@ -88,8 +88,8 @@ def show():
                 file_path=file_path,
                 file_format=file_format,
                 file_size_bytes=len(file_bytes),
+                status="pending",
             )
-            queries.update_file_status(file_id, "pending")
 
             # Load and profile
             try:
@@ -102,8 +102,8 @@ def show():
                     column_count=profile["column_count"],
                     column_names=list(df.columns),
                     data_profile=profile,
+                    status="success",
                 )
-                queries.update_file_status(file_id, "success")
 
                 st.success(f"Uploaded **{uploaded_file.name}** — {profile['row_count']:,} rows, {profile['column_count']} columns")
 
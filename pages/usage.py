@@ -6,11 +6,12 @@ import pandas as pd
 from datetime import datetime, timedelta
 
 from auth.session import require_auth, get_current_workspace
-from config.settings import CHART_PALETTES
+from config.settings import CHART_PALETTES, CHART_PALETTES_RGB
 from db import queries
 
 # Design tokens (match theme.py — warm palette)
 _COLORS = CHART_PALETTES["default"]  # ["#0F766E", "#10B981", "#D97706", "#E11D48", "#7C3AED", "#0EA5E9"]
+_AREA_FILL = "rgba({}, {}, {}, 0.08)".format(*CHART_PALETTES_RGB["default"][0])
 _CHART_LAYOUT = dict(
     plot_bgcolor="#FFFFFF",
     paper_bgcolor="#FFFFFF",
@@ -34,23 +35,24 @@ def show():
     start_str, end_str, project_id, member_id = _render_filters(ws)
 
     # --- Summary KPIs ---
-    _render_kpis(ws.id, start_str, end_str, project_id, member_id)
+    summary = queries.get_usage_summary(ws.id, start_str, end_str, project_id, member_id)
+    _render_kpis(summary)
 
     st.divider()
 
     # --- Chart row 1 ---
     col_left, col_right = st.columns(2)
     with col_left:
-        _render_credit_usage_chart(ws.id, start_str, end_str, member_id)
+        _render_credit_usage_chart(summary.credit_usage_by_day)
     with col_right:
-        _render_analysis_activity_chart(ws.id, start_str, end_str, project_id, member_id)
+        _render_analysis_activity_chart(summary.analyses_by_day)
 
     st.divider()
 
     # --- Chart row 2 ---
     col_left2, col_right2 = st.columns(2)
     with col_left2:
-        _render_token_usage_by_project(ws.id, start_str, end_str, member_id)
+        _render_token_usage_by_project(summary.token_usage_by_project)
     with col_right2:
         _render_file_upload_summary(ws.id, start_str, end_str, project_id)
 
@@ -142,32 +144,23 @@ def _render_filters(ws):
 # KPIs
 # ---------------------------------------------------------------------------
 
-def _render_kpis(workspace_id, start_date, end_date, project_id, member_id):
+def _render_kpis(summary):
     """Render the 4 summary KPI metric cards."""
-    credits_used = queries.get_credits_used_in_range(workspace_id, start_date, end_date, member_id)
-    analyses_run = queries.get_analyses_count_in_range(workspace_id, start_date, end_date, project_id, member_id)
-    uploads = queries.get_uploads_in_range(workspace_id, start_date, end_date, project_id, member_id)
-    files_uploaded = len(uploads)
-    dashboards_created = queries.get_dashboards_created_in_range(
-        workspace_id, start_date, end_date, project_id, member_id,
-    )
-
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Credits Used", f"{credits_used:,}")
-    col2.metric("AI Analyses", f"{analyses_run:,}")
-    col3.metric("Files Uploaded", f"{files_uploaded:,}")
-    col4.metric("Dashboards Created", f"{dashboards_created:,}")
+    col1.metric("Credits Used", f"{summary.credits_used:,}")
+    col2.metric("AI Analyses", f"{summary.analyses_run:,}")
+    col3.metric("Files Uploaded", f"{summary.files_uploaded:,}")
+    col4.metric("Dashboards Created", f"{summary.dashboards_created:,}")
 
 
 # ---------------------------------------------------------------------------
 # Charts
 # ---------------------------------------------------------------------------
 
-def _render_credit_usage_chart(workspace_id, start_date, end_date, member_id):
+def _render_credit_usage_chart(data):
     """Area chart of daily credit consumption."""
     st.subheader("Credit Usage Over Time")
 
-    data = queries.get_credit_usage_by_day(workspace_id, start_date, end_date, member_id)
     if not data:
         st.info("No credit usage in this period.")
         return
@@ -183,17 +176,16 @@ def _render_credit_usage_chart(workspace_id, start_date, end_date, member_id):
     fig.update_layout(**_CHART_LAYOUT, hovermode="x unified")
     fig.update_traces(
         fill="tozeroy",
-        fillcolor="rgba(15, 118, 110, 0.08)",
+        fillcolor=_AREA_FILL,
         line=dict(width=2),
     )
     st.plotly_chart(fig, use_container_width=True)
 
 
-def _render_analysis_activity_chart(workspace_id, start_date, end_date, project_id, member_id):
+def _render_analysis_activity_chart(data):
     """Bar chart of analyses per day."""
     st.subheader("AI Analysis Activity")
 
-    data = queries.get_analyses_by_day(workspace_id, start_date, end_date, project_id, member_id)
     if not data:
         st.info("No analysis activity in this period.")
         return
@@ -210,11 +202,10 @@ def _render_analysis_activity_chart(workspace_id, start_date, end_date, project_
     st.plotly_chart(fig, use_container_width=True)
 
 
-def _render_token_usage_by_project(workspace_id, start_date, end_date, member_id):
+def _render_token_usage_by_project(data):
     """Horizontal bar chart of token usage broken down by project."""
     st.subheader("Usage by Project")
 
-    data = queries.get_token_usage_by_project(workspace_id, start_date, end_date, member_id)
     if not data:
         st.info("No project usage data in this period.")
         return
@@ -1,6 +1,7 @@
 """API key service — create, verify, and manage API keys."""
 
 import hashlib
+import hmac
 import secrets
 from typing import Optional
 
@@ -51,18 +52,19 @@ def verify_api_key(api_key: str) -> Optional[ApiKey]:
     key_hash = hashlib.sha256(api_key.encode()).hexdigest()
     key_prefix = api_key[:12]
 
-    # Look up by prefix first for efficiency
-    key_record = queries.get_api_key_by_prefix(key_prefix)
-    if not key_record:
+    # Look up by prefix first for efficiency; only (id, hash) until verified
+    match = queries.get_api_key_hash_by_prefix(key_prefix)
+    if not match:
         return None
+    key_id, stored_hash = match
 
     # Verify full hash
-    if key_record.key_hash != key_hash:
+    if not hmac.compare_digest(stored_hash, key_hash):
         return None
 
     # Update last used
-    queries.update_api_key_last_used(key_record.id)
-    return key_record
+    queries.update_api_key_last_used(key_id)
+    return queries.get_api_key_by_id(key_id)
 
 
 def revoke_api_key(key_id: str) -> bool:
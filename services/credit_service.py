@@ -5,6 +5,7 @@ from typing import Optional
 
 from config.settings import TIERS, TOKENS_PER_CREDIT
 from db import queries
+from db.database import get_db
 
 
 def get_balance(workspace_id: str) -> int:
@@ -21,32 +22,35 @@ def check_sufficient_credits(workspace_id: str, estimated_cost: int = 5) -> tupl
 def deduct_credits(workspace_id: str, user_id: str, amount: int,
                    reason: str, reference_id: str = None) -> int:
     """Deduct credits from workspace. Returns new balance."""
-    current = get_balance(workspace_id)
-    new_balance = max(0, current - amount)
-    queries.add_credit_entry(
-        workspace_id=workspace_id,
-        user_id=user_id,
-        change_amount=-amount,
-        balance_after=new_balance,
-        reason=reason,
-        reference_id=reference_id,
-    )
+    # Read and write under one write lock so concurrent deductions serialize
+    with get_db(immediate=True):
+        current = get_balance(workspace_id)
+        new_balance = max(0, current - amount)
+        queries.add_credit_entry(
+            workspace_id=workspace_id,
+            user_id=user_id,
+            change_amount=-amount,
+            balance_after=new_balance,
+            reason=reason,
+            reference_id=reference_id,
+        )
     return new_balance
 
 
 def add_credits(workspace_id: str, user_id: str, amount: int,
                 reason: str, reference_id: str = None) -> int:
     """Add credits to workspace. Returns new balance."""
-    current = get_balance(workspace_id)
-    new_balance = current + amount
-    queries.add_credit_entry(
-        workspace_id=workspace_id,
-        user_id=user_id,
-        change_amount=amount,
-        balance_after=new_balance,
-        reason=reason,
-        reference_id=reference_id,
-    )
+    with get_db(immediate=True):
+        current = get_balance(workspace_id)
+        new_balance = current + amount
+        queries.add_credit_entry(
+            workspace_id=workspace_id,
+            user_id=user_id,
+            change_amount=amount,
+            balance_after=new_balance,
+            reason=reason,
+            reference_id=reference_id,
+        )
     return new_balance
 
 
@@ -57,11 +61,11 @@ def calculate_credit_cost(tokens_used: int) -> int:
 
 def check_upload_allowed(user_id: str, workspace_id: str) -> tuple[bool, str]:
     """Check if user can upload based on tier daily limits."""
-    ws = queries.get_workspace_by_id(workspace_id)
-    if not ws:
+    tier = queries.get_workspace_tier(workspace_id)
+    if tier is None:
         return False, "Workspace not found."
 
-    tier_config = TIERS.get(ws.tier, TIERS["free"])
+    tier_config = TIERS.get(tier, TIERS["free"])
     max_uploads = tier_config["uploads_per_day"]
     if max_uploads == -1:
         return True, ""
@@ -75,11 +79,11 @@ def check_upload_allowed(user_id: str, workspace_id: str) -> tuple[bool, str]:
 
 def check_file_size_allowed(workspace_id: str, file_size_bytes: int) -> tuple[bool, str]:
     """Check if file size is within tier limits."""
-    ws = queries.get_workspace_by_id(workspace_id)
-    if not ws:
+    tier = queries.get_workspace_tier(workspace_id)
+    if tier is None:
         return False, "Workspace not found."
 
-    tier_config = TIERS.get(ws.tier, TIERS["free"])
+    tier_config = TIERS.get(tier, TIERS["free"])
     max_mb = tier_config["max_file_size_mb"]
     file_mb = file_size_bytes / (1024 * 1024)
     if file_mb > max_mb:
@@ -90,11 +94,11 @@ def check_file_size_allowed(workspace_id: str, file_size_bytes: int) -> tuple[bo
 
 def check_dashboard_limit(workspace_id: str) -> tuple[bool, str]:
     """Check if workspace can create another dashboard."""
-    ws = queries.get_workspace_by_id(workspace_id)
-    if not ws:
+    tier = queries.get_workspace_tier(workspace_id)
+    if tier is None:
         return False, "Workspace not found."
 
-    tier_config = TIERS.get(ws.tier, TIERS["free"])
+    tier_config = TIERS.get(tier, TIERS["free"])
     max_dashboards = tier_config["max_dashboards"]
     if max_dashboards == -1:
         return True, ""
@@ -108,11 +112,11 @@ def check_dashboard_limit(workspace_id: str) -> tuple[bool, str]:
 
 def check_revisions_allowed(workspace_id: str) -> tuple[bool, str]:
     """Check if revisions are allowed for the workspace tier."""
-    ws = queries.get_workspace_by_id(workspace_id)
-    if not ws:
+    tier = queries.get_workspace_tier(workspace_id)
+    if tier is None:
         return False, "Workspace not found."
 
-    tier_config = TIERS.get(ws.tier, TIERS["free"])
+    tier_config = TIERS.get(tier, TIERS["free"])
     max_revisions = tier_config["max_revisions_per_report"]
     if max_revisions == 0:
         return False, f"Revisions are not available on the {tier_config['name']} plan. Upgrade to Pro."
@@ -122,11 +126,11 @@ def check_revisions_allowed(workspace_id: str) -> tuple[bool, str]:
 
 def check_export_allowed(workspace_id: str) -> tuple[bool, str]:
     """Check if export is allowed for the workspace tier."""
-    ws = queries.get_workspace_by_id(workspace_id)
-    if not ws:
+    tier = queries.get_workspace_tier(workspace_id)
+    if tier is None:
         return False, "Workspace not found."
 
-    tier_config = TIERS.get(ws.tier, TIERS["free"])
+    tier_config = TIERS.get(tier, TIERS["free"])
     if not tier_config["export_enabled"]:
         return False, f"Export is not available on the {tier_config['name']} plan. Upgrade to Pro."
 
@@ -135,18 +139,20 @@ def check_export_allowed(workspace_id: str) -> tuple[bool, str]:
 
 def get_usage_summary(workspace_id: str, user_id: str) -> dict:
     """Get usage summary for display in sidebar/billing."""
-    balance = get_balance(workspace_id)
-    ws = queries.get_workspace_by_id(workspace_id)
-    tier_config = TIERS.get(ws.tier if ws else "free", TIERS["free"])
+    overview = queries.get_workspace_overview(workspace_id, user_id) or {
+        "tier": None, "credits": 0, "uploads_today": 0, "dashboards": 0,
+    }
+    tier = overview["tier"] or "free"
+    tier_config = TIERS.get(tier, TIERS["free"])
 
     return {
-        "credits_remaining": balance,
+        "credits_remaining": overview["credits"],
         "monthly_allowance": tier_config["monthly_credits"],
-        "uploads_today": queries.count_uploads_today(user_id),
+        "uploads_today": overview["uploads_today"],
         "uploads_limit": tier_config["uploads_per_day"],
-        "dashboards_count": queries.count_dashboards_in_workspace(workspace_id),
+        "dashboards_count": overview["dashboards"],
         "dashboards_limit": tier_config["max_dashboards"],
-        "tier": ws.tier if ws else "free",
+        "tier": tier,
         "tier_name": tier_config["name"],
     }
 
@@ -1,6 +1,6 @@
 """Export service — PDF and PNG export of dashboards and charts."""
 
-from typing import Optional
+from typing import Iterable, Optional
 import io
 import re
 
@@ -16,7 +16,7 @@ def export_chart_as_image(plotly_json: str, fmt: str = "png",
     return fig.to_image(format=fmt, width=width, height=height, engine="kaleido")
 
 
-def export_dashboard_as_pdf(dashboard, charts: list) -> bytes:
+def export_dashboard_as_pdf(dashboard, charts: Iterable) -> bytes:
     """Generate a PDF containing all charts from a dashboard.
     Returns PDF bytes."""
     from fpdf import FPDF
@@ -70,7 +70,7 @@ def export_dashboard_as_pdf(dashboard, charts: list) -> bytes:
     return bytes(pdf.output())
 
 
-def export_dashboard_as_images(dashboard, charts: list) -> list[tuple[str, bytes]]:
+def export_dashboard_as_images(dashboard, charts: Iterable) -> list[tuple[str, bytes]]:
     """Export each chart as a separate PNG. Returns [(title, png_bytes), ...]."""
     results = []
     for chart in charts:
@@ -91,11 +91,6 @@ def verify_totp(user_id: str, code: str) -> bool:
 
 def send_email_2fa_code(user_id: str) -> tuple[bool, str]:
     """Generate and send a 6-digit code via email."""
-    # Rate limit: max 3 codes per 15 minutes
-    recent_count = queries.count_recent_verification_codes(user_id, "2fa", 15)
-    if recent_count >= 3:
-        return False, "Too many code requests. Please wait a few minutes."
-
     user = queries.get_user_by_id(user_id)
     if not user:
         return False, "User not found."
@@ -105,7 +100,9 @@ def send_email_2fa_code(user_id: str) -> tuple[bool, str]:
     from datetime import datetime, timedelta, timezone
     expires_at = (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()
 
-    queries.create_verification_code(user_id, code, "2fa", expires_at)
+    # Rate limit: max 3 codes per 15 minutes
+    if queries.create_verification_code_limited(user_id, code, "2fa", expires_at, 3, 15) is None:
+        return False, "Too many code requests. Please wait a few minutes."
 
     # Send email
     success = _send_email(
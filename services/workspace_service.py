@@ -5,6 +5,7 @@ from typing import Optional
 
 from config.settings import TIERS, TRIAL_DAYS, TRIAL_TIER, TRIAL_CREDITS
 from db import queries
+from db.database import get_db
 from db.models import Workspace, WorkspaceMember
 
 
@@ -12,51 +13,54 @@ def create_personal_workspace(user_id: str, display_name: str) -> str:
     """Create the default personal workspace for a new user.
     Called during registration. Also creates the free subscription and initial credits."""
     ws_name = f"{display_name}'s Workspace"
-    ws_id = queries.create_workspace(name=ws_name, owner_id=user_id, tier="free")
-
-    # Create free subscription
-    tier_config = TIERS["free"]
-    queries.create_subscription(
-        workspace_id=ws_id,
-        tier="free",
-        monthly_credit_allowance=tier_config["monthly_credits"],
-    )
+    # One transaction: the workspace and its setup rows commit together
+    with get_db():
+        ws_id = queries.create_workspace(name=ws_name, owner_id=user_id, tier="free")
+
+        # Create free subscription
+        tier_config = TIERS["free"]
+        queries.create_subscription(
+            workspace_id=ws_id,
+            tier="free",
+            monthly_credit_allowance=tier_config["monthly_credits"],
+        )
 
-    # Grant initial credits
-    queries.add_credit_entry(
-        workspace_id=ws_id,
-        user_id=user_id,
-        change_amount=tier_config["monthly_credits"],
-        balance_after=tier_config["monthly_credits"],
-        reason="Initial free tier credits",
-    )
+        # Grant initial credits
+        queries.add_credit_entry(
+            workspace_id=ws_id,
+            user_id=user_id,
+            change_amount=tier_config["monthly_credits"],
+            balance_after=tier_config["monthly_credits"],
+            reason="Initial free tier credits",
+        )
 
-    # Create default branding
-    queries.upsert_branding(ws_id)
+        # Create default branding
+        queries.upsert_branding(ws_id)
 
     return ws_id
 
 
 def create_shared_workspace(owner_id: str, name: str, description: str = "") -> str:
     """Create a new shared workspace."""
-    ws_id = queries.create_workspace(name=name, owner_id=owner_id, tier="free", description=description)
-
-    tier_config = TIERS["free"]
-    queries.create_subscription(
-        workspace_id=ws_id,
-        tier="free",
-        monthly_credit_allowance=tier_config["monthly_credits"],
-    )
+    with get_db():
+        ws_id = queries.create_workspace(name=name, owner_id=owner_id, tier="free", description=description)
+
+        tier_config = TIERS["free"]
+        queries.create_subscription(
+            workspace_id=ws_id,
+            tier="free",
+            monthly_credit_allowance=tier_config["monthly_credits"],
+        )
 
-    queries.add_credit_entry(
-        workspace_id=ws_id,
-        user_id=owner_id,
-        change_amount=tier_config["monthly_credits"],
-        balance_after=tier_config["monthly_credits"],
-        reason="Initial free tier credits",
-    )
+        queries.add_credit_entry(
+            workspace_id=ws_id,
+            user_id=owner_id,
+            change_amount=tier_config["monthly_credits"],
+            balance_after=tier_config["monthly_credits"],
+            reason="Initial free tier credits",
+        )
 
-    queries.upsert_branding(ws_id)
+        queries.upsert_branding(ws_id)
 
     return ws_id
 
@@ -128,13 +132,14 @@ def accept_invitation(token: str, user_id: str) -> tuple[bool, str]:
         queries.accept_invitation(invitation.id)
         return True, "You're already a member of this workspace."
 
-    queries.add_workspace_member(
-        workspace_id=invitation.workspace_id,
-        user_id=user_id,
-        role=invitation.role,
-        invited_by=invitation.invited_by,
-    )
-    queries.accept_invitation(invitation.id)
+    with get_db():
+        queries.add_workspace_member(
+            workspace_id=invitation.workspace_id,
+            user_id=user_id,
+            role=invitation.role,
+            invited_by=invitation.invited_by,
+        )
+        queries.accept_invitation(invitation.id)
 
     return True, "Welcome to the workspace!"
 
@@ -153,28 +158,29 @@ def start_trial(workspace_id: str, user_id: str) -> bool:
         "%Y-%m-%d %H:%M:%S"
     )
 
-    # Upgrade tier and set trial expiry
-    queries.update_workspace(workspace_id, tier=TRIAL_TIER, trial_ends_at=trial_end)
-
-    # Update the subscription to match the trial tier
-    sub = queries.get_subscription(workspace_id)
-    if sub:
-        tier_cfg = TIERS[TRIAL_TIER]
-        queries.update_subscription(
-            sub.id, tier=TRIAL_TIER,
-            monthly_credit_allowance=tier_cfg["monthly_credits"],
+    with get_db():
+        # Upgrade tier and set trial expiry
+        queries.update_workspace(workspace_id, tier=TRIAL_TIER, trial_ends_at=trial_end)
+
+        # Update the subscription to match the trial tier
+        sub = queries.get_subscription(workspace_id)
+        if sub:
+            tier_cfg = TIERS[TRIAL_TIER]
+            queries.update_subscription(
+                sub.id, tier=TRIAL_TIER,
+                monthly_credit_allowance=tier_cfg["monthly_credits"],
+            )
+
+        # Grant trial credits
+        current_balance = queries.get_credit_balance(workspace_id)
+        queries.add_credit_entry(
+            workspace_id=workspace_id,
+            user_id=user_id,
+            change_amount=TRIAL_CREDITS,
+            balance_after=current_balance + TRIAL_CREDITS,
+            reason="Pro trial activated — 7-day trial credits",
         )
 
-    # Grant trial credits
-    current_balance = queries.get_credit_balance(workspace_id)
-    queries.add_credit_entry(
-        workspace_id=workspace_id,
-        user_id=user_id,
-        change_amount=TRIAL_CREDITS,
-        balance_after=current_balance + TRIAL_CREDITS,
-        reason="Pro trial activated — 7-day trial credits",
-    )
-
     return True
 
 
@@ -221,13 +227,14 @@ def expire_trial(workspace_id: str) -> bool:
     Called during the app startup check (``app.py``) so expiry is enforced
     on every page load.
     """
-    queries.update_workspace(workspace_id, tier="free")
-
-    sub = queries.get_subscription(workspace_id)
-    if sub:
-        free_cfg = TIERS["free"]
-        queries.update_subscription(
-            sub.id, tier="free",
-            monthly_credit_allowance=free_cfg["monthly_credits"],
-        )
+    with get_db():
+        queries.update_workspace(workspace_id, tier="free")
+
+        sub = queries.get_subscription(workspace_id)
+        if sub:
+            free_cfg = TIERS["free"]
+            queries.update_subscription(
+                sub.id, tier="free",
+                monthly_credit_allowance=free_cfg["monthly_credits"],
+            )
     return True
@@ -213,6 +213,39 @@ class TestAdminQueries:
         assert len(users) >= 1
         assert any(u.id == user_id for u in users)
 
+    def test_get_all_users_keyset_pages(self, user_id):
+        from db import queries
+        for i in range(6):
+            queries.create_user(f"page{i}@test.com", "pw", f"Page {i}")
+        expected = [u.id for u in queries.get_all_users(limit=100)]
+        seen, after = [], (None, None)
+        while True:
+            page = queries.get_all_users(limit=3, after_created_at=after[0], after_id=after[1])
+            if not page:
+                break
+            seen += [u.id for u in page]
+            after = (page[-1].created_at, page[-1].id)
+        assert seen == expected and len(seen) == 7
+
+    def test_prompt_history_filters_in_sql(self, user_id, workspace_id, project_id):
+        from db import queries
+        queries.save_prompt_history(user_id, workspace_id, project_id, "Plot SALES by month")
+        queries.save_prompt_history(user_id, workspace_id, project_id, "sales by region",
+                                    response_error="KeyError")
+        queries.save_prompt_history(user_id, workspace_id, project_id, "ÉTUDE des ventes")
+        for i in range(3):
+            queries.save_prompt_history(user_id, workspace_id, project_id, f"other {i}")
+
+        def texts(**filters):
+            return sorted(e.prompt_text for e in queries.get_all_prompt_history(**filters))
+
+        assert texts(search="sales") == ["Plot SALES by month", "sales by region"]
+        assert texts(errors_only=True) == ["sales by region"]
+        assert texts(search="plot", errors_only=True) == []
+        assert texts(search="étude") == ["ÉTUDE des ventes"]
+        # The filter runs before the limit, so matches past the newest rows still fill a page
+        assert len(queries.get_all_prompt_history(limit=2, search="sales")) == 2
+
     def test_count_all_workspaces(self, workspace_id):
         from db import queries
         assert queries.count_all_workspaces() >= 1
@@ -235,6 +268,36 @@ class TestAdminQueries:
         assert queries.get_total_revenue_cents() == 0
 
 
+# =========================================================================
+# Test: Admin Credit Adjustment
+# =========================================================================
+
+class TestAdminCreditAdjustment:
+    @pytest.mark.parametrize("amount", [25, -10])
+    def test_balance_read_under_write_lock(self, monkeypatch, fresh_db, user_id, workspace_id, amount):
+        from db import queries
+        from services import admin_service, credit_service
+        other = sqlite3.connect(str(fresh_db), timeout=0, isolation_level=None)
+        locked = []
+        real_get_balance = credit_service.get_balance
+
+        def probing_get_balance(ws):
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.execute("ROLLBACK")
+                locked.append(False)
+            except sqlite3.OperationalError:
+                locked.append(True)
+            return real_get_balance(ws)
+
+        monkeypatch.setattr(credit_service, "get_balance", probing_get_balance)
+        before = real_get_balance(workspace_id)
+        new_balance = admin_service.adjust_workspace_credits(workspace_id, user_id, amount, "test")
+        other.close()
+        assert locked == [True]
+        assert new_balance == max(0, before + amount) == queries.get_credit_balance(workspace_id)
+
+
 # =========================================================================
 # Test: Audit Log
 # =========================================================================
@@ -266,6 +329,11 @@ class TestAuditLog:
         entries = queries.get_audit_log()
         assert entries[0].details == {"tier": "pro"}
 
+    def test_audit_log_list_details_json(self, user_id):
+        from db import queries
+        queries.create_audit_log(user_id, "bulk", "user", details=["a", "b"])
+        assert queries.get_audit_log()[0].details == ["a", "b"]
+
 
 # =========================================================================
 # Test: System Settings
@@ -294,3 +362,24 @@ class TestSystemSettings:
         settings = queries.get_all_system_settings()
         assert settings["a"] == "1"
         assert settings["b"] == "2"
+
+    def test_set_many_settings(self, user_id):
+        from db import queries
+        queries.set_system_setting("a", "old", user_id)
+        assert queries.get_system_setting("a") == "old"
+        queries.set_system_settings({"a": "1", "b": "2"}, user_id)
+        assert queries.get_system_setting("a") == "1"
+        assert queries.get_all_system_settings() == {"a": "1", "b": "2"}
+
+    def test_settings_cached_until_written(self, user_id):
+        from db import queries
+        from db.database import get_db
+        queries.set_system_setting("cached", "old", user_id)
+        assert queries.get_system_setting("cached") == "old"
+        assert queries.get_all_system_settings()["cached"] == "old"
+        with get_db() as conn:
+            conn.execute("UPDATE system_settings SET value = 'raw' WHERE key = 'cached'")
+        assert queries.get_system_setting("cached") == "old"
+        queries.set_system_setting("cached", "new", user_id)
+        assert queries.get_system_setting("cached") == "new"
+        assert queries.get_all_system_settings()["cached"] == "new"
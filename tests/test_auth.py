@@ -2,7 +2,9 @@
 
 import pytest
 from db.database import init_db, get_db
-from auth.authenticator import register_user, authenticate, hash_password, verify_password
+from auth.authenticator import (
+    register_user, authenticate, hash_password, hash_password_batch, verify_password,
+)
 from db import queries
 
 
@@ -39,6 +41,12 @@ class TestPasswordHashing:
         assert verify_password("same_password", h1)
         assert verify_password("same_password", h2)
 
+    def test_hash_password_batch(self):
+        hashes = hash_password_batch(["first_pw", "second_pw"])
+        assert len(hashes) == 2
+        assert verify_password("first_pw", hashes[0])
+        assert verify_password("second_pw", hashes[1])
+
 
 # ---------------------------------------------------------------------------
 # Registration
@@ -103,6 +111,15 @@ class TestAuthentication:
         assert not success
         assert "sso" in error.lower()
 
+    def test_invalid_session_token_negative_cached(self, monkeypatch):
+        from auth import session as auth_session
+        calls = []
+        real = queries.get_session_user_id
+        monkeypatch.setattr(queries, "get_session_user_id", lambda t: calls.append(t) or real(t))
+        assert auth_session._lookup_session_user("forged-token") is None
+        assert auth_session._lookup_session_user("forged-token") is None
+        assert calls == ["forged-token"]
+
 
 # ---------------------------------------------------------------------------
 # Multi-tenancy
@@ -166,6 +183,14 @@ class TestRoles:
         assert "run_analysis" not in viewer_perms
         assert "manage_billing" not in viewer_perms
 
+    def test_has_perm_matches_role_permissions(self):
+        from config.settings import ROLE_PERMISSIONS, has_perm
+        for role, perms in ROLE_PERMISSIONS.items():
+            for perm in perms:
+                assert has_perm(role, perm)
+        assert not has_perm("viewer", "upload_data")
+        assert not has_perm("unknown", "view_dashboards")
+
     def test_member_role_assignment(self):
         _, uid1 = register_user("owner@test.com", "password123", "Owner")
         _, uid2 = register_user("member@test.com", "password123", "Member")
@@ -0,0 +1,889 @@
+"""Tests for the database connection manager and schema setup."""
+
+import threading
+
+import pytest
+from db.database import (
+    init_db, get_db, get_connection, iter_query, enqueue_write, flush_writes,
+    close_thread_connection, refresh_daily_rollups, get_read_db,
+)
+from db import queries
+
+
+@pytest.fixture(autouse=True)
+def setup_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    monkeypatch.setattr("config.settings.DB_PATH", db_path)
+    monkeypatch.setattr("db.database.DB_PATH", db_path)
+    init_db()
+    yield
+
+
+class TestConnectionPool:
+    def test_connection_reused_per_thread(self):
+        assert get_connection() is get_connection()
+        with get_db() as c1, get_db() as c2:
+            assert c1 is c2
+
+    def test_connection_reopened_when_path_changes(self, tmp_path, monkeypatch):
+        first = get_connection()
+        monkeypatch.setattr("db.database.DB_PATH", tmp_path / "other.db")
+        assert get_connection() is not first
+
+    def test_close_thread_connection_reopens_on_next_use(self):
+        first = get_connection()
+        close_thread_connection()
+        second = get_connection()
+        assert second is not first
+        assert second.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+    def test_finished_thread_hands_connection_to_next(self):
+        from db.database import get_read_connection
+        seen = []
+
+        def rerun():
+            conn = get_connection()
+            conn.execute("BEGIN")  # left open, as by a rerun that died mid-write
+            conn.execute("INSERT INTO users (id, email) VALUES ('t1', 't1@test.com')")
+            seen.append((conn, get_read_connection()))
+
+        for _ in range(2):
+            worker = threading.Thread(target=rerun)
+            worker.start()
+            worker.join()
+        assert len(seen) == 2 and seen[0] == seen[1]
+        assert seen[0][0] is not get_connection()
+
+    def test_nested_block_rolls_back_with_outer(self):
+        with pytest.raises(RuntimeError):
+            with get_db():
+                with get_db() as conn:
+                    conn.execute(
+                        "INSERT INTO users (id, email) VALUES (?, ?)", ("u1", "a@test.com")
+                    )
+                raise RuntimeError("boom")
+        assert queries.get_user_by_id("u1") is None
+
+    def test_commit_on_success(self):
+        with get_db() as conn:
+            conn.execute("INSERT INTO users (id, email) VALUES (?, ?)", ("u2", "b@test.com"))
+        assert queries.get_user_by_id("u2").email == "b@test.com"
+
+    def test_pragmas_applied(self):
+        conn = get_connection()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -65536
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 268435456
+
+    def test_iter_query_streams_in_batches(self):
+        with get_db() as conn:
+            conn.executemany(
+                "INSERT INTO users (id, email) VALUES (?, ?)",
+                [(f"s{i}", f"s{i}@test.com") for i in range(5)],
+            )
+        rows = iter_query("SELECT id FROM users WHERE id LIKE 's%' ORDER BY id", batch_size=2)
+        assert next(rows)["id"] == "s0"
+        assert [r["id"] for r in rows] == ["s1", "s2", "s3", "s4"]
+
+
+class TestDeferredWrites:
+    def test_queued_rows_committed_on_flush(self):
+        for i in range(3):
+            enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", (f"q{i}", f"q{i}@test.com"))
+        flush_writes()
+        assert queries.get_user_by_id("q2").email == "q2@test.com"
+
+    def test_bad_row_does_not_drop_batch(self):
+        enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("d1", "dup@test.com"))
+        enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("d2", "dup@test.com"))
+        enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("d3", "ok@test.com"))
+        flush_writes()
+        assert queries.get_user_by_id("d1") and queries.get_user_by_id("d3")
+        assert queries.get_user_by_id("d2") is None
+
+    def test_dropped_row_is_logged(self, caplog):
+        enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("l1", "log@test.com"))
+        enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("l2", "log@test.com"))
+        flush_writes()
+        dropped = [r for r in caplog.records if r.name == "db.database"]
+        assert len(dropped) == 1 and "'l2'" in dropped[0].getMessage()
+
+    def test_locked_batch_is_retried(self, monkeypatch):
+        import sqlite3
+        from db import database
+        monkeypatch.setattr(database, "_BUSY_BACKOFF", 0.05)
+        blocker = sqlite3.connect(str(database.DB_PATH), isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(0.1, blocker.rollback)
+        release.start()
+        conn = database._open(str(database.DB_PATH))
+        conn.execute("PRAGMA busy_timeout = 0")
+        database._apply_writes(conn, [("INSERT INTO users (id, email) VALUES (?, ?)", ("b1", "b1@test.com"))])
+        conn.close()
+        release.join()
+        blocker.close()
+        assert queries.get_user_by_id("b1").email == "b1@test.com"
+
+    def test_flush_ignores_rows_queued_after_it(self, monkeypatch):
+        from db import database
+        gates = {"w1": threading.Event(), "w2": threading.Event()}
+        real_apply = database._apply_writes
+
+        def gated_apply(conn, items):
+            for _, params in items:
+                gates[params[0]].wait(5)
+            real_apply(conn, items)
+
+        monkeypatch.setattr(database, "_apply_writes", gated_apply)
+        sql = "INSERT INTO users (id, email) VALUES (?, ?)"
+        enqueue_write(sql, ("w1", "w1@test.com"))
+        flusher = threading.Thread(target=flush_writes)
+        flusher.start()
+        flusher.join(0.1)
+        enqueue_write(sql, ("w2", "w2@test.com"))  # stuck until gates["w2"] is set
+        gates["w1"].set()
+        flusher.join(2)
+        try:
+            assert not flusher.is_alive()
+        finally:
+            gates["w2"].set()
+        flush_writes()
+        emails = get_connection().execute("SELECT email FROM users WHERE id IN ('w1', 'w2')").fetchall()
+        assert len(emails) == 2
+
+    def test_inside_transaction_joins_it(self):
+        with pytest.raises(RuntimeError):
+            with get_db():
+                enqueue_write("INSERT INTO users (id, email) VALUES (?, ?)", ("t1", "t1@test.com"))
+                raise RuntimeError("boom")
+        flush_writes()
+        assert queries.get_user_by_id("t1") is None
+
+    def test_coalesced_updates_merge_per_key(self):
+        import operator
+        from db.database import coalesce_write
+        get_connection().execute("INSERT INTO users (id, email) VALUES ('c1', 'c1@test.com')")
+        sql = "UPDATE users SET display_name = display_name || ? WHERE id = ?"
+        for part in ("a", "b", "c"):
+            coalesce_write(sql, "c1", part, operator.add)
+        name = "SELECT display_name FROM users WHERE id = 'c1'"
+        assert get_connection().execute(name).fetchone()[0] == ""
+        flush_writes()
+        assert get_connection().execute(name).fetchone()[0] == "abc"
+
+    def test_prompt_history_visible_to_reader(self):
+        uid = queries.create_user("ph@test.com", "pw", "PH")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        hid = queries.save_prompt_history(uid, ws, pid, "plot it")
+        assert [h.id for h in queries.get_prompt_history(ws, pid)] == [hid]
+
+    def test_prompt_history_keyset_pages(self):
+        uid = queries.create_user("phk@test.com", "pw", "PHK")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        for i in range(5):
+            queries.save_prompt_history(uid, ws, pid, f"prompt {i}")
+        seen, last = [], None
+        while page := queries.get_prompt_history(
+                ws, pid, limit=2, after_created_at=last and last.created_at, after_id=last and last.id):
+            seen += [h.id for h in page]
+            last = page[-1]
+        assert seen == [h.id for h in queries.get_prompt_history(ws, pid)] and len(set(seen)) == 5
+
+
+class TestInitDb:
+    def test_stamps_schema_version(self):
+        from db.database import SCHEMA_VERSION
+        assert get_connection().execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+    def test_repeat_init_is_noop(self):
+        conn = get_connection()
+        conn.execute("DROP TABLE user_preferences")
+        init_db()
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        assert "user_preferences" not in tables
+
+
+class TestFileProfiles:
+    @pytest.fixture
+    def file_id(self):
+        uid = queries.create_user("files@test.com", "pw", "Files")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        return queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+
+    def test_profile_stored_out_of_line(self, file_id):
+        queries.update_file_profile(file_id, 3, 2, ["a", "b"], {"rows": 3})
+        f = queries.get_file_by_id(file_id)
+        assert f.data_profile == {"rows": 3}
+        assert f.column_names == ["a", "b"]
+        listed = queries.get_files_for_project(f.project_id)
+        assert listed[0].id == file_id and listed[0].data_profile is None
+
+    def test_status_set_with_insert_and_profile(self):
+        uid = queries.create_user("st@test.com", "pw", "St")
+        pid = queries.create_project(queries.create_workspace("WS", uid), uid, "P")
+        fid = queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10,
+                                           status="pending")
+        assert queries.get_file_by_id(fid).status == "pending"
+        queries.update_file_profile(fid, 3, 2, ["a", "b"], {"rows": 3}, status="success")
+        assert queries.get_file_by_id(fid).status == "success"
+        queries.update_file_profile(fid, 4, 2, ["a", "b"], {"rows": 4})
+        assert queries.get_file_by_id(fid).status == "success"
+
+    def test_migration_moves_inline_profiles(self, file_id):
+        conn = get_connection()
+        conn.execute("UPDATE uploaded_files SET data_profile = ? WHERE id = ?", ('{"old": 1}', file_id))
+        conn.execute("PRAGMA user_version = 0")
+        init_db()
+        assert queries.get_file_by_id(file_id).data_profile == {"old": 1}
+        assert conn.execute("SELECT data_profile FROM uploaded_files").fetchone()[0] is None
+
+
+class TestRowToModel:
+    def test_extra_columns_ignored_and_defaults_kept(self):
+        from db.models import SystemSetting, row_to_model, rows_to_models
+        rows = get_connection().execute(
+            "SELECT 'extra' AS not_a_field, 'theme' AS key, 'dark' AS value"
+        ).fetchall()
+        s = row_to_model(rows[0], SystemSetting)
+        assert (s.key, s.value, s.updated_by, s.updated_at) == ("theme", "dark", None, "")
+        assert rows_to_models(rows, SystemSetting) == [s]
+        assert rows_to_models([], SystemSetting) == []
+        cursor = get_connection().execute("SELECT 'a' AS key, 'b' AS value UNION ALL SELECT 'c', 'd'")
+        assert [m.key for m in rows_to_models(cursor, SystemSetting)] == ["a", "c"]
+
+    def test_json_columns_decoded_lazily(self):
+        from db.models import ApiKey
+        key = ApiKey("k", "w", "u", "h", "ip_", "n", '{"read": true}', None, "", None)
+        assert "permissions" not in key.__dict__
+        assert key.permissions == {"read": True}
+        assert key.permissions is key.permissions
+
+    def test_explicit_column_lists_match_select_star(self):
+        from db.models import ApiKey, row_to_model
+        uid = queries.create_user("cols@test.com", "pw", "Cols")
+        ws = queries.create_workspace("WS", uid)
+        kid = queries.create_api_key(ws, uid, "hash", "ip_abc", "k", {"read": True})
+        star = get_connection().execute("SELECT * FROM api_keys WHERE id = ?", (kid,)).fetchone()
+        assert queries.get_api_key_by_id(kid) == row_to_model(star, ApiKey)
+
+    def test_bool_columns_hydrated_as_bool(self):
+        uid = queries.create_user("flags@test.com", "pw", "Flags")
+        user = queries.get_user_by_id(uid)
+        assert user.totp_enabled is False and user.is_superadmin is False
+
+
+class TestBulkQueries:
+    def test_children_grouped_by_parent(self):
+        uid = queries.create_user("bulk@test.com", "pw", "Bulk")
+        ws = queries.create_workspace("WS", uid)
+        p1 = queries.create_project(ws, uid, "P1")
+        p2 = queries.create_project(ws, uid, "P2")
+        d1 = queries.create_dashboard(p1, uid, "D1")
+        fid = queries.create_uploaded_file(p1, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+        queries.create_chart(d1, fid, "C1", "prompt", "code", uid, position_index=0)
+        queries.create_chart(d1, fid, "C2", "prompt", "code", uid, position_index=1)
+
+        dashboards = queries.get_dashboards_for_projects([p1, p2])
+        assert [d.id for d in dashboards[p1]] == [d1] and dashboards[p2] == []
+        files = queries.get_files_for_projects([p1, p2])
+        assert [f.id for f in files[p1]] == [fid] and files[p2] == []
+        assert [c.title for c in queries.get_charts_for_dashboards([d1])[d1]] == ["C1", "C2"]
+        assert queries.count_charts_for_dashboards([d1, "missing"]) == {d1: 2, "missing": 0}
+        assert queries.get_dashboards_for_projects([]) == {}
+
+    def test_iter_charts_for_dashboard_is_lazy(self):
+        uid = queries.create_user("lazy@test.com", "pw", "Lazy")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        did = queries.create_dashboard(pid, uid, "D")
+        fid = queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+        for i in range(3):
+            queries.create_chart(did, fid, f"C{i}", "prompt", "code", uid, position_index=i)
+        charts = queries.iter_charts_for_dashboard(did)
+        assert next(charts).title == "C0"
+        assert [c.title for c in charts] == ["C1", "C2"]
+        assert list(queries.iter_charts_for_dashboard("missing")) == []
+
+    def test_reorder_charts_single_statement(self):
+        uid = queries.create_user("order@test.com", "pw", "Order")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        did = queries.create_dashboard(pid, uid, "D")
+        other = queries.create_dashboard(pid, uid, "Other")
+        fid = queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+        ids = [queries.create_chart(did, fid, f"C{i}", "prompt", "code", uid, position_index=i)
+               for i in range(3)]
+        foreign = queries.create_chart(other, fid, "X", "prompt", "code", uid, position_index=5)
+        assert queries.reorder_charts(did, [ids[2], ids[0], ids[1], foreign])
+        assert [c.title for c in queries.get_charts_for_dashboard(did)] == ["C2", "C0", "C1"]
+        assert queries.get_charts_for_dashboard(other)[0].position_index == 5
+
+    def test_chart_meta_skips_large_columns(self):
+        uid = queries.create_user("meta@test.com", "pw", "Meta")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        did = queries.create_dashboard(pid, uid, "D")
+        fid = queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+        cid = queries.create_chart(did, fid, "C", "prompt", "code", uid, plotly_json="{}")
+        meta = queries.get_chart_meta(cid)
+        assert (meta.title, meta.generated_code, meta.plotly_json) == ("C", "", None)
+        full = queries.get_chart_by_id(cid)
+        assert (full.generated_code, full.plotly_json) == ("code", "{}")
+        assert queries.get_chart_meta("missing") is None
+
+
+class TestLookupCache:
+    def test_user_and_workspace_cached_until_written(self):
+        uid = queries.create_user("cache@test.com", "pw", "Cache")
+        ws = queries.create_workspace("WS", uid)
+        assert queries.get_user_by_id(uid).display_name == "Cache"
+        assert queries.get_workspace_by_id(ws).name == "WS"
+        with get_db() as conn:
+            conn.execute("UPDATE users SET display_name = 'raw'")
+            conn.execute("UPDATE workspaces SET name = 'raw'")
+        assert queries.get_user_by_id(uid).display_name == "Cache"
+        assert queries.get_workspace_by_id(ws).name == "WS"
+
+        queries.update_user(uid, display_name="New")
+        queries.update_workspace(ws, description="d")
+        assert queries.get_user_by_id(uid).display_name == "New"
+        assert queries.get_workspace_by_id(ws).name == "raw"
+        queries.delete_workspace(ws)
+        assert queries.get_workspace_by_id(ws) is None
+
+    def test_roles_and_superadmin_never_cached(self):
+        uid = queries.create_user("auth@test.com", "pw", "Auth")
+        ws = queries.create_workspace("WS", uid)
+        assert queries.get_member_role(ws, uid) == "owner"
+        assert queries.is_superadmin(uid) is False
+        with get_db() as conn:
+            conn.execute("UPDATE workspace_members SET role = 'viewer'")
+            conn.execute("UPDATE users SET is_superadmin = 1")
+        assert queries.get_member_role(ws, uid) == "viewer"
+        assert queries.is_superadmin(uid) is True
+
+    def test_rolled_back_write_never_cached(self):
+        uid = queries.create_user("rb@test.com", "pw", "Rb")
+        ws = queries.create_workspace("WS", uid)
+        assert queries.get_workspace_by_id(ws).tier == "free"
+        with pytest.raises(RuntimeError):
+            with get_db():
+                queries.update_workspace(ws, tier="enterprise")
+                assert queries.get_workspace_by_id(ws).tier == "enterprise"
+                raise RuntimeError("boom")
+        assert queries.get_workspace_by_id(ws).tier == "free"
+
+    def test_invalidation_waits_for_commit(self):
+        uid = queries.create_user("wait@test.com", "pw", "Wait")
+        ws = queries.create_workspace("WS", uid)
+        assert queries.get_workspace_by_id(ws).tier == "free"
+        with get_db():
+            queries.update_workspace(ws, tier="pro")
+            # Another thread reads the committed row and re-caches it
+            reader = threading.Thread(target=queries.get_workspace_by_id, args=(ws,))
+            reader.start()
+            reader.join()
+        assert queries.get_workspace_by_id(ws).tier == "pro"
+
+    def test_returns_copies(self):
+        uid = queries.create_user("copy@test.com", "pw", "Copy")
+        queries.get_user_by_id(uid).display_name = "mutated"
+        assert queries.get_user_by_id(uid).display_name == "Copy"
+
+
+class TestBulkLookups:
+    def test_users_and_workspaces_by_ids(self):
+        uid = queries.create_user("bulkid@test.com", "pw", "Bulk")
+        ws = queries.create_workspace("WS", uid)
+        users = queries.get_users_by_ids([uid, uid, "missing"])
+        assert list(users) == [uid] and users[uid].email == "bulkid@test.com"
+        assert queries.get_workspaces_by_ids(iter([ws]))[ws].name == "WS"
+        assert queries.get_users_by_ids([]) == {}
+
+
+class TestImmediateTransaction:
+    def test_takes_write_lock_at_begin(self):
+        import sqlite3
+        from db import database
+        other = sqlite3.connect(str(database.DB_PATH), timeout=0, isolation_level=None)
+        with get_db(immediate=True):
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                other.execute("BEGIN IMMEDIATE")
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("ROLLBACK")
+        other.close()
+
+
+class TestReadConnection:
+    def test_read_only_and_separate_from_writer(self):
+        import sqlite3
+        with get_read_db() as conn:
+            assert conn is not get_connection()
+            assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM users")
+
+    def test_sees_committed_writes_and_joins_open_transaction(self):
+        queries.create_user("ro@test.com", "pw", "RO")
+        with get_read_db() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        with get_db() as writer:
+            queries.create_user("ro2@test.com", "pw", "RO2")
+            with get_read_db() as conn:
+                assert conn is writer
+                assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+
+
+class TestUpdateRow:
+    def test_column_order_shares_statement_and_sql_now(self):
+        uid = queries.create_user("upd@test.com", "pw", "Upd")
+        queries._update_sql.cache_clear()
+        queries.update_user(uid, first_name="A", last_name="B")
+        queries.update_user(uid, last_name="D", first_name="C")
+        assert queries._update_sql.cache_info().currsize == 1
+        user = queries.get_user_by_id(uid)
+        assert (user.first_name, user.last_name) == ("C", "D")
+
+        ws = queries.create_workspace("WS", uid)
+        queries.update_workspace(ws, trial_ends_at=queries.SQL_NOW)
+        assert queries.get_workspace_by_id(ws).trial_ends_at
+
+    def test_unknown_column_rejected(self):
+        uid = queries.create_user("bad@test.com", "pw", "Bad")
+        with pytest.raises(ValueError, match="bogus"):
+            queries.update_user(uid, first_name="A", bogus=1)
+        with pytest.raises(ValueError, match="id"):
+            queries.update_user(uid, id="other")
+        assert queries.get_user_by_id(uid).first_name == ""
+
+    def test_upsert_column_order_shares_statement(self):
+        u1 = queries.create_user("p1@test.com", "pw", "P1")
+        u2 = queries.create_user("p2@test.com", "pw", "P2")
+        queries._upsert_sql.cache_clear()
+        pref_id = queries.upsert_user_preferences(u1, theme="dark", notification_email=0)
+        queries.upsert_user_preferences(u2, notification_email=1, theme="light")
+        assert queries._upsert_sql.cache_info().currsize == 1
+        assert queries.get_user_preferences(u1).theme == "dark"
+
+        assert queries.upsert_user_preferences(u1, theme="light") == pref_id
+        prefs = queries.get_user_preferences(u1)
+        assert (prefs.theme, prefs.notification_email) == ("light", 0)
+        with pytest.raises(ValueError):
+            queries.upsert_user_preferences(u1, bogus=1)
+
+
+class TestUpsertBranding:
+    def test_insert_then_update_keeps_id(self):
+        uid = queries.create_user("brand@test.com", "pw", "Brand")
+        ws = queries.create_workspace("WS", uid)
+        bid = queries.upsert_branding(ws)
+        assert queries.upsert_branding(ws, primary_color="#000000",
+                                       chart_color_palette=["#111111"]) == bid
+        branding = queries.get_branding(ws)
+        assert branding.primary_color == "#000000"
+        assert branding.chart_color_palette == ["#111111"]
+        assert queries.upsert_branding(ws) == bid
+
+
+class TestUsageSummary:
+    def test_matches_single_metric_queries(self):
+        uid = queries.create_user("usage@test.com", "pw", "Usage")
+        ws = queries.create_workspace("WS", uid)
+        p1 = queries.create_project(ws, uid, "P1")
+        p2 = queries.create_project(ws, uid, "P2")
+        queries.add_credit_entry(ws, uid, 100, 100, "grant")
+        queries.add_credit_entry(ws, uid, -7, 93, "analysis")
+        queries.save_prompt_history(uid, ws, p1, "a", tokens_used=10)
+        queries.save_prompt_history(uid, ws, p2, "b", tokens_used=30)
+        queries.create_dashboard(p1, uid, "D")
+        queries.create_uploaded_file(p1, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 10)
+        flush_writes()
+
+        today = get_connection().execute("SELECT date('now')").fetchone()[0]
+        for project_id in (None, p1):
+            s = queries.get_usage_summary(ws, today, today, project_id, uid)
+            assert s.credits_used == queries.get_credits_used_in_range(ws, today, today, uid) == 7
+            assert s.analyses_run == queries.get_analyses_count_in_range(ws, today, today, project_id, uid)
+            assert s.dashboards_created == queries.get_dashboards_created_in_range(ws, today, today, project_id, uid)
+            assert s.files_uploaded == len(queries.get_uploads_in_range(ws, today, today, project_id, uid))
+            assert s.credit_usage_by_day == queries.get_credit_usage_by_day(ws, today, today, uid)
+            assert s.analyses_by_day == queries.get_analyses_by_day(ws, today, today, project_id, uid)
+            assert s.token_usage_by_project == queries.get_token_usage_by_project(ws, today, today, uid)
+        assert queries.get_usage_summary(ws, today, today, p1).analyses_run == 1
+
+    def test_readers_see_queued_prompt_history(self):
+        uid = queries.create_user("barrier@test.com", "pw", "Barrier")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        today = get_connection().execute("SELECT date('now')").fetchone()[0]
+        queries.save_prompt_history(uid, ws, pid, "just ran", tokens_used=5)
+        assert queries.get_usage_summary(ws, today, today).analyses_run == 1
+        queries.save_prompt_history(uid, ws, pid, "again", tokens_used=5)
+        assert queries.get_analyses_count_in_range(ws, today, today) == 2
+        queries.save_prompt_history(uid, ws, pid, "third", tokens_used=5)
+        assert len(queries.get_recent_activity(ws, today, today)) == 3
+
+    def test_empty_range(self):
+        uid = queries.create_user("empty@test.com", "pw", "Empty")
+        ws = queries.create_workspace("WS", uid)
+        s = queries.get_usage_summary(ws, "2000-01-01", "2000-01-31")
+        assert (s.credits_used, s.analyses_run, s.credit_usage_by_day) == (0, 0, [])
+
+
+class TestDailyRollups:
+    def test_rollups_match_live_aggregation(self):
+        uid = queries.create_user("roll@test.com", "pw", "Roll")
+        ws = queries.create_workspace("WS", uid)
+        p1 = queries.create_project(ws, uid, "P1")
+        p2 = queries.create_project(ws, uid, "P2")
+        for project_id, tokens in ((p1, 10), (p1, 5), (p2, 30)):
+            queries.save_prompt_history(uid, ws, project_id, "q", tokens_used=tokens)
+        for project_id, fmt in ((p1, "csv"), (p1, "csv"), (p2, "xlsx")):
+            queries.create_uploaded_file(project_id, uid, "f", "f", "/tmp/f", fmt, 1)
+        flush_writes()
+        with get_db() as conn:
+            conn.execute("UPDATE prompt_history SET created_at = datetime('now', '-3 days')")
+            conn.execute("UPDATE uploaded_files SET uploaded_at = datetime('now', '-3 days')")
+        queries.save_prompt_history(uid, ws, p2, "today", tokens_used=1)
+        queries.create_uploaded_file(p2, uid, "g", "g", "/tmp/g", "csv", 1)
+        flush_writes()
+
+        start, end = get_connection().execute(
+            "SELECT date('now', '-7 days'), date('now')").fetchone()
+        calls = [
+            lambda: queries.get_token_usage_by_project(ws, start, end),
+            lambda: queries.get_token_usage_by_project(ws, start, end, uid),
+            lambda: queries.get_file_format_distribution(ws, start, end),
+            lambda: queries.get_file_format_distribution(ws, start, end, p1),
+        ]
+        live = [call() for call in calls]
+        refresh_daily_rollups()
+        assert get_connection().execute("SELECT COUNT(*) FROM daily_project_tokens").fetchone()[0] == 2
+        assert [call() for call in calls] == live
+        assert live[0][0]["total_tokens"] == 31 and live[0][0]["analysis_count"] == 2
+        assert {r["file_format"]: r["count"] for r in live[2]} == {"csv": 3, "xlsx": 1}
+
+    def test_delete_after_rollup_is_subtracted(self):
+        uid = queries.create_user("rolldel@test.com", "pw", "RollDel")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        fids = [queries.create_uploaded_file(pid, uid, "f", "f", "/tmp/f", "csv", 1) for _ in range(2)]
+        queries.save_prompt_history(uid, ws, pid, "q", tokens_used=7)
+        queries.save_prompt_history(uid, ws, pid, "q", tokens_used=3)
+        flush_writes()
+        with get_db() as conn:
+            conn.execute("UPDATE prompt_history SET created_at = datetime('now', '-2 days')")
+            conn.execute("UPDATE uploaded_files SET uploaded_at = datetime('now', '-2 days')")
+        refresh_daily_rollups()
+
+        queries.delete_file(fids[0])
+        with get_db() as conn:
+            conn.execute("DELETE FROM prompt_history WHERE tokens_used = 7")
+        start, end = get_connection().execute(
+            "SELECT date('now', '-7 days'), date('now')").fetchone()
+        assert queries.get_file_format_distribution(ws, start, end)[0]["count"] == 1
+        tokens = queries.get_token_usage_by_project(ws, start, end)[0]
+        assert (tokens["total_tokens"], tokens["analysis_count"]) == (3, 1)
+
+        queries.delete_file(fids[1])
+        assert queries.get_file_format_distribution(ws, start, end) == []
+        assert get_connection().execute("SELECT COUNT(*) FROM daily_file_formats").fetchone()[0] == 0
+
+    def test_catch_up_in_bounded_ranges(self, monkeypatch):
+        from db import database
+        monkeypatch.setattr(database, "_ROLLUP_BATCH_DAYS", 2)
+        uid = queries.create_user("rollrange@test.com", "pw", "RollRange")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        for days in (1, 4, 9):
+            queries.save_prompt_history(uid, ws, pid, str(days), tokens_used=days)
+        flush_writes()
+        with get_db() as conn:
+            conn.execute("UPDATE prompt_history SET created_at = datetime('now', '-' || prompt_text || ' days')")
+        start, end = get_connection().execute(
+            "SELECT date('now', '-30 days'), date('now')").fetchone()
+        live = queries.get_token_usage_by_project(ws, start, end)
+
+        commits = []
+        real_get_db = database.get_db
+        monkeypatch.setattr(database, "get_db", lambda **kw: commits.append(kw) or real_get_db(**kw))
+        refresh_daily_rollups()
+        assert len(commits) == 1 + 5
+        assert get_connection().execute("SELECT COUNT(*) FROM daily_project_tokens").fetchone()[0] == 3
+        assert queries.get_token_usage_by_project(ws, start, end) == live
+
+    def test_refresh_is_idempotent(self):
+        refresh_daily_rollups()
+        refresh_daily_rollups()
+        through = get_connection().execute(
+            "SELECT through_day FROM rollup_state WHERE name = 'daily'").fetchone()[0]
+        assert through == get_connection().execute("SELECT date('now', '-1 day')").fetchone()[0]
+
+
+class TestProjectActivitySummary:
+    def test_counts_and_last_activity(self):
+        uid = queries.create_user("act@test.com", "pw", "Act")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        empty = queries.get_project_activity_summary(pid)
+        assert empty["files_total"] == empty["analyses_count"] == 0
+        assert empty["last_activity"] is None
+
+        fid = queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 1)
+        queries.update_file_status(fid, "error", "bad")
+        queries.create_dashboard(pid, uid, "D")
+        queries.save_prompt_history(uid, ws, pid, "q")
+        with get_db() as conn:
+            conn.execute("UPDATE dashboards SET created_at = '2999-01-01 00:00:00'")
+        summary = queries.get_project_activity_summary(pid)
+        assert (summary["files_total"], summary["files_error"], summary["files_success"]) == (1, 1, 0)
+        assert (summary["dashboards_count"], summary["analyses_count"]) == (1, 1)
+        assert summary["last_activity"] == "2999-01-01 00:00:00"
+
+    def test_counters_match_rebuild(self):
+        from db.database import rebuild_counters
+        uid = queries.create_user("cnt2@test.com", "pw", "Cnt")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        files = [queries.create_uploaded_file(pid, uid, f"{i}.csv", f"{i}.csv", "/tmp/x", "csv", 1)
+                 for i in range(3)]
+        queries.update_file_status(files[0], "pending")
+        queries.update_file_status(files[1], "error", "bad")
+        get_connection().execute("DELETE FROM uploaded_files WHERE id = ?", (files[2],))
+        did = queries.create_dashboard(pid, uid, "D")
+        queries.delete_dashboard(did)
+        queries.save_prompt_history(uid, ws, pid, "q")
+        flush_writes()
+        # The newest child is deleted, and another one's timestamp moved back
+        newest = queries.create_dashboard(pid, uid, "Newest")
+        with get_db() as conn:
+            conn.execute("UPDATE dashboards SET created_at = '2999-01-01 00:00:00' WHERE id = ?", (newest,))
+            conn.execute("UPDATE uploaded_files SET uploaded_at = '2998-01-01 00:00:00' WHERE id = ?", (files[0],))
+        queries.delete_dashboard(newest)
+        assert queries.get_project_activity_summary(pid)["last_activity"] == "2998-01-01 00:00:00"
+        with get_db() as conn:
+            conn.execute("UPDATE uploaded_files SET uploaded_at = '2000-01-01 00:00:00' WHERE id = ?", (files[0],))
+        live = queries.get_project_activity_summary(pid)
+        assert (live["files_total"], live["files_pending"], live["files_error"]) == (2, 1, 1)
+        assert (live["dashboards_count"], live["analyses_count"]) == (0, 1)
+        assert live["last_activity"] < "2998"
+
+        rebuild_counters()
+        assert queries.get_project_activity_summary(pid) == live
+        assert queries.get_project_activity_summary("missing")["files_total"] == 0
+
+    def test_queries_never_dedupe_unions(self):
+        # Every UNION in db/ combines disjoint sources; plain UNION would
+        # only add a temp b-tree to dedupe rows that cannot repeat.
+        import re
+        from pathlib import Path
+        for path in Path(queries.__file__).parent.glob("*.py"):
+            assert not re.search(r"\bUNION\b(?!\s+ALL)", path.read_text()), path
+
+
+class TestAnalyticsIndexes:
+    @pytest.mark.parametrize("sql, index", [
+        ("""SELECT COALESCE(SUM(ABS(change_amount)), 0) FROM credit_ledger
+            WHERE workspace_id = ? AND change_amount < 0
+              AND created_at >= ? AND created_at < date(?, '+1 day') AND user_id = ?""",
+         "idx_cl_workspace_created"),
+        ("""SELECT date(created_at), COUNT(*) FROM prompt_history
+            WHERE workspace_id = ? AND created_at >= ? AND created_at < date(?, '+1 day')
+              AND project_id = ? AND user_id = ?
+            GROUP BY date(created_at)""",
+         "idx_ph_workspace_created"),
+    ])
+    def test_range_scans_use_covering_index(self, sql, index):
+        params = ("ws", "2026-01-01", "2026-01-31") + ("x",) * (sql.count("?") - 3)
+        plan = " ".join(r["detail"] for r in get_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        assert f"USING COVERING INDEX {index} (workspace_id=? AND created_at>? AND created_at<?)" in plan
+
+
+class TestWorkspaceOverview:
+    def test_matches_individual_counts(self):
+        uid = queries.create_user("ov@test.com", "pw", "Ov")
+        ws = queries.create_workspace("WS", uid, tier="pro")
+        other = queries.create_user("ov2@test.com", "pw", "Ov2")
+        queries.add_workspace_member(ws, other, "member")
+        pid = queries.create_project(ws, uid, "P")
+        queries.create_dashboard(pid, uid, "D1")
+        queries.create_dashboard(pid, uid, "D2")
+        queries.create_uploaded_file(pid, uid, "a.csv", "a.csv", "/tmp/a.csv", "csv", 1)
+        queries.add_credit_entry(ws, uid, 50, 50, "grant")
+
+        overview = queries.get_workspace_overview(ws, uid)
+        assert overview == {
+            "tier": "pro",
+            "members": queries.count_workspace_members(ws),
+            "projects": 1,
+            "dashboards": queries.count_dashboards_in_workspace(ws),
+            "files": 1,
+            "credits": queries.get_credit_balance(ws),
+            "uploads_today": queries.count_uploads_today(uid),
+        }
+        assert queries.get_workspace_overview(ws)["uploads_today"] == 0
+        assert queries.get_workspace_overview("missing") is None
+
+
+class TestHotPathIndexes:
+    @pytest.mark.parametrize("sql, params, index", [
+        ("SELECT * FROM uploaded_files WHERE project_id = ? ORDER BY uploaded_at DESC",
+         ("p",), "idx_files_project_uploaded"),
+        ("SELECT * FROM dashboards WHERE project_id = ? ORDER BY created_at DESC",
+         ("p",), "idx_dashboards_project_created"),
+        ("SELECT * FROM workspace_invitations WHERE workspace_id = ? AND status = 'pending' "
+         "ORDER BY created_at DESC", ("w",), "idx_wi_workspace_status"),
+        ("SELECT * FROM credit_ledger WHERE workspace_id = ? ORDER BY created_at DESC LIMIT 5",
+         ("w",), "idx_cl_workspace_created"),
+        ("SELECT * FROM prompt_history WHERE workspace_id = ? AND project_id = ? "
+         "AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT 5",
+         ("w", "p", "2026-01-01", "x"), "idx_ph_project_created_id"),
+        ("SELECT COUNT(*) FROM uploaded_files WHERE uploaded_by = ? "
+         "AND uploaded_at >= date('now') AND uploaded_at < date('now', '+1 day')",
+         ("u",), "idx_files_uploader_uploaded"),
+        ("SELECT * FROM api_keys WHERE key_prefix = ? AND revoked_at IS NULL",
+         ("ip_abc",), "idx_ak_prefix_active"),
+        ("SELECT * FROM audit_log ORDER BY created_at DESC, id DESC LIMIT 30",
+         (), "idx_audit_created_id"),
+    ])
+    def test_filter_and_order_served_by_index(self, sql, params, index):
+        plan = " ".join(r["detail"] for r in get_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        assert index in plan and "TEMP B-TREE" not in plan
+
+
+class TestWorkspaceBalances:
+    def test_balance_tracks_latest_entry(self):
+        uid = queries.create_user("bal@test.com", "pw", "Bal")
+        ws = queries.create_workspace("WS", uid)
+        assert queries.get_credit_balance(ws) == 0
+        queries.add_credit_entry(ws, uid, 100, 100, "grant")
+        queries.add_credit_entry(ws, uid, -30, 70, "analysis")
+        assert queries.get_credit_balance(ws) == 70
+
+    def test_iter_credit_history_streams_whole_ledger(self):
+        uid = queries.create_user("hist@test.com", "pw", "Hist")
+        ws = queries.create_workspace("WS", uid)
+        for i in range(5):
+            queries.add_credit_entry(ws, uid, 1, i + 1, f"grant {i}")
+        entries = queries.iter_credit_history(ws, batch_size=2)
+        assert next(entries).workspace_id == ws
+        assert len(list(entries)) == 4
+        assert list(queries.iter_credit_history("missing")) == []
+
+    def test_migration_backfills_from_ledger(self):
+        uid = queries.create_user("bf@test.com", "pw", "Bf")
+        ws = queries.create_workspace("WS", uid)
+        queries.add_credit_entry(ws, uid, 100, 100, "grant")
+        conn = get_connection()
+        conn.execute("DELETE FROM workspace_balances")
+        conn.execute("PRAGMA user_version = 0")
+        init_db()
+        assert queries.get_credit_balance(ws) == 100
+
+    @pytest.mark.parametrize("table, index", [
+        ("credit_ledger", "idx_cl_workspace_created"),
+        ("prompt_history", "idx_ph_workspace_created"),
+    ])
+    def test_recent_activity_branch_reads_index_in_order(self, table, index):
+        sql = f"""SELECT * FROM {table}
+                  WHERE workspace_id = ? AND created_at >= ? AND created_at < date(?, '+1 day')
+                  ORDER BY created_at DESC LIMIT ?"""
+        plan = " ".join(r["detail"] for r in get_connection().execute(
+            f"EXPLAIN QUERY PLAN {sql}", ("ws", "2026-01-01", "2026-01-31", 50)))
+        assert f"USING INDEX {index}" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_recent_activity_merges_both_sources(self):
+        uid = queries.create_user("act@test.com", "pw", "Act")
+        ws = queries.create_workspace("WS", uid)
+        pid = queries.create_project(ws, uid, "P")
+        for i in range(3):
+            queries.add_credit_entry(ws, uid, -1, 10 - i, f"spend {i}")
+            queries.save_prompt_history(uid, ws, pid, f"prompt {i}")
+        flush_writes()
+        today = get_connection().execute("SELECT date('now')").fetchone()[0]
+        feed = queries.get_recent_activity(ws, today, today, limit=4)
+        assert len(feed) == 4
+        assert {a["activity_type"] for a in feed} == {"credit", "analysis"}
+        assert len(queries.get_recent_activity(ws, today, today, project_id=pid, limit=50)) == 6
+
+
+class TestGlobalCounters:
+    def test_counters_follow_inserts_and_cascades(self):
+        from db.database import rebuild_counters
+        uid = queries.create_user("cnt@test.com", "pw", "Cnt")
+        ws = queries.create_workspace("WS", uid)
+        queries.add_credit_entry(ws, uid, 100, 100, "grant")
+        queries.add_credit_entry(ws, uid, -15, 85, "analysis")
+        queries.create_credit_purchase(ws, uid, 100, 999)
+        assert (queries.count_all_users(), queries.count_all_workspaces()) == (1, 1)
+        assert queries.get_total_credits_consumed() == 15
+        assert queries.get_total_revenue_cents() == 999
+        assert queries.get_global_counters() == {
+            "users": 1, "workspaces": 1, "api_calls": 0, "credits_consumed": 15, "revenue_cents": 999,
+        }
+
+        get_connection().execute("DELETE FROM workspaces WHERE id = ?", (ws,))
+        assert queries.count_all_workspaces() == 0
+        assert queries.get_total_credits_consumed() == 0
+        assert queries.get_total_revenue_cents() == 0
+
+        get_connection().execute("UPDATE global_counters SET value = 42")
+        rebuild_counters()
+        assert queries.count_all_users() == 1 and queries.get_total_api_calls() == 0
+
+
+class TestPartialIndexes:
+    @pytest.mark.parametrize("sql, params, index", [
+        ("SELECT * FROM subscriptions WHERE workspace_id = ? AND status = 'active' "
+         "ORDER BY created_at DESC LIMIT 1", ("ws",), "idx_subs_active"),
+        ("SELECT * FROM add_ons WHERE workspace_id = ? AND add_on_type = ? AND status = 'active'",
+         ("ws", "extra"), "idx_addons_active"),
+    ])
+    def test_active_lookups_use_partial_index(self, sql, params, index):
+        plan = " ".join(r["detail"] for r in get_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        assert f"USING INDEX {index}" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+class TestInsertReturning:
+    def test_returning_matches_follow_up_select(self):
+        uid = queries.create_user("ret@test.com", "pw", "Ret")
+        ws = queries.create_workspace("WS", uid)
+        project = queries.create_project_returning(ws, uid, "P", instructions="be brief")
+        assert project == queries.get_project_by_id(project.id, ws)
+        dashboard = queries.create_dashboard_returning(project.id, uid, "D")
+        assert dashboard == queries.get_dashboard_by_id(dashboard.id)
+        template = queries.create_prompt_template_returning(project.id, uid, "T", "prompt")
+        assert template == queries.get_prompt_template_by_id(template.id)
+        assert template.usage_count == 0 and template.created_at
+
+
+class TestVerificationCodes:
+    def test_limited_create_stops_at_max_recent(self):
+        uid = queries.create_user("code@test.com", "pw", "Code")
+        ids = [queries.create_verification_code_limited(uid, f"{i:06d}", "2fa", "2999-01-01", 2)
+               for i in range(3)]
+        assert ids[0] and ids[1] and ids[2] is None
+        assert queries.count_recent_verification_codes(uid, "2fa") == 2
+        assert queries.create_verification_code_limited(uid, "000000", "reset", "2999-01-01", 2)
+
+
+class TestNewId:
+    def test_ids_unique_and_hex_across_refills(self):
+        ids = [queries._new_id() for _ in range(queries._ID_BATCH * 2 + 5)]
+        assert len(set(ids)) == len(ids)
+        assert all(len(i) == 32 and int(i, 16) >= 0 for i in ids)
+
+    def test_ordered_ids_sort_by_creation_time(self):
+        import time
+        first = queries._new_ordered_id()
+        time.sleep(0.002)
+        second = queries._new_ordered_id()
+        assert len(first) == 32 and first < second